@@ -107,84 +107,34 @@ History:<br>
 """
 
 # from Blender import *
-from xml.dom import minidom
 import bpy
-from mathutils import Vector, Matrix
-import math
+from mathutils import Matrix
+import fnmatch
 import os
 import subprocess
 import shutil
 
+import numpy
+
+from . import animcache
+from . import animworker
+from . import dedupe
+from . import keyreduce
+from .precision import Precision
+from .xmlwriter import XmlWriter
+from .metrics import create as createMetrics
+
 SHOW_EXPORT_DUMPS = False
 SHOW_EXPORT_TRACE = False
 SHOW_EXPORT_TRACE_VX = False
 
+# bone weights below this are dropped before renormalizing
+MIN_BONE_WEIGHT = 0.01
+
 # default blender version of script
 blender_version = 259
 
 
-def hash_combine(x, y):
-    return x ^ y + 0x9e3779b9 + (x << 6) + (x >> 2)
-
-
-class VertexInfo(object):
-    def __init__(self, px, py, pz,
-                 nx, ny, nz,
-                 u, v,
-                 r, g, b, a,
-                 boneWeights,
-                 original,
-                 tangent,
-                 binormal):
-        self.px = px
-        self.py = py
-        self.pz = pz
-        self.nx = nx
-        self.ny = ny
-        self.nz = nz
-        self.u = u
-        self.v = v
-        self.r = r
-        self.g = g
-        self.b = b
-        self.a = a
-        self.tangent = tangent
-        self.binormal = binormal
-        self.boneWeights = boneWeights
-        self.original = original
-
-    '''does not compare ogre_vidx (and position at the moment)
-      [ no need to compare position ]'''
-    def __eq__(self, o):
-        if self.nx != o.nx or self.ny != o.ny or self.nz != o.nz:
-            return False
-        elif self.px != o.px or self.py != o.py or self.pz != o.pz:
-            return False
-        elif self.u != o.u or self.v != o.v:
-            return False
-        elif self.r != o.r or self.g != o.g or self.b != o.b:
-            return False
-        elif self.tangent and self.tangent[3] != o.tangent[3]:
-            return False
-        return True
-
-    def __hash__(self):
-        result = hash(self.px)
-        result = hash_combine(result, hash(self.py))
-        result = hash_combine(result, hash(self.pz))
-        result = hash_combine(result, hash(self.nx))
-        result = hash_combine(result, hash(self.ny))
-        result = hash_combine(result, hash(self.nz))
-        result = hash_combine(result, hash(self.u))
-        result = hash_combine(result, hash(self.v))
-        result = hash_combine(result, hash(self.r))
-        result = hash_combine(result, hash(self.g))
-        result = hash_combine(result, hash(self.b))
-        if self.tangent:
-            result = hash_combine(result, hash(self.tangent[3]))
-        return result
-
-
 ########################################
 
 class Bone(object):
@@ -195,7 +145,11 @@ class Bone(object):
 
 class Skeleton(object):
     def __init__(self, ob):
-        self.armature = ob.find_armature()
+        # the armature itself or an object deformed by it
+        if ob.type == 'ARMATURE':
+            self.armature = ob
+        else:
+            self.armature = ob.find_armature()
         self.name = self.armature.name
         self.ids = {}
         self.hidden = self.armature.hide
@@ -254,58 +208,64 @@ class Skeleton(object):
         for i, bone in enumerate(self.bones):
             print(i, bone)
 
-    def export_xml(self, doc, root):
-        bones = doc.createElement('bones')
-        root.appendChild(bones)
-        bh = doc.createElement('bonehierarchy')
-        root.appendChild(bh)
+    def export_xml(self, xWriter, precision):
+        positions = []
+        angles = []
+        axes = []
+        for mat in self.rest:
+            positions.append(mat.to_translation()[:])
+            q = mat.to_quaternion()
+            angles.append(q.angle)
+            axes.append(q.axis[:])
+        positions = precision.format('positions', positions)
+        angles = precision.format('rotations', angles)
+        axes = precision.format('rotations', axes)
 
+        xWriter.start('bones')
         for i, bone in enumerate(self.bones):
             print(i, bone)
 
-            b = doc.createElement('bone')
-            b.setAttribute('name', bone.name)
-            b.setAttribute('id', str(i))
-            bones.appendChild(b)
-
+            xWriter.start('bone', (('name', bone.name), ('id', str(i))))
+            x, y, z = positions[i]
+            xWriter.empty('position', (('x', x), ('y', y), ('z', z)))
+            xWriter.start('rotation', (('angle', angles[i]),))
+            x, y, z = axes[i]
+            xWriter.empty('axis', (('x', x), ('y', y), ('z', z)))
+            xWriter.end('rotation')
+            xWriter.end('bone')
+        xWriter.end('bones')
+
+        xWriter.start('bonehierarchy')
+        for bone in self.bones:
             if bone.parent:
-                bp = doc.createElement('boneparent')
-                bp.setAttribute('bone', bone.name)
-                bp.setAttribute('parent', bone.parent)
-                bh.appendChild(bp)
-
-            mat = self.rest[i]
-            pos = doc.createElement('position')
-            b.appendChild(pos)
-
-            x, y, z = mat.to_translation()
-            pos.setAttribute('x', '%6f' % x)
-            pos.setAttribute('y', '%6f' % y)
-            pos.setAttribute('z', '%6f' % z)
-
-            rot = doc.createElement('rotation')
-            b.appendChild(rot)
-
-            q = mat.to_quaternion()
-            rot.setAttribute('angle', '%6f' % q.angle)
-            axis = doc.createElement('axis')
-            rot.appendChild(axis)
-
-            x, y, z = q.axis
-            axis.setAttribute('x', '%6f' % x)
-            axis.setAttribute('y', '%6f' % y)
-            axis.setAttribute('z', '%6f' % z)
+                xWriter.empty('boneparent', (('bone', bone.name),
+                                             ('parent', bone.parent)))
+        xWriter.end('bonehierarchy')
 
 #########################################
 
 
-def bCollectAnimationData(meshData):
-    if 'skeleton' not in meshData:
-        return
-    armature = meshData['skeleton'].armature
+def bSampleAction(armature, action, isolate=True, tolerances=None):
+    """Sample the action, which must be the active action of the armature."""
+    scene = bpy.context.scene
+    animation = {}
+    animation['keyframes'] = collectAnimationData(armature,
+                                                  action.frame_range,
+                                                  scene.render.fps,
+                                                  scene.frame_step,
+                                                  isolate,
+                                                  tolerances)
+    animation['name'] = action.name
+    animation['length'] = (action.frame_range[1] -
+                           action.frame_range[0]) / scene.render.fps
+    return animation
+
+
+def bArmatureActions(armature):
+    """The current action of the armature and the actions in its NLA."""
+    actions = []
     animdata = armature.animation_data
     if animdata:
-        actions = []
         # Current action
         if animdata.action:
             actions.append(animdata.action)
@@ -315,36 +275,229 @@ def bCollectAnimationData(meshData):
                 for strip in track.strips.values():
                     if strip.action and strip.action not in actions:
                         actions.append(strip.action)
+    return actions
+
+
+def filterActions(actions, patterns):
+    """Actions whose name matches one of the comma separated patterns."""
+    patterns = [p.strip() for p in patterns.split(',') if p.strip()]
+    if not patterns:
+        return actions
+    return [act for act in actions
+            if any(fnmatch.fnmatchcase(act.name, p) for p in patterns)]
+
+
+def bChangedActions(meshData, actions, filepath, options, converted):
+    """Actions whose own skeleton file is missing or out of date.
+
+       The index and the hashes are kept in meshData for
+       xSaveAnimationFiles.
+    """
+    index = animcache.AnimationIndex.load(filepath)
+    skeletonKey = animcache.skeletonHash(meshData['skeleton'])
+    hashes = {}
+    changed = []
+    for act in actions:
+        hashes[act.name] = animcache.actionHash(act, skeletonKey, options)
+        if index.upToDate(act.name, hashes[act.name], converted):
+            print('Unchanged action', act.name)
+        else:
+            changed.append(act)
+    meshData['animationindex'] = (index, hashes)
+    return changed
+
+
+def bCollectAnimationData(meshData, isolate=True, tolerances=None, workers=1,
+                          actions=None):
+    if 'skeleton' not in meshData:
+        return
+    armature = meshData['skeleton'].armature
+    animdata = armature.animation_data
+    if animdata:
+        if actions is None:
+            actions = bArmatureActions(armature)
 
         # Export them all
         scene = bpy.context.scene
         currentFrame = scene.frame_current
         currentAction = animdata.action
-        meshData['animations'] = []
-        for act in actions:
-            print('Action', act.name)
-            animdata.action = act
-            animation = {}
-            animation['keyframes'] = collectAnimationData(armature,
-                                                          act.frame_range,
-                                                          scene.render.fps,
-                                                          scene.frame_step)
-            animation['name'] = act.name
-            animation['length'] = (act.frame_range[1] -
-                                   act.frame_range[0]) / scene.render.fps
-            meshData['animations'].append(animation)
+        animations = None
+        if workers > 1 and len(actions) > 1:
+            animations = animworker.sampleActions(armature, actions, workers,
+                                                  isolate, tolerances)
+            if animations is None:
+                print('[WARNING]: Sampling animations in this session')
+        if animations is None:
+            animations = []
+            for act in actions:
+                print('Action', act.name)
+                animdata.action = act
+                animations.append(bSampleAction(armature, act, isolate,
+                                                tolerances))
+        meshData['animations'] = animations
 
         animdata.action = currentAction
         scene.frame_set(currentFrame)
 
 
-def collectAnimationData(armature, frame_range, fps, step=1):
-    scene = bpy.context.scene
-    start, end = frame_range
+# pose channels sampled for animations and their rest values
+CHANNELS = (('location', (0, 0, 0)),
+            ('rotation_quaternion', (1, 0, 0, 0)),
+            ('scale', (1, 1, 1)))
 
-    keyframes = {}
+
+def directSampling(armature):
+    """Whether the pose channels of the armature can be read straight from
+       the F-curves of its action instead of evaluating the scene.
+
+       Drivers, NLA tracks playing along, blended actions, constraints and
+       non quaternion rotations need the full evaluation of frame_set.
+    """
+    animdata = armature.animation_data
+    if not animdata or not animdata.action or animdata.drivers:
+        return False
+    if getattr(animdata, 'action_blend_type', 'REPLACE') != 'REPLACE' or \
+            getattr(animdata, 'action_influence', 1.0) != 1.0:
+        return False
+    if animdata.use_nla:
+        for track in animdata.nla_tracks:
+            if not track.mute and len(track.strips):
+                return False
+    for bone in armature.pose.bones:
+        if bone.rotation_mode != 'QUATERNION':
+            return False
+        for constraint in bone.constraints:
+            if not constraint.mute:
+                return False
+    return True
+
+
+def sampleFCurves(armature, frames):
+    """Evaluate the F-curves of the pose channels at the given frames.
+
+       Channels without an F-curve keep their current value.
+       @return {bone name: [locations, rotations, scales]} arrays with one
+               row per frame.
+    """
+    curves = {}
+    for fcurve in armature.animation_data.action.fcurves:
+        if not fcurve.mute:
+            curves[(fcurve.data_path, fcurve.array_index)] = fcurve
+
+    samples = {}
     for bone in armature.pose.bones:
-        keyframes[bone.name] = [[], [], []]   # pos, rot, scl
+        channels = []
+        for name, rest in CHANNELS:
+            path = bone.path_from_id(name)
+            current = getattr(bone, name)
+            values = numpy.empty((len(frames), len(rest)))
+            for index in range(len(rest)):
+                fcurve = curves.get((path, index))
+                if fcurve:
+                    values[:, index] = [fcurve.evaluate(frame)
+                                        for frame in frames]
+                else:
+                    values[:, index] = current[index]
+            channels.append(values)
+        samples[bone.name] = channels
+    return samples
+
+
+def bRelatedObjects(armature):
+    """Names of the objects the pose of the armature can depend on: its
+       parents, constraint targets and driver targets, recursively."""
+    related = set()
+    pending = [armature]
+    while pending:
+        ob = pending.pop()
+        if ob is None or ob.name in related:
+            continue
+        related.add(ob.name)
+        pending.append(ob.parent)
+
+        constraints = list(ob.constraints)
+        if ob.pose:
+            for bone in ob.pose.bones:
+                constraints.extend(bone.constraints)
+        for constraint in constraints:
+            pending.append(getattr(constraint, 'target', None))
+            pending.append(getattr(constraint, 'pole_target', None))
+
+        if ob.animation_data:
+            for fcurve in ob.animation_data.drivers:
+                for variable in fcurve.driver.variables:
+                    for target in variable.targets:
+                        if isinstance(target.id, bpy.types.Object):
+                            pending.append(target.id)
+    return related
+
+
+class IsolatedEvaluation(object):
+    """Turn off the viewport modifiers of every object the armature pose
+       does not depend on while sampling with frame_set, so each frame only
+       evaluates the rig. Restores them on exit."""
+    def __init__(self, armature, enabled=True):
+        self.armature = armature
+        self.enabled = enabled
+        self.disabled = []
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        related = bRelatedObjects(self.armature)
+        for ob in bpy.context.scene.objects:
+            if ob.name in related:
+                continue
+            for modifier in ob.modifiers:
+                if modifier.show_viewport:
+                    modifier.show_viewport = False
+                    self.disabled.append(modifier)
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        for modifier in self.disabled:
+            modifier.show_viewport = True
+        self.disabled = []
+        return False
+
+
+def sampleFrames(armature, frames, isolate=True):
+    """Read the pose channels after evaluating the scene at every frame.
+
+       @param isolate Skip evaluating modifiers of unrelated objects.
+       @return Same as sampleFCurves.
+    """
+    values = {}
+    for bone in armature.pose.bones:
+        values[bone.name] = [[], [], []]
+    with IsolatedEvaluation(armature, isolate):
+        for frame in frames:
+            bpy.context.scene.frame_set(frame)
+            for bone in armature.pose.bones:
+                data = values[bone.name]
+                data[0].append(bone.location[:])
+                data[1].append(bone.rotation_quaternion[:])
+                data[2].append(bone.scale[:])
+
+    samples = {}
+    for name, data in values.items():
+        samples[name] = [numpy.array(channel, numpy.float64).reshape(
+            len(frames), len(rest)) for channel, (n, rest) in
+            zip(data, CHANNELS)]
+    return samples
+
+
+def collectAnimationData(armature, frame_range, fps, step=1, isolate=True,
+                         tolerances=None):
+    """Sample the pose channels of the armature's current action.
+
+       @param tolerances (position, angle in radians) to drop the keys
+                         interpolation reproduces, or None to keep all.
+       @return {bone name: [translations, rotations, scales]} lists of
+               (time, value) keys, None for bones that do not move.
+    """
+    scene = bpy.context.scene
+    start, end = frame_range
 
     fix1 = Matrix([(1, 0, 0), (0, 0, 1), (0, -1, 0)])  # swap YZ & negate some
     fix2 = Matrix([(0, 1, 0), (0, 0, 1), (1, 0, 0)])
@@ -369,106 +522,123 @@ def collectAnimationData(armature, frame_range, fps, step=1):
     armature.hide = hidden
 
     # Collect data
-    for frame in range(int(start), int(end)+1, step):
-        time = (frame - start) / fps
-        bpy.context.scene.frame_set(frame)
-        for bone in armature.pose.bones:
-            loc = bone.location
-            rot = bone.rotation_quaternion.normalized()
-            scl = bone.scale
-
-            # transform transation into parent coordinates
-            loc = mat[bone.name] * loc
-
-            keyframes[bone.name][0].append((time, (loc[0], loc[1], loc[2])))
-            keyframes[bone.name][1].append((time, (rot[0], rot[1], rot[2], rot[3])))
-            keyframes[bone.name][2].append((time, (scl[0], scl[1], scl[2])))
-
-    # Remove unnessesary tracks
-    identity = [(0, 0, 0), (1, 0, 0, 0), (1, 1, 1)]
-    for bone, data in keyframes.items():
-        for track in range(3):
-            used = False
-            for key in data[track]:
-                if used:
-                    break
-                for i in range(len(identity[track])):
-                    if abs(key[1][i] - identity[track][i]) > 1e-5:
-                        used = True
-                        break
-            if not used:
-                data[track] = []
+    frames = list(range(int(start), int(end)+1, step))
+    times = (numpy.array(frames, numpy.float64) - start) / fps
+    if directSampling(armature):
+        samples = sampleFCurves(armature, frames)
+    else:
+        print('Sampling through the scene, the rig has drivers, constraints,'
+              ' NLA tracks or euler rotations')
+        samples = sampleFrames(armature, frames, isolate)
+
+    keyframes = {}
+    for bone, (loc, rot, scl) in samples.items():
+        # transform transation into parent coordinates
+        loc = loc.dot(numpy.array(mat[bone]).T)
+        lengths = numpy.sqrt((rot * rot).sum(axis=1))
+        rot[lengths > 0] /= lengths[lengths > 0, numpy.newaxis]
+
+        # Remove unnessesary tracks
+        channels = []
+        for values, (name, identity) in zip((loc, rot, scl), CHANNELS):
+            if (numpy.abs(values - identity) > 1e-5).any():
+                channels.append(values)
+            else:
+                channels.append(None)
+
+        # Remove keys interpolation gives back
+        keep = slice(None)
+        if tolerances:
+            keep = keyreduce.reduceTrack(times, channels[0], channels[1],
+                                         channels[2], *tolerances)
+
+        data = []
+        for values in channels:
+            if values is None:
+                data.append([])
+            else:
+                data.append(list(zip(times[keep].tolist(),
+                                     map(tuple, values[keep].tolist()))))
 
         # Delete whole track if unused
         if not (data[0] or data[1] or data[2]):
-            keyframes[bone] = None
+            data = None
+        keyframes[bone] = data
 
     return keyframes
 
 
-def xSaveAnimations(meshData, xNode, xDoc):
-    if 'animations' in meshData:
-        animations = xDoc.createElement("animations")
-        xNode.appendChild(animations)
+def xSaveAnimations(animations, xWriter, precision):
+    xWriter.start('animations')
+    for animation in animations:
+        xSaveAnimation(animation, xWriter, precision)
+    xWriter.end('animations')
 
-        for animation in meshData['animations']:
-            xSaveAnimation(animation, xDoc, animations)
 
+def angleAxis(rotations):
+    """Convert (w, x, y, z) quaternions to Ogre angles and (x, y, z) axes.
 
-def xSaveAnimation(animation, xDoc, xAnimations):
-    anim = xDoc.createElement('animation')
-    tracks = xDoc.createElement('tracks')
-    xAnimations.appendChild(anim)
-    anim.appendChild(tracks)
-    anim.setAttribute('name', animation['name'])
-    anim.setAttribute('length', '%6f' % animation['length'])
+       @return (angles, axes) arrays, the axes already in Ogre order.
+    """
+    rotations = numpy.asarray(rotations, numpy.float64).reshape(-1, 4)
+    angles = numpy.arccos(numpy.clip(rotations[:, 0], -1.0, 1.0)) * 2
+    vectors = rotations[:, 1:]
+    lengths = numpy.sqrt((vectors * vectors).sum(axis=1))
+    axes = numpy.zeros_like(vectors)
+    axes[:, 0] = 1.0
+    rotating = lengths != 0
+    axes[rotating] = vectors[rotating] / lengths[rotating, numpy.newaxis]
+    return angles, axes[:, (1, 2, 0)]
+
+
+def xSaveAnimation(animation, xWriter, precision):
+    xWriter.start('animation',
+                  (('name', animation['name']),
+                   ('length', precision.format('times',
+                                               [animation['length']])[0])))
+    xWriter.start('tracks')
     keyframes = animation['keyframes']
     for bone, data in keyframes.items():
         if not data:
             continue
-        track = xDoc.createElement('track')
-        keyframes = xDoc.createElement('keyframes')
-        track.setAttribute('bone', bone)
-        tracks.appendChild(track)
-        track.appendChild(keyframes)
+        xWriter.start('track', (('bone', bone),))
+        xWriter.start('keyframes')
 
         basis = 0 if data[0] else 1 if data[1] else 2
-
-        for frame in range(len(data[basis])):
-            keyframe = xDoc.createElement('keyframe')
-            keyframes.appendChild(keyframe)
-            keyframe.setAttribute('time', '%6f' % data[basis][frame][0])
+        times = precision.format('times', [key[0] for key in data[basis]])
+        if data[0]:
+            translations = precision.format('positions',
+                                            [key[1] for key in data[0]])
+        if data[1]:
+            angles, axes = angleAxis([key[1] for key in data[1]])
+            angles = precision.format('rotations', angles)
+            axes = precision.format('rotations', axes)
+        if data[2]:
+            scales = precision.format('positions',
+                                      [key[1] for key in data[2]])
+
+        for frame in range(len(times)):
+            xWriter.start('keyframe', (('time', times[frame]),))
 
             if data[0]:
-                loc = data[0][frame][1]
-                translate = xDoc.createElement('translate')
-                translate.setAttribute('x', '%6f' % loc[0])
-                translate.setAttribute('y', '%6f' % loc[1])
-                translate.setAttribute('z', '%6f' % loc[2])
-                keyframe.appendChild(translate)
+                x, y, z = translations[frame]
+                xWriter.empty('translate', (('x', x), ('y', y), ('z', z)))
 
             if data[1]:
-                rot = data[1][frame][1]
-                angle = math.acos(rot[0]) * 2
-                l = math.sqrt(rot[1]*rot[1] + rot[2]*rot[2] + rot[3]*rot[3])
-                axis = (1, 0, 0) if l == 0 else (rot[1]/l, rot[2]/l, rot[3]/l)
-
-                rotate = xDoc.createElement('rotate')
-                raxis = xDoc.createElement('axis')
-                rotate.setAttribute('angle', '%6f' % angle)
-                raxis.setAttribute('x', '%6f' % axis[1])
-                raxis.setAttribute('y', '%6f' % axis[2])
-                raxis.setAttribute('z', '%6f' % axis[0])
-                keyframe.appendChild(rotate)
-                rotate.appendChild(raxis)
+                xWriter.start('rotate', (('angle', angles[frame]),))
+                x, y, z = axes[frame]
+                xWriter.empty('axis', (('x', x), ('y', y), ('z', z)))
+                xWriter.end('rotate')
 
             if data[2]:
-                scl = data[2][frame][1]
-                scale = xDoc.createElement('scale')
-                scale.setAttribute('x', '%6f' % scl[0])
-                scale.setAttribute('y', '%6f' % scl[1])
-                scale.setAttribute('z', '%6f' % scl[2])
-                keyframe.appendChild(scale)
+                x, y, z = scales[frame]
+                xWriter.empty('scale', (('x', x), ('y', y), ('z', z)))
+
+            xWriter.end('keyframe')
+        xWriter.end('keyframes')
+        xWriter.end('track')
+    xWriter.end('tracks')
+    xWriter.end('animation')
 
 
 #########################################
@@ -484,11 +654,6 @@ def fileExist(filepath):
         return False
 
 
-def toFmtStr(number):
-    # return str("%0.7f" % number)
-    return str(round(number, 7))
-
-
 def indent(indent):
     """Indentation.
 
@@ -498,22 +663,29 @@ def indent(indent):
     return "        "*indent
 
 
-def xSaveGeometry(geometry, xDoc, xMesh):
+def toOgreAxes(vectors):
+    """Blender z-up (x, y, z) rows to Ogre y-up (x, z, -y)."""
+    vectors = numpy.asarray(vectors, numpy.float64).reshape(-1, 3)
+    return vectors[:, (0, 2, 1)] * (1.0, 1.0, -1.0)
+
+
+def xSaveGeometry(geometry, xWriter, precision, geometryType="geometry"):
     # I guess positions (vertices) must be there always
     vertices = geometry['positions']
 
-    geometryType = "geometry"
-
     isNormals = False
     if 'normals' in geometry:
         isNormals = True
-        normals = geometry['normals']
+        normals = precision.format('normals', toOgreAxes(geometry['normals']))
 
     isTexCoordsSets = False
     texCoordSets = geometry['texcoordsets']
     if texCoordSets > 0 and 'uvsets' in geometry:
         isTexCoordsSets = True
-        uvSets = geometry['uvsets']
+        # take only 1st set for now, v is flipped
+        uvs = numpy.asarray(geometry['uvsets'], numpy.float64)
+        uvs = uvs.reshape(len(vertices), -1)[:, :2] * (1.0, -1.0) + (0.0, 1.0)
+        uvSets = precision.format('uvs', uvs)
 
     isColours = False
     if 'colours' in geometry:
@@ -523,216 +695,228 @@ def xSaveGeometry(geometry, xDoc, xMesh):
     isTangents = False
     if 'tangents' in geometry:
         isTangents = True
-        tangents = geometry['tangents']
+        tangents = numpy.asarray(geometry['tangents'], numpy.float64)
+        signs = precision.format('normals', tangents[:, 3])
+        tangents = precision.format('normals', toOgreAxes(tangents[:, :3]))
     isParity = isTangents and geometry['parity']
 
     isBinormals = False
     if 'binormals' in geometry:
         isBinormals = True
-        binormals = geometry['binormals']
+        binormals = precision.format('normals',
+                                     toOgreAxes(geometry['binormals']))
 
-    xGeometry = xDoc.createElement(geometryType)
-    xGeometry.setAttribute("vertexcount", str(len(vertices)))
-    xMesh.appendChild(xGeometry)
+    xWriter.start(geometryType, (("vertexcount", str(len(vertices))),))
 
-    xVertexBuffer = xDoc.createElement("vertexbuffer")
-    xVertexBuffer.setAttribute("positions", "true")
+    bufferAttrs = [("positions", "true")]
     if isNormals:
-        xVertexBuffer.setAttribute("normals", "true")
+        bufferAttrs.append(("normals", "true"))
     if isTexCoordsSets:
-        xVertexBuffer.setAttribute("texture_coord_dimensions_0", "2")
-        xVertexBuffer.setAttribute("texture_coords", "1") #str(texCoordSets)) # Only export one set
-
+        bufferAttrs.append(("texture_coord_dimensions_0", "2"))
+        bufferAttrs.append(("texture_coords", "1"))  # Only export one set
     if isColours:
-        xVertexBuffer.setAttribute("colours_diffuse", "true")
+        bufferAttrs.append(("colours_diffuse", "true"))
     if isTangents:
-        xVertexBuffer.setAttribute("tangents", "true")
+        bufferAttrs.append(("tangents", "true"))
         if isParity:
-            xVertexBuffer.setAttribute("tangent_dimensions", "4")
+            bufferAttrs.append(("tangent_dimensions", "4"))
     if isBinormals:
-        xVertexBuffer.setAttribute("binormals", "true")
-
-    xGeometry.appendChild(xVertexBuffer)
+        bufferAttrs.append(("binormals", "true"))
+    xWriter.start("vertexbuffer", bufferAttrs)
 
-    for i, vx in enumerate(vertices):
-        xVertex = xDoc.createElement("vertex")
-        xVertexBuffer.appendChild(xVertex)
-        xPosition = xDoc.createElement("position")
-        xPosition.setAttribute("x", toFmtStr(vx[0]))
-        xPosition.setAttribute("y", toFmtStr(vx[2]))
-        xPosition.setAttribute("z", toFmtStr(-vx[1]))
-        xVertex.appendChild(xPosition)
+    positions = precision.format('vertices', toOgreAxes(vertices))
+    for i, (x, y, z) in enumerate(positions):
+        xWriter.start("vertex")
+        xWriter.empty("position", (("x", x), ("y", y), ("z", z)))
 
         if isNormals:
-            xNormal = xDoc.createElement("normal")
-            xNormal.setAttribute("x", toFmtStr(normals[i][0]))
-            xNormal.setAttribute("y", toFmtStr(normals[i][2]))
-            xNormal.setAttribute("z", toFmtStr(-normals[i][1]))
-            xVertex.appendChild(xNormal)
+            x, y, z = normals[i]
+            xWriter.empty("normal", (("x", x), ("y", y), ("z", z)))
 
         if isTexCoordsSets:
-            xUVSet = xDoc.createElement("texcoord")
-            # take only 1st set for now
-            xUVSet.setAttribute("u", toFmtStr(uvSets[i][0][0]))
-            xUVSet.setAttribute("v", toFmtStr(1.0 - uvSets[i][0][1]))
-            xVertex.appendChild(xUVSet)
+            u, v = uvSets[i]
+            xWriter.empty("texcoord", (("u", u), ("v", v)))
 
         if isColours:
-            xColour = xDoc.createElement("colour_diffuse")
-            xColour.setAttribute("value", '%g %g %g, %g' %
-                                 (colours[i][0], colours[i][1],
-                                  colours[i][2], colours[i][3]))
-            xVertex.appendChild(xColour)
+            xWriter.empty("colour_diffuse", (("value", '%g %g %g, %g' %
+                                              (colours[i][0], colours[i][1],
+                                               colours[i][2], colours[i][3])),))
 
         if isTangents:
-            xTangent = xDoc.createElement("tangent")
-            xTangent.setAttribute("x", toFmtStr(tangents[i][0]))
-            xTangent.setAttribute("y", toFmtStr(tangents[i][2]))
-            xTangent.setAttribute("z", toFmtStr(-tangents[i][1]))
+            x, y, z = tangents[i]
+            tangentAttrs = [("x", x), ("y", y), ("z", z)]
             if isParity:
-                xTangent.setAttribute("w", toFmtStr(tangents[i][3]))
-            xVertex.appendChild(xTangent)
+                tangentAttrs.append(("w", signs[i]))
+            xWriter.empty("tangent", tangentAttrs)
 
         if isBinormals:
-            xBinormal = xDoc.createElement("binormal")
-            xBinormal.setAttribute("x", toFmtStr(binormals[i][0]))
-            xBinormal.setAttribute("y", toFmtStr(binormals[i][2]))
-            xBinormal.setAttribute("z", toFmtStr(-binormals[i][1]))
-            xVertex.appendChild(xBinormal)
+            x, y, z = binormals[i]
+            xWriter.empty("binormal", (("x", x), ("y", y), ("z", z)))
+        xWriter.end("vertex")
+
+    xWriter.end("vertexbuffer")
+    xWriter.end(geometryType)
 
 
-def xSaveSubMeshes(meshData, xDoc, xMesh, hasSharedGeometry=False):
-    xSubMeshes = xDoc.createElement("submeshes")
-    xMesh.appendChild(xSubMeshes)
+def xSaveBoneAssignments(geometry, xWriter, precision):
+    # bone ids were resolved when collecting
+    xWriter.start("boneassignments")
+    weights = geometry['boneweights']
+    vertices, slots = numpy.nonzero(weights > 0.0)
+    boneIds = geometry['boneindices'][vertices, slots].tolist()
+    weights = precision.format('weights', weights[vertices, slots])
+    for vxIdx, boneId, boneWeight in zip(vertices.tolist(), boneIds,
+                                         weights):
+        xWriter.empty("vertexboneassignment",
+                      (("vertexindex", str(vxIdx)),
+                       ("boneindex", str(boneId)),
+                       ("weight", boneWeight)))
+    xWriter.end("boneassignments")
+
+
+def xSaveSubMeshes(meshData, xWriter, precision, hasSharedGeometry=False):
+    xWriter.start("submeshes")
 
     for submesh in meshData['submeshes']:
-        xSubMesh = xDoc.createElement("submesh")
-        xSubMesh.setAttribute("material", submesh['material'])
-        numVerts = len(submesh['geometry']['positions'])
-        xSubMesh.setAttribute("usesharedvertices", "false")
-        xSubMesh.setAttribute("use32bitindexes", str(bool(numVerts > 65535)))
-        xSubMesh.setAttribute("operationtype", "triangle_list")
-        xSubMeshes.appendChild(xSubMesh)
+        if hasSharedGeometry:
+            numVerts = len(meshData['sharedgeometry']['positions'])
+        else:
+            numVerts = len(submesh['geometry']['positions'])
+        xWriter.start("submesh", (("material", submesh['material']),
+                                  ("usesharedvertices",
+                                   str(hasSharedGeometry).lower()),
+                                  ("use32bitindexes",
+                                   str(bool(numVerts > 65535))),
+                                  ("operationtype", "triangle_list")))
         # write all faces
         if 'faces' in submesh:
-            faces = submesh['faces']
-            xFaces = xDoc.createElement("faces")
-            xFaces.setAttribute("count", str(len(faces)))
-            xSubMesh.appendChild(xFaces)
-            for face in faces:
-                xFace = xDoc.createElement("face")
-                xFace.setAttribute("v1", str(face[0]))
-                xFace.setAttribute("v2", str(face[1]))
-                xFace.setAttribute("v3", str(face[2]))
-                xFaces.appendChild(xFace)
+            faces = numpy.asarray(submesh['faces']).reshape(-1, 3).tolist()
+            xWriter.start("faces", (("count", str(len(faces))),))
+            for v1, v2, v3 in faces:
+                xWriter.empty("face", (("v1", str(v1)),
+                                       ("v2", str(v2)),
+                                       ("v3", str(v3))))
+            xWriter.end("faces")
         # if there is geometry per sub mesh
         if 'geometry' in submesh:
             geometry = submesh['geometry']
-            xSaveGeometry(geometry, xDoc, xSubMesh)
-        # boneassignments
-        if 'skeleton' in meshData:
-            skeleton = meshData['skeleton']
-            # xBoneAssignments = xGetBoneAssignments(meshData, xDoc,
-            #  submesh['geometry']['boneassignments'])
-            xBoneAssignments = xDoc.createElement("boneassignments")
-            for vxIdx, vxBoneAsg in enumerate(submesh['geometry']['boneassignments']):
-                for boneAndWeight in vxBoneAsg:
-                    boneName = boneAndWeight[0]
-                    boneWeight = boneAndWeight[1]
-                    xVxBoneassignment = xDoc.createElement("vertexboneassignment")
-                    xVxBoneassignment.setAttribute("vertexindex", str(vxIdx))
-                    xVxBoneassignment.setAttribute("boneindex", str(skeleton.bone_id(boneName)))
-                    xVxBoneassignment.setAttribute("weight", '%6f' % boneWeight)
-                    xBoneAssignments.appendChild(xVxBoneassignment)
-            xSubMesh.appendChild(xBoneAssignments)
-
-
-def xSavePoses(meshData, xDoc, xMesh):
-    xPoses = xDoc.createElement("poses")
-    xMesh.appendChild(xPoses)
+            xSaveGeometry(geometry, xWriter, precision)
+            if 'skeleton' in meshData and 'boneweights' in geometry:
+                xSaveBoneAssignments(geometry, xWriter, precision)
+        xWriter.end("submesh")
+
+    xWriter.end("submeshes")
+
+
+def xSavePose(xWriter, precision, attrs, indices, offsets):
+    xWriter.start("pose", attrs)
+    offsets = precision.format('positions', toOgreAxes(offsets))
+    for index, (x, y, z) in zip(indices.tolist(), offsets):
+        xWriter.empty('poseoffset', (('index', str(index)),
+                                     ('x', x), ('y', y), ('z', z)))
+    xWriter.end("pose")
+
+
+def xSavePoses(meshData, xWriter, precision):
+    xWriter.start("poses")
+    for name, (indices, offsets) in meshData.get('sharedposes', {}).items():
+        xSavePose(xWriter, precision, (('target', 'mesh'), ('name', name)),
+                  indices, offsets)
     for index, submesh in enumerate(meshData['submeshes']):
         if not submesh['poses']:
             continue
-        for name in submesh['poses']:
-            xPose = xDoc.createElement("pose")
-            xPose.setAttribute('target', 'submesh')
-            xPose.setAttribute('index', str(index))
-            xPose.setAttribute('name', name)
-            xPoses.appendChild(xPose)
-            pose = submesh['poses'][name]
-            for v in pose:
-                xPoseVertex = xDoc.createElement('poseoffset')
-                xPoseVertex.setAttribute('index', str(v[0]))
-                xPoseVertex.setAttribute('x', '%6f' % v[1])
-                xPoseVertex.setAttribute('y', '%6f' % v[3])
-                xPoseVertex.setAttribute('z', '%6f' % -v[2])
-                xPose.appendChild(xPoseVertex)
-
-
-def xSaveSkeletonData(blenderMeshData, filepath):
-    from xml.dom.minidom import Document
-    if 'skeleton' in blenderMeshData:
-        skeleton = blenderMeshData['skeleton']
+        for name, (indices, offsets) in submesh['poses'].items():
+            xSavePose(xWriter, precision, (('target', 'submesh'),
+                                           ('index', str(index)),
+                                           ('name', name)),
+                      indices, offsets)
+    xWriter.end("poses")
 
-        xDoc = Document()
-        xRoot = xDoc.createElement("skeleton")
-        xDoc.appendChild(xRoot)
-        skeleton.export_xml(xDoc, xRoot)
 
-        if 'animations' in blenderMeshData:
-            xSaveAnimations(blenderMeshData, xRoot, xDoc)
+def xSaveSkeletonFile(xmlfile, skeleton, animations, prettyXml, precision):
+    with XmlWriter.create(xmlfile, prettyXml) as xWriter:
+        xWriter.start("skeleton")
+        skeleton.export_xml(xWriter, precision)
+
+        if animations is not None:
+            xSaveAnimations(animations, xWriter, precision)
+        xWriter.end("skeleton")
+
+
+def xSaveSkeletonData(blenderMeshData, filepath, prettyXml=True,
+                      precision=None, withAnimations=True):
+    if 'skeleton' in blenderMeshData:
+        skeleton = blenderMeshData['skeleton']
+        precision = precision or Precision()
 
         # xmlfile = os.path.join(filepath, '%s.skeleton.xml' %name )
         nameOnly = os.path.splitext(filepath)[0]  # removing .mesh
         xmlfile = nameOnly + ".skeleton.xml"
-        data = xDoc.toprettyxml(indent='    ')
-        f = open(xmlfile, 'wb')
-        f.write(bytes(data, 'utf-8'))
-        f.close()
+        animations = None
+        if withAnimations and 'animations' in blenderMeshData:
+            animations = blenderMeshData['animations']
+        xSaveSkeletonFile(xmlfile, skeleton, animations, prettyXml, precision)
 
 
-def xSaveMeshData(meshData, filepath, export_skeleton):
-    from xml.dom.minidom import Document
+def xSaveAnimationFiles(blenderMeshData, filepath, prettyXml=True,
+                        precision=None):
+    """Write every sampled animation to its own skeleton file.
 
-    hasSharedGeometry = False
-#   Torchlight does not like shared geometry
-#    if 'sharedgeometry' in meshData:
-#        hasSharedGeometry = True
-
-    # Create the minidom document
+       @return The written .skeleton.xml paths.
+    """
+    written = []
+    if 'animationindex' not in blenderMeshData:
+        return written
+    skeleton = blenderMeshData['skeleton']
+    precision = precision or Precision()
+    index, hashes = blenderMeshData['animationindex']
+    for animation in blenderMeshData.get('animations', []):
+        xmlfile = animcache.animationXmlPath(filepath, animation['name'])
+        print("Creating " + xmlfile)
+        xSaveSkeletonFile(xmlfile, skeleton, [animation], prettyXml,
+                          precision)
+        index.update(animation['name'], hashes[animation['name']], xmlfile)
+        written.append(xmlfile)
+    index.save()
+    return written
+
+
+def xSaveMeshData(meshData, filepath, export_skeleton, prettyXml=True,
+                  precision=None):
+    hasSharedGeometry = 'sharedgeometry' in meshData
+    precision = precision or Precision()
+
+    # elements are written out as they are generated
     print("Creating " + filepath + ".xml")
-    xDoc = Document()
+    with XmlWriter.create(filepath + ".xml", prettyXml) as xWriter:
+        xWriter.start("mesh")
 
-    xMesh = xDoc.createElement("mesh")
-    xDoc.appendChild(xMesh)
+        if hasSharedGeometry:
+            geometry = meshData['sharedgeometry']
+            xSaveGeometry(geometry, xWriter, precision, "sharedgeometry")
 
-    if hasSharedGeometry:
-        geometry = meshData['sharedgeometry']
-        xSaveGeometry(geometry, xDoc, xMesh, hasSharedGeometry)
+        xSaveSubMeshes(meshData, xWriter, precision, hasSharedGeometry)
 
-    xSaveSubMeshes(meshData, xDoc, xMesh, hasSharedGeometry)
+        if hasSharedGeometry and 'skeleton' in meshData and \
+                'boneweights' in meshData['sharedgeometry']:
+            xSaveBoneAssignments(meshData['sharedgeometry'], xWriter,
+                                 precision)
 
-    if 'has_poses' in meshData:
-        xSavePoses(meshData, xDoc, xMesh)
+        if 'has_poses' in meshData:
+            xSavePoses(meshData, xWriter, precision)
 
-    # skeleton link only
-    if 'skeleton' in meshData:
-        xSkeletonlink = xDoc.createElement("skeletonlink")
-        # default skeleton
-        linkSkeletonName = meshData['skeleton'].name
-        if export_skeleton:
-            nameDotMeshDotXml = os.path.split(filepath)[1].lower()
-            nameDotMesh = os.path.splitext(nameDotMeshDotXml)[0]
-            linkSkeletonName = os.path.splitext(nameDotMesh)[0]
-        # xSkeletonlink.setAttribute("name", meshData['skeleton']['name']+".skeleton")
-        xSkeletonlink.setAttribute("name", linkSkeletonName+".skeleton")
-        xMesh.appendChild(xSkeletonlink)
+        # skeleton link only
+        if 'skeleton' in meshData:
+            # default skeleton
+            linkSkeletonName = meshData['skeleton'].name
+            if export_skeleton:
+                nameDotMeshDotXml = os.path.split(filepath)[1].lower()
+                nameDotMesh = os.path.splitext(nameDotMeshDotXml)[0]
+                linkSkeletonName = os.path.splitext(nameDotMesh)[0]
+            xWriter.empty("skeletonlink",
+                          (("name", linkSkeletonName + ".skeleton"),))
 
-    # Print our newly created XML
-    fileWr = open(filepath + ".xml", 'w')
-    fileWr.write(xDoc.toprettyxml(indent="    "))  # 4 spaces
-    # doc.writexml(fileWr, "  ")
-    fileWr.close()
+        xWriter.end("mesh")
 
 
 def xSaveMaterialData(filepath, meshData, overwriteMaterialFlag, copyTextures):
@@ -801,241 +985,380 @@ def xSaveMaterialData(filepath, meshData, overwriteMaterialFlag, copyTextures):
                             print("Can't copy texture \"%s\" because file does not exists!" % srcTextureFile)
 
 
-def getVertexIndex(vertexInfo, vertexList):
-    for vIdx, vert in enumerate(vertexList):
-        if vertexInfo == vert:
-            return vIdx
-
-    # not present in list:
-    vertexList.append(vertexInfo)
-    return len(vertexList)-1
-
-
 # Convert rgb colour to brightness value - used for alpha channel
 def luminosity(c):
     return c[0] * 0.25 + c[1] * 0.5 + c[2] * 0.25
 
 
-def bCollectMeshData(meshData, selectedObjects, applyModifiers,
-                     exportColour, exportTangents, exportBinormals,
-                     exportPoses):
-    import bmesh
-    for ob in selectedObjects:
-        # ob = bpy.types.Object ##
-        materials = []
-        for mat in ob.data.materials:
-            if mat:
-                materials.append(mat)
-            else:
-                print('[WARNING:] Bad material data in', ob)
-                # borrowed from ogre scene exporter
-                materials.append('_missing_material_')
+def bPickColourLayers(mesh, exportColour):
+    colourData = None
+    alphaData = None
+    if mesh.vertex_colors.active and exportColour:
+        colourData = mesh.vertex_colors.active.data
+        for layer in mesh.vertex_colors:
+            if layer.name.lower() == 'alpha':
+                alphaData = layer.data
+                # pick a different one for colour if alpha layer is active
+                if layer.active:
+                    colourData = None
+                    for layer in mesh.vertex_colors:
+                        if not layer.active:
+                            colourData = layer.data
+                            break
+                break
+    return colourData, alphaData
+
+
+def bReadArray(collection, attribute, width=1, dtype=numpy.float32):
+    """Read one attribute of every item of a collection with foreach_get.
+
+       @return numpy array, (items, width) if width > 1.
+    """
+    values = numpy.empty(len(collection) * width, dtype)
+    collection.foreach_get(attribute, values)
+    if width > 1:
+        return values.reshape(-1, width)
+    return values
 
-        if not materials:
-            materials.append('_missing_material_')
-        _sm_faces_ = []
-        _sm_verts_ = []
-        for matidx, mat in enumerate(materials):
-            _sm_faces_.append([])
-            _sm_verts_.append([])
 
-        # mesh = bpy.types.Mesh ##
-        mesh = ob.to_mesh(bpy.context.scene, applyModifiers, 'PREVIEW')
+def bExtractMeshArrays(mesh, exportColour, exportTangents, exportBinormals):
+    """Pull the per vertex, per loop and per polygon attributes the export
+       needs out of the mesh, one foreach_get call each.
 
-        # use bmesh to triangulate
-        bm = bmesh.new()
-        bm.from_mesh(mesh)
-        bmesh.ops.triangulate(bm, faces=bm.faces)
-        bm.to_mesh(mesh)
-        bm.free()
+       Normals (and tangents) must have been calculated.
+    """
+    arrays = {}
+    arrays['co'] = bReadArray(mesh.vertices, 'co', 3)
+    arrays['loopVertex'] = bReadArray(mesh.loops, 'vertex_index',
+                                      dtype=numpy.int32)
+    arrays['normal'] = bReadArray(mesh.loops, 'normal', 3)
+    arrays['loopStart'] = bReadArray(mesh.polygons, 'loop_start',
+                                     dtype=numpy.int32)
+    arrays['loopTotal'] = bReadArray(mesh.polygons, 'loop_total',
+                                     dtype=numpy.int32)
+    arrays['material'] = bReadArray(mesh.polygons, 'material_index',
+                                    dtype=numpy.int32)
+    if mesh.uv_layers.active:
+        arrays['uv'] = bReadArray(mesh.uv_layers.active.data, 'uv', 2)
+
+    colourData, alphaData = bPickColourLayers(mesh, exportColour)
+    for key, data in (('colour', colourData), ('alpha', alphaData)):
+        if data is not None and len(data):
+            # rgb in 2.7x, rgba in later versions
+            arrays[key] = bReadArray(data, 'color', len(data[0].color))
+
+    if exportTangents:
+        arrays['tangent'] = bReadArray(mesh.loops, 'tangent', 3)
+        arrays['bitangentSign'] = bReadArray(mesh.loops, 'bitangent_sign')
+    if exportBinormals:
+        arrays['bitangent'] = bReadArray(mesh.loops, 'bitangent', 3)
+    return arrays
+
+
+def bCollectCornerData(mesh, exportColour, exportTangents, exportBinormals):
+    """Read the attributes of every corner of a triangulated mesh.
+
+       @return dict of numpy arrays with one row per corner, in polygon order:
+               'keys' - dedupe rows, see the columns in dedupe
+               'vertex' - original vertex index
+               'material' - material index of the polygon
+               'tangents', 'binormals' - if exported
+               'colours' - whether the mesh has colour or alpha layers
+    """
+    arrays = bExtractMeshArrays(mesh, exportColour,
+                                exportTangents, exportBinormals)
+
+    # should be triangles
+    if (arrays['loopTotal'] != 3).any():
+        raise ValueError('Polygon not a triangle')
+    loops = (arrays['loopStart'][:, numpy.newaxis] +
+             numpy.arange(3, dtype=numpy.int32)).ravel()
+    vertices = arrays['loopVertex'][loops]
+
+    width = dedupe.TANGENT_SIGN + 1 if exportTangents else dedupe.TANGENT_SIGN
+    keys = numpy.empty((len(loops), width), numpy.float32)
+    keys[:, dedupe.POSITION] = arrays['co'][vertices]
+    keys[:, dedupe.NORMAL] = arrays['normal'][loops]
+    keys[:, dedupe.UV] = arrays['uv'][loops] if 'uv' in arrays else 0.0
+    colours = keys[:, dedupe.COLOUR]
+    colours[:, :3] = arrays['colour'][loops, :3] if 'colour' in arrays else 1.0
+    colours[:, 3] = arrays['alpha'][loops, 0] if 'alpha' in arrays else 1.0
+
+    data = {'keys': keys,
+            'vertex': vertices,
+            'material': numpy.repeat(arrays['material'], 3),
+            'colours': 'colour' in arrays or 'alpha' in arrays}
+    if exportTangents:
+        sign = arrays['bitangentSign'][loops]
+        keys[:, dedupe.TANGENT_SIGN] = sign
+        data['tangents'] = numpy.column_stack((arrays['tangent'][loops],
+                                               sign))
+    if exportBinormals:
+        data['binormals'] = -arrays['bitangent'][loops]
+    return data
+
+
+def bCollectSkinWeights(ob, mesh, skeleton, maxInfluences):
+    """Compute the bone influences of every vertex once.
+
+       Vertex groups that are not bones of the skeleton and weights below
+       MIN_BONE_WEIGHT are dropped, only the maxInfluences heaviest remain
+       and those are renormalized to sum up to one.
+
+       @return (bones, weights) - (vertices, maxInfluences) arrays of bone
+               ids and weights. Unused slots have a weight of 0.
+    """
+    # vertex group index -> bone id, -1 if the group is no bone
+    groupBones = numpy.array([skeleton.ids.get(vg.name, -1)
+                              for vg in ob.vertex_groups] + [-1], numpy.int32)
+
+    vertexIndex = []
+    groupIndex = []
+    weight = []
+    for vertex in mesh.vertices:
+        for vxGroup in vertex.groups:
+            vertexIndex.append(vertex.index)
+            groupIndex.append(vxGroup.group)
+            weight.append(vxGroup.weight)
+    vertexIndex = numpy.array(vertexIndex, numpy.int32)
+    bone = groupBones[numpy.array(groupIndex, numpy.int32)]
+    weight = numpy.array(weight, numpy.float32)
+
+    keep = (bone >= 0) & (weight > MIN_BONE_WEIGHT)
+    vertexIndex, bone, weight = vertexIndex[keep], bone[keep], weight[keep]
+
+    # heaviest first, then rank the influences of each vertex
+    order = numpy.lexsort((-weight, vertexIndex))
+    vertexIndex, bone, weight = vertexIndex[order], bone[order], weight[order]
+    rank = numpy.arange(len(vertexIndex)) - \
+        numpy.searchsorted(vertexIndex, vertexIndex)
+    keep = rank < maxInfluences
+
+    bones = numpy.zeros((len(mesh.vertices), maxInfluences), numpy.int32)
+    weights = numpy.zeros((len(mesh.vertices), maxInfluences), numpy.float32)
+    bones[vertexIndex[keep], rank[keep]] = bone[keep]
+    weights[vertexIndex[keep], rank[keep]] = weight[keep]
+
+    totals = weights.sum(axis=1, keepdims=True)
+    numpy.divide(weights, totals, out=weights, where=totals > 0)
+    return bones, weights
+
+
+# per vertex arrays of a geometry dict
+GEOMETRY_ARRAYS = ('original', 'positions', 'normals', 'uvsets', 'colours',
+                   'tangents', 'binormals', 'boneindices', 'boneweights')
+
+
+def tangentParity(geometry):
+    return bool('binormals' not in geometry and
+                (geometry['tangents'][:, 3] < 0).any())
+
+
+def bCollectGeometry(mesh, corners, vertexCorners, skin,
+                     exportTangents, exportBinormals):
+    """Vertex buffer of the deduplicated corners.
+
+       @param vertexCorners The corner each exported vertex is taken from.
+       @param skin (bones, weights) from bCollectSkinWeights or None.
+       @return geometry dict of numpy arrays with one row per vertex.
+               'original' is the blender vertex each one comes from.
+    """
+    keys = corners['keys'][vertexCorners]
+
+    geometry = {}
+    geometry['original'] = corners['vertex'][vertexCorners]
+    geometry['positions'] = keys[:, dedupe.POSITION]
+    geometry['normals'] = keys[:, dedupe.NORMAL]
+    geometry['texcoordsets'] = len(mesh.uv_textures)
+    if mesh.uv_layers.active:
+        # one uv set per vertex
+        geometry['uvsets'] = keys[:, numpy.newaxis, dedupe.UV]
+    if corners['colours']:
+        geometry['colours'] = keys[:, dedupe.COLOUR]
+    if exportTangents:
+        geometry['tangents'] = corners['tangents'][vertexCorners]
+    if exportBinormals:
+        geometry['binormals'] = corners['binormals'][vertexCorners]
+    if exportTangents:
+        geometry['parity'] = tangentParity(geometry)
+    if skin:
+        geometry['boneindices'] = skin[0][geometry['original']]
+        geometry['boneweights'] = skin[1][geometry['original']]
+    return geometry
+
+
+def subGeometry(geometry, vertices):
+    """The part of a geometry made of the given vertices, in that order."""
+    result = {'texcoordsets': geometry['texcoordsets']}
+    for key in GEOMETRY_ARRAYS:
+        if key in geometry:
+            result[key] = geometry[key][vertices]
+    if 'tangents' in result:
+        result['parity'] = tangentParity(result)
+    return result
+
+
+def joinGeometry(geometries):
+    """Append vertex buffers with the same attributes to each other."""
+    if len(geometries) == 1:
+        return geometries[0]
+    result = {'texcoordsets': min(g['texcoordsets'] for g in geometries)}
+    for key in GEOMETRY_ARRAYS:
+        if key in geometries[0]:
+            result[key] = numpy.concatenate([g[key] for g in geometries])
+    if 'tangents' in result:
+        result['parity'] = tangentParity(result)
+    return result
+
+
+def bCollectPoses(mesh, originals, epsilon=0.0):
+    """Shape key offsets of the exported vertices.
+
+       @param originals Blender vertex index of each exported vertex.
+       @param epsilon Offsets with no coordinate larger than this are
+                      dropped.
+       @return {name: (indices, offsets)} with the exported vertices that
+               move and their (x, y, z) offsets, or None.
+    """
+    if not (mesh.shape_keys and mesh.shape_keys.key_blocks):
+        return None
+
+    # coordinates of every key block, read once even if several keys are
+    # relative to it
+    coords = {}
+
+    def keyCoords(block):
+        if block.name not in coords:
+            coords[block.name] = bReadArray(block.data, 'co', 3)[originals]
+        return coords[block.name]
+
+    poses = {}
+    for pose in mesh.shape_keys.key_blocks:
+        if pose.relative_key:
+            offsets = keyCoords(pose) - keyCoords(pose.relative_key)
+            moving = (numpy.abs(offsets) > epsilon).any(axis=1)
+            indices = numpy.flatnonzero(moving)
+            if len(indices):
+                poses[pose.name] = (indices, offsets[indices])
+    return poses
+
+
+def subPoses(poses, vertices, vertexCount):
+    """Poses renumbered to the vertices of a sub geometry."""
+    if not poses:
+        return None
+    local = numpy.empty(vertexCount, numpy.intp)
+    local.fill(-1)
+    local[vertices] = numpy.arange(len(vertices))
+    result = {}
+    for name, (indices, offsets) in poses.items():
+        mapped = local[indices]
+        order = numpy.argsort(mapped[mapped >= 0], kind='mergesort')
+        if len(order):
+            result[name] = (mapped[mapped >= 0][order],
+                            offsets[mapped >= 0][order])
+    return result or None
+
+
+def bObjectMaterials(ob, byMaterial):
+    """Material names of the submeshes of an object."""
+    if not byMaterial:
+        # one submesh, named after the last material
+        materialName = ob.name
+        for m in ob.data.materials:
+            if m:
+                materialName = m.name
+        return [materialName]
 
-        # Calculate normals and tangents
-        if not mesh.uv_layers.active:
-            exportTangents = exportBinormals = False
-        if exportTangents:
-            mesh.calc_tangents(mesh.uv_layers.active.name)
+    materials = []
+    for mat in ob.data.materials:
+        if mat:
+            materials.append(mat.name)
         else:
-            mesh.calc_normals_split()
+            print('[WARNING:] Bad material data in', ob)
+            # borrowed from ogre scene exporter
+            materials.append('_missing_material_')
 
-        # pick uv data
-        uvData = mesh.uv_layers.active.data if mesh.uv_layers.active else None
-
-        # Pick colour data
-        colourData = None
-        alphaData = None
-        if mesh.vertex_colors.active and exportColour:
-            colourData = mesh.vertex_colors.active.data
-            for layer in mesh.vertex_colors:
-                if layer.name.lower() == 'alpha':
-                    alphaData = layer.data
-                    # pick a different one for colour if alpha layer is active
-                    if layer.active:
-                        colourData = None
-                        for layer in mesh.vertex_colors:
-                            if not layer.active:
-                                colourData = layer.data
-                                break
-                    break
-
-        map = {}
-
-        import sys
-        progressScale = 1.0 / (len(mesh.polygons) - 1)
-
-        for fidx, face in enumerate(mesh.polygons):
-            smooth = face.use_smooth
-            faces = _sm_faces_[face.material_index]
-            # Ogre only supports triangles
-            tris = []
-            tris.append((face.vertices[0], face.vertices[1], face.vertices[2]))
-
-            if len(face.vertices) >= 4:
-                tris.append((face.vertices[0], face.vertices[2], face.vertices[3]))
-
-            # Progress
-            percent = fidx * progressScale
-            sys.stdout.write("\rVertices [" + '=' * int(percent*50) + '>' +
-                             '.' * int(50-percent*50) + "] " +
-                             str(int(percent*10000)/100.0) + "%   ")
-            sys.stdout.flush()
-
-            # should be triangles
-            if len(face.vertices) != 3:
-                raise ValueError('Polygon not a triangle')
-
-            # Add triangle
-            newFaceVx = []
-            for i in range(3):
-                vertex = face.vertices[i]
-                loop = face.loop_indices[i]
-
-                px, py, pz = mesh.vertices[vertex].co
-                nx, ny, nz = mesh.loops[loop].normal
-                u, v = uvData[loop].uv if uvData else (0, 0)
-                r, g, b = colourData[loop].color if colourData else (1, 1, 1)
-                a = alphaData[loop].color[0] if alphaData else 1
-
-                tangent = mesh.loops[loop].tangent[:] + (mesh.loops[loop].bitangent_sign,) if exportTangents else None
-                binormal = mesh.loops[loop].bitangent * -1 if exportBinormals else None
-
-                # vertex groups
-                boneWeights = {}
-                for vxGroup in mesh.vertices[vertex].groups:
-                    if vxGroup.weight > 0.01:
-                        vg = ob.vertex_groups[vxGroup.group]
-                        boneWeights[vg.name] = vxGroup.weight
-
-                # Add vertex
-                vert = VertexInfo(px, py, pz,
-                                  nx, ny, nz,
-                                  u, v,
-                                  r, g, b, a,
-                                  boneWeights,
-                                  vertex,
-                                  tangent,
-                                  binormal)
-
-                newVxIdx = map.get(vert)
-                if newVxIdx is None:
-                    newVxIdx = len(_sm_verts_[face.material_index])
-                    _sm_verts_[face.material_index].append(vert)
-                    map[vert] = newVxIdx
-                newFaceVx.append(newVxIdx)
-
-            faces.append(newFaceVx)
+    if not materials:
+        materials.append('_missing_material_')
+    return materials
+
+
+def useSharedGeometry(objects):
+    """Whether one shared vertex buffer is smaller than one per submesh."""
+    if sum(len(materials) for geometry, materials, t, p in objects) < 2:
+        return False
+    # all vertices need the same attributes
+    layout = set(objects[0][0])
+    if any(set(geometry) != layout for geometry, m, t, p in objects):
+        return False
+    shared = sum(len(geometry['positions']) for geometry, m, t, p in objects)
+    separate = sum(len(numpy.unique(triangles))
+                   for g, m, submeshes, p in objects
+                   for triangles in submeshes)
+    return shared < separate
+
+
+def shareGeometry(meshData, objects):
+    # one vertex buffer, submeshes only index into it
+    geometries = []
+    submeshes = []
+    poses = {}
+    base = 0
+    for geometry, materials, triangles, objectPoses in objects:
+        for material, faces in zip(materials, triangles):
+            submeshes.append({'material': material,
+                              'faces': faces + base,
+                              'poses': None})
+        for name, (indices, offsets) in (objectPoses or {}).items():
+            poses.setdefault(name, []).append((indices + base, offsets))
+        geometries.append(geometry)
+        base += len(geometry['positions'])
+
+    meshData['sharedgeometry'] = joinGeometry(geometries)
+    meshData['submeshes'] = submeshes
+    if poses:
+        meshData['sharedposes'] = dict(
+            (name, (numpy.concatenate([p[0] for p in parts]),
+                    numpy.concatenate([p[1] for p in parts])))
+            for name, parts in poses.items())
+        meshData['has_poses'] = True
+
+
+def splitGeometry(meshData, objects):
+    # a vertex buffer of its own for every submesh
     meshData['submeshes'] = []
-    for matidx, mat in enumerate(materials):
-        normals = []
-        tangents = []
-        binormals = []
-        positions = []
-        uvTex = []
-        colours = []
-        boneAssignments = []
-        needsParity = False
-
-        # vertex groups of object
-        for vxInfo in _sm_verts_[matidx]:
-            positions.append([vxInfo.px, vxInfo.py, vxInfo.pz])
-            normals.append([vxInfo.nx, vxInfo.ny, vxInfo.nz])
-            uvTex.append([[vxInfo.u, vxInfo.v]])
-            colours.append([vxInfo.r, vxInfo.g, vxInfo.b, vxInfo.a])
-
-            boneWeights = []
-            for boneW in vxInfo.boneWeights.keys():
-                boneWeights.append([boneW, vxInfo.boneWeights[boneW]])
-            boneAssignments.append(boneWeights)
-
-        if exportTangents:
-            for vxInfo in _sm_verts_[matidx]:
-                tangents.append(vxInfo.tangent)
-                binormals.append(vxInfo.binormal)
-
-            if not exportBinormals:
-                for vxInfo in _sm_verts_[matidx]:
-                    if vxInfo.tangent[3] < 0:
-                        needsParity = True
-                        break
-
-        # Shape keys - poses
-        poses = None
-        if exportPoses and mesh.shape_keys and mesh.shape_keys.key_blocks:
-            poses = {}
-            for pose in mesh.shape_keys.key_blocks:
-                if pose.relative_key:
-                    poseData = []
-                    for index, v in enumerate(_sm_verts_[matidx]):
-                        base = pose.relative_key.data[v.original].co
-                        pos = pose.data[v.original].co
-                        x = pos[0] - base[0]
-                        y = pos[1] - base[1]
-                        z = pos[2] - base[2]
-                        if x != 0 or y != 0 or z != 0:
-                            poseData.append((index, x, y, z))
-                    if poseData:
-                        poses[pose.name] = poseData
-
-        subMeshData = {}
-        subMeshData['geometry'] = {}
-        subMeshData['geometry']['positions'] = positions
-        subMeshData['geometry']['normals'] = normals
-        subMeshData['geometry']['texcoordsets'] = len(mesh.uv_textures)
-
-        if uvData:
-            subMeshData['geometry']['uvsets'] = uvTex
-        if colourData or alphaData:
-            subMeshData['geometry']['colours'] = colours
-        if exportTangents:
-            subMeshData['geometry']['tangents'] = tangents
-            subMeshData['geometry']['parity'] = needsParity
-        if exportBinormals:
-            subMeshData['geometry']['binormals'] = binormals
-
-        # need bone name to bone ID dict
-        subMeshData['geometry']['boneassignments'] = boneAssignments
-
-        subMeshData['material'] = mat.name
-        subMeshData['faces'] = _sm_faces_[matidx]
-        subMeshData['geometry']['poses'] = poses
-        if poses:
-            subMeshData['geometry']['has_poses'] = True
-        meshData['submeshes'].append(subMeshData)
+    for geometry, materials, triangles, poses in objects:
+        vertexCount = len(geometry['positions'])
+        for material, faces in zip(materials, triangles):
+            vertices, faces = dedupe.splitShared(faces)
+            subMeshData = {}
+            subMeshData['material'] = material
+            subMeshData['geometry'] = subGeometry(geometry, vertices)
+            subMeshData['faces'] = faces
+            subMeshData['poses'] = subPoses(poses, vertices, vertexCount)
+            if subMeshData['poses']:
+                meshData['has_poses'] = True
+            meshData['submeshes'].append(subMeshData)
 
-    return meshData
 
+def bCollectMeshData(meshData, selectedObjects, applyModifiers,
+                     exportColour, exportTangents, exportBinormals,
+                     exportPoses, maxInfluences=4, byMaterial=True,
+                     allowSharedGeometry=False, poseEpsilon=0.0):
+    """Collect the submeshes of the selected objects.
 
-def bCollectMeshDataOriginal(meshData, selectedObjects, applyModifiers,
-                             exportColour, exportTangents, exportBinormals,
-                             exportPoses):
+       Every object gives one submesh per material, or a single one if
+       byMaterial is off. With allowSharedGeometry all submeshes use one
+       vertex buffer if that has fewer vertices in total.
+    """
     import bmesh
-    subMeshesData = []
+    skeleton = meshData.get('skeleton')
+    objects = []
     for ob in selectedObjects:
-        subMeshData = {}
         # ob = bpy.types.Object ##
-        materialName = ob.name
-        for m in ob.data.materials:
-            if m:
-                materialName = m.name
+        materials = bObjectMaterials(ob, byMaterial)
+
         # mesh = bpy.types.Mesh ##
         mesh = ob.to_mesh(bpy.context.scene, applyModifiers, 'PREVIEW')
 
@@ -1047,197 +1370,49 @@ def bCollectMeshDataOriginal(meshData, selectedObjects, applyModifiers,
         bm.free()
 
         # Calculate normals and tangents
+        objectTangents = exportTangents
+        objectBinormals = exportBinormals
         if not mesh.uv_layers.active:
-            exportTangents = exportBinormals = False
-        if exportTangents:
+            objectTangents = objectBinormals = False
+        if objectTangents:
             mesh.calc_tangents(mesh.uv_layers.active.name)
         else:
             mesh.calc_normals_split()
 
-        # pick uv data
-        uvData = mesh.uv_layers.active.data if mesh.uv_layers.active else None
-
-        # Pick colour data
-        colourData = None
-        alphaData = None
-        if mesh.vertex_colors.active and exportColour:
-            colourData = mesh.vertex_colors.active.data
-            for layer in mesh.vertex_colors:
-                if layer.name.lower() == 'alpha':
-                    alphaData = layer.data
-                    # pick a different one for colour if alpha layer is active
-                    if layer.active:
-                        colourData = None
-                        for layer in mesh.vertex_colors:
-                            if not layer.active:
-                                colourData = layer.data
-                                break
-                    break
-
-        vertexList = []
-        newFaces = []
-
-        map = {}
-
-        import sys
-        progressScale = 1.0 / (len(mesh.polygons) - 1)
-
-        for fidx, face in enumerate(mesh.polygons):
-            tris = []
-            tris.append((face.vertices[0], face.vertices[1], face.vertices[2]))
-            if(len(face.vertices) >= 4):
-                tris.append((face.vertices[0],
-                             face.vertices[2],
-                             face.vertices[3]))
-            if SHOW_EXPORT_TRACE_VX:
-                print("_face: " + str(fidx) + " indices [" +
-                      str(list(face.vertices)) + "]")
-
-            # Progress
-            percent = fidx * progressScale
-            sys.stdout.write("\rVertices [" + '=' * int(percent*50) + '>' +
-                             '.' * int(50-percent*50) + "] " +
-                             str(int(percent*10000)/100.0) + "%   ")
-            sys.stdout.flush()
-
-            # should be triangles
-            if len(face.vertices) != 3:
-                raise ValueError('Polygon not a triangle')
-
-            # Add triangle
-            newFaceVx = []
-            for i in range(3):
-                vertex = face.vertices[i]
-                loop = face.loop_indices[i]
-
-                px, py, pz = mesh.vertices[vertex].co
-                nx, ny, nz = mesh.loops[loop].normal
-                u, v = uvData[loop].uv if uvData else (0, 0)
-                r, g, b = colourData[loop].color if colourData else (1, 1, 1)
-                a = alphaData[loop].color[0] if alphaData else 1
-
-                tangent = mesh.loops[loop].tangent[:] + (mesh.loops[loop].bitangent_sign,) if exportTangents else None
-                binormal = mesh.loops[loop].bitangent * -1 if exportBinormals else None
-
-                # vertex groups
-                boneWeights = {}
-                for vxGroup in mesh.vertices[vertex].groups:
-                    if vxGroup.weight > 0.01:
-                        vg = ob.vertex_groups[vxGroup.group]
-                        boneWeights[vg.name] = vxGroup.weight
-
-                # Add vertex
-                vert = VertexInfo(px, py, pz,
-                                  nx, ny, nz,
-                                  u, v,
-                                  r, g, b, a,
-                                  boneWeights,
-                                  vertex,
-                                  tangent,
-                                  binormal)
-
-                newVxIdx = map.get(vert)
-                if newVxIdx is None:
-                    newVxIdx = len(vertexList)
-                    vertexList.append(vert)
-                    map[vert] = newVxIdx
-                newFaceVx.append(newVxIdx)
-
-            newFaces.append(newFaceVx)
-
-        # geometry
-        geometry = {}
-        faces = []
-        normals = []
-        tangents = []
-        binormals = []
-        positions = []
-        uvTex = []
-        colours = []
-        # vertex groups of object
-        boneAssignments = []
-        faces = newFaces
-        needsParity = False
-
-        for vxInfo in vertexList:
-            positions.append([vxInfo.px, vxInfo.py, vxInfo.pz])
-            normals.append([vxInfo.nx, vxInfo.ny, vxInfo.nz])
-            uvTex.append([[vxInfo.u, vxInfo.v]])
-            colours.append([vxInfo.r, vxInfo.g, vxInfo.b, vxInfo.a])
-
-            boneWeights = []
-            for boneW in vxInfo.boneWeights.keys():
-                boneWeights.append([boneW, vxInfo.boneWeights[boneW]])
-            boneAssignments.append(boneWeights)
-
-        if exportTangents:
-            for vxInfo in vertexList:
-                tangents.append(vxInfo.tangent)
-                binormals.append(vxInfo.binormal)
-
-            if not exportBinormals:
-                for vxInfo in vertexList:
-                    if vxInfo.tangent[3] < 0:
-                        needsParity = True
-                        break
-
-        if SHOW_EXPORT_TRACE_VX:
-            print("uvTex:")
-            print(uvTex)
-            print("boneAssignments:")
-            print(boneAssignments)
-
-        # Shape keys - poses
+        corners = bCollectCornerData(mesh, exportColour,
+                                     objectTangents, objectBinormals)
+        if byMaterial:
+            cornerSubmesh = numpy.minimum(corners['material'],
+                                          len(materials) - 1)
+        else:
+            cornerSubmesh = numpy.zeros_like(corners['material'])
+        keys = corners['keys']
+        skin = None
+        if skeleton:
+            skin = bCollectSkinWeights(ob, mesh, skeleton, maxInfluences)
+            keys = dedupe.skinnedRows(keys, skin[0][corners['vertex']],
+                                      skin[1][corners['vertex']])
+        vertexCorners, triangles = dedupe.buildShared(keys, cornerSubmesh,
+                                                      len(materials))
+
+        geometry = bCollectGeometry(mesh, corners, vertexCorners, skin,
+                                    objectTangents, objectBinormals)
         poses = None
-        if exportPoses and mesh.shape_keys and mesh.shape_keys.key_blocks:
-            poses = {}
-            for pose in mesh.shape_keys.key_blocks:
-                if pose.relative_key:
-                    poseData = []
-                    for index, v in enumerate(vertexList):
-                        base = pose.relative_key.data[v.original].co
-                        pos = pose.data[v.original].co
-                        x = pos[0] - base[0]
-                        y = pos[1] - base[1]
-                        z = pos[2] - base[2]
-                        if x != 0 or y != 0 or z != 0:
-                            poseData.append((index, x, y, z))
-                    if poseData:
-                        poses[pose.name] = poseData
-
-        geometry['positions'] = positions
-        geometry['normals'] = normals
-        geometry['texcoordsets'] = len(mesh.uv_textures)
-        if SHOW_EXPORT_TRACE:
-            print("texcoordsets: " + str(len(mesh.uv_textures)))
-        if uvData:
-            geometry['uvsets'] = uvTex
-        if colourData or alphaData:
-            geometry['colours'] = colours
-        if exportTangents:
-            geometry['tangents'] = tangents
-            geometry['parity'] = needsParity
-        if exportBinormals:
-            geometry['binormals'] = binormals
-
-        # need bone name to bone ID dict
-        geometry['boneassignments'] = boneAssignments
-
-        subMeshData['material'] = materialName
-        subMeshData['faces'] = faces
-        subMeshData['geometry'] = geometry
-        subMeshData['poses'] = poses
-
-        subMeshesData.append(subMeshData)
-
-        if poses:
-            meshData['has_poses'] = True
-
-        # if mesh was newly created with modifiers, remove the mesh
-        if applyModifiers:
-            bpy.data.meshes.remove(mesh)
-
-    meshData['submeshes'] = subMeshesData
+        if exportPoses:
+            poses = bCollectPoses(mesh, geometry['original'], poseEpsilon)
+        objects.append((geometry, materials, triangles, poses))
+        print("%s: %d corners -> %d vertices" % (ob.name, len(corners['keys']),
+                                                 len(vertexCorners)))
+
+        # remove the temporary mesh created by to_mesh
+        bpy.data.meshes.remove(mesh)
+
+    # Torchlight does not like shared geometry
+    if allowSharedGeometry and useSharedGeometry(objects):
+        print("Using shared geometry")
+        shareGeometry(meshData, objects)
+    else:
+        splitGeometry(meshData, objects)
 
     return meshData
 
@@ -1247,9 +1422,10 @@ def bCollectSkeletonData(blenderMeshData, selectedObjects):
         print("bpy.data.armatures = %s" % bpy.data.armatures)
 
     # TODO: for now just take armature of first selected object
-    if selectedObjects[0].find_armature():
+    ob = selectedObjects[0]
+    if ob.type == 'ARMATURE' or ob.find_armature():
         # creates and parses blender skeleton
-        skeleton = Skeleton(selectedObjects[0])
+        skeleton = Skeleton(ob)
 
         blenderMeshData['skeleton'] = skeleton
 
@@ -1291,37 +1467,73 @@ def bCollectMaterialData(blenderMeshData, selectedObjects):
 
 
 def XMLtoOGREConvert(blenderMeshData, filepath, ogreXMLconverter,
-                     export_skeleton, keep_xml, export_edgelists):
+                     export_skeleton, keep_xml, export_edgelists,
+                     animationFiles=(), exportMesh=True):
+    """Convert the written xml files to binary Ogre files.
 
+       @return Number of files converted, None if the converter could not
+               be run.
+    """
     if ogreXMLconverter is None:
-        return False
+        return None
+
+    converted = 0
 
     # for mesh
     # use Ogre XML converter  xml -> binary mesh
     try:
-        xmlFilepath = filepath + ".xml"
-        if export_edgelists:
-            subprocess.call([ogreXMLconverter, xmlFilepath])
-        else:  # if other args are needed, build them ahead of time
-            subprocess.call([ogreXMLconverter, "-e", xmlFilepath])
-        # remove XML file if successfully converted
-        if keep_xml is False and os.path.isfile(filepath):
-            os.unlink("%s" % xmlFilepath)
+        if exportMesh:
+            xmlFilepath = filepath + ".xml"
+            if export_edgelists:
+                subprocess.call([ogreXMLconverter, xmlFilepath])
+            else:  # if other args are needed, build them ahead of time
+                subprocess.call([ogreXMLconverter, "-e", xmlFilepath])
+            converted += 1
+            # remove XML file if successfully converted
+            if keep_xml is False and os.path.isfile(filepath):
+                os.unlink("%s" % xmlFilepath)
 
         if 'skeleton' in blenderMeshData and export_skeleton:
             # for skeleton
             skelFile = os.path.splitext(filepath)[0]  # removing .mesh
             xmlFilepath = skelFile + ".skeleton.xml"
             subprocess.call([ogreXMLconverter, xmlFilepath])
+            converted += 1
             # remove XML file
             if keep_xml is False:
                 os.unlink("%s" % xmlFilepath)
 
-        return True
+        # for split animations
+        for xmlFilepath in animationFiles:
+            subprocess.call([ogreXMLconverter, xmlFilepath])
+            converted += 1
+            if keep_xml is False:
+                os.unlink("%s" % xmlFilepath)
+
+        return converted
 
     except:
         print("Error: Could not run", ogreXMLconverter)
-        return False
+        return None
+
+
+def countVertices(meshData):
+    count = 0
+    if 'sharedgeometry' in meshData:
+        count += len(meshData['sharedgeometry']['positions'])
+    for subMesh in meshData.get('submeshes', []):
+        if 'geometry' in subMesh:
+            count += len(subMesh['geometry']['positions'])
+    return count
+
+
+def countKeyframes(meshData):
+    count = 0
+    for animation in meshData.get('animations', []):
+        for data in animation['keyframes'].values():
+            if data:
+                count += len(data[0]) + len(data[1]) + len(data[2])
+    return count
 
 
 def save(operator, context, filepath,
@@ -1339,8 +1551,21 @@ def save(operator, context, filepath,
          copy_textures=False,
          export_skeleton=False,
          enable_by_material=False,
+         allow_shared_geometry=False,
          export_poses=False,
+         pose_epsilon=1e-5,
          export_animation=False,
+         isolate_sampling=True,
+         reduce_keyframes=False,
+         position_tolerance=1e-4,
+         angle_tolerance=0.0008726646,
+         animation_workers=1,
+         action_filter='',
+         split_animations=False,
+         skeleton_only=False,
+         max_influences=4,
+         pretty_xml=True,
+         precision='STANDARD',
          ):
 
     global blender_version
@@ -1353,13 +1578,22 @@ def save(operator, context, filepath,
 
     print("saving...")
     print(str(filepath))
+    metrics = createMetrics('export', filepath)
+    numberFormat = Precision(precision)
+
+    # only the .skeleton, the armature may be selected itself
+    if skeleton_only:
+        export_skeleton = True
 
     # get mesh data from selected objects
     selectedObjects = []
     scn = bpy.context.scene
     for ob in scn.objects:
-        if ob.select is True and ob.type != 'ARMATURE':
+        if ob.select is True and (ob.type != 'ARMATURE' or skeleton_only):
             selectedObjects.append(ob)
+    if skeleton_only:
+        # a selected armature wins over the armatures of selected meshes
+        selectedObjects.sort(key=lambda ob: ob.type != 'ARMATURE')
 
     if len(selectedObjects) == 0:
         print("No objects selected for export.")
@@ -1378,32 +1612,53 @@ def save(operator, context, filepath,
     blenderMeshData = {}
 
     # skeleton
-    bCollectSkeletonData(blenderMeshData, selectedObjects)
+    with metrics.phase('skeleton preparation', 'bones') as phase:
+        bCollectSkeletonData(blenderMeshData, selectedObjects)
+        if 'skeleton' in blenderMeshData:
+            phase.count = len(blenderMeshData['skeleton'].bones)
+
+    if skeleton_only and 'skeleton' not in blenderMeshData:
+        print("No armature selected for export.")
+        operator.report({'WARNING'}, "No armature selected for export")
+        return {'CANCELLED'}
 
     # mesh
-    # TODO: Turn this into a factory pattern. Need to follow DRY.
-    if enable_by_material:
-        bCollectMeshData(blenderMeshData,
-                         selectedObjects,
-                         apply_modifiers,
-                         export_colour,
-                         export_tangents,
-                         export_binormals,
-                         export_poses)
-    else:
-        bCollectMeshDataOriginal(blenderMeshData,
-                                 selectedObjects,
-                                 apply_modifiers,
-                                 export_colour,
-                                 export_tangents,
-                                 export_binormals,
-                                 export_poses)
+    if not skeleton_only:
+        with metrics.phase('mesh collection', 'vertices') as phase:
+            bCollectMeshData(blenderMeshData,
+                             selectedObjects,
+                             apply_modifiers,
+                             export_colour,
+                             export_tangents,
+                             export_binormals,
+                             export_poses,
+                             max_influences,
+                             enable_by_material,
+                             allow_shared_geometry,
+                             pose_epsilon)
+            phase.count = countVertices(blenderMeshData)
     # materials
-    if export_materials:
-        bCollectMaterialData(blenderMeshData, selectedObjects)
-
-    if export_animation:
-        bCollectAnimationData(blenderMeshData)
+    if export_materials and not skeleton_only:
+        with metrics.phase('material collection', 'materials') as phase:
+            bCollectMaterialData(blenderMeshData, selectedObjects)
+            phase.count = len(blenderMeshData['materials'])
+
+    if export_animation and 'skeleton' in blenderMeshData:
+        with metrics.phase('animation sampling', 'keys') as phase:
+            tolerances = None
+            if reduce_keyframes:
+                tolerances = (position_tolerance, angle_tolerance)
+            actions = filterActions(
+                bArmatureActions(blenderMeshData['skeleton'].armature),
+                action_filter)
+            if split_animations and export_skeleton:
+                options = [scn.render.fps, scn.frame_step, tolerances,
+                           precision, pretty_xml]
+                actions = bChangedActions(blenderMeshData, actions, filepath,
+                                          options, xml_converter is not None)
+            bCollectAnimationData(blenderMeshData, isolate_sampling,
+                                  tolerances, animation_workers, actions)
+            phase.count = countKeyframes(blenderMeshData)
 
     if SHOW_EXPORT_TRACE:
         print(blenderMeshData['materials'])
@@ -1414,24 +1669,43 @@ def save(operator, context, filepath,
         fileWr.write(str(blenderMeshData))
         fileWr.close()
 
+    animationFiles = []
     if export_skeleton:
-        xSaveSkeletonData(blenderMeshData, filepath)
-
-    xSaveMeshData(blenderMeshData, filepath, export_skeleton)
-
-    xSaveMaterialData(filepath,
-                      blenderMeshData,
-                      overwrite_material,
-                      copy_textures)
-
-    if not XMLtoOGREConvert(blenderMeshData,
-                            filepath,
-                            xml_converter,
-                            export_skeleton,
-                            keep_xml,
-                            export_edgelists):
-        operator.report({'WARNING'}, "Failed to convert .xml files to .mesh")
-
+        with metrics.phase('skeleton writing', 'keys') as phase:
+            xSaveSkeletonData(blenderMeshData, filepath, pretty_xml,
+                              numberFormat, not split_animations)
+            animationFiles = xSaveAnimationFiles(blenderMeshData, filepath,
+                                                 pretty_xml, numberFormat)
+            phase.count = countKeyframes(blenderMeshData)
+
+    if not skeleton_only:
+        with metrics.phase('mesh writing', 'vertices') as phase:
+            xSaveMeshData(blenderMeshData, filepath, export_skeleton,
+                          pretty_xml, numberFormat)
+            phase.count = countVertices(blenderMeshData)
+
+        with metrics.phase('material writing', 'materials') as phase:
+            xSaveMaterialData(filepath,
+                              blenderMeshData,
+                              overwrite_material,
+                              copy_textures)
+            phase.count = len(blenderMeshData.get('materials', {}))
+
+    with metrics.phase('conversion', 'files') as phase:
+        converted = XMLtoOGREConvert(blenderMeshData,
+                                     filepath,
+                                     xml_converter,
+                                     export_skeleton,
+                                     keep_xml,
+                                     export_edgelists,
+                                     animationFiles,
+                                     not skeleton_only)
+        phase.count = converted or 0
+    if converted is None:
+        operator.report({'WARNING'}, "Failed to convert .xml files to %s" %
+                        (".skeleton" if skeleton_only else ".mesh"))
+
+    metrics.finish(operator)
     print("done.")
 
     return {'FINISHED'}
@@ -145,14 +145,26 @@ Note: Bones store their OGREID as a custom variable so they are consistent
 from xml.dom import minidom
 import bpy
 from mathutils import Vector, Matrix
+import json
 import math
 import os
 import subprocess
 
+import numpy
+
+from . import config
+from . import imagecache
+from . import keyreduce
+from . import materialcache
+from . import snapshot
+from .metrics import create as createMetrics
+
 SHOW_IMPORT_DUMPS = False
 SHOW_IMPORT_TRACE = False
 DEFAULT_KEEP_XML = False
 MIN_BONE_LENGTH = 0.00001 # Prevent automatic removal of bones
+# custom property of rigs imported with an animation index
+ANIMATION_INDEX = 'OGRE_ANIMATIONS'
 # default blender version of script
 blender_version = 259
 
@@ -322,7 +334,10 @@ def xCollectMeshData(meshData, xmldoc, meshname, dirname, useNormals):
     return meshData
 
 
-def xCollectMaterialData(meshData, materialFiles, folder):
+def xCollectMaterialData(meshData, materialFiles, folder, lookups=None):
+    # lookups collects every texture path checked, found or not
+    if lookups is None:
+        lookups = []
     data = None
     if len(materialFiles) == 1:
         materialFile = materialFiles[0]
@@ -400,9 +415,11 @@ def xCollectMaterialData(meshData, materialFiles, folder):
                 if (count > 0) and ("texture " in line) and ('texture' not in matDict):
                     imageName = (line.split()[1])
                     file = os.path.join(folder, imageName)
+                    lookups.append(file)
                     if(not os.path.isfile(file)):
                         # just force to use .dds if there isn't file specified in material file
                         file = os.path.join(folder, os.path.splitext((line.split()[1]))[0] + ".dds")
+                        lookups.append(file)
                         if(os.path.isfile(file)):
                             matDict['texture'] = file
                             matDict['imageNameOnly'] = imageName
@@ -507,13 +524,15 @@ def xCollectPoseData(meshData, xmldoc):
                 data.append((index, x, -z, y))
 
 
-def xGetSkeletonLink(xmldoc, folder, operator):
+def xGetSkeletonLink(xmldoc, folder, operator, lookups=None):
     skeletonFile = "None"
     if(len(xmldoc.getElementsByTagName("skeletonlink")) > 0):
         # get the skeleton link of the mesh
         skeletonLink = xmldoc.getElementsByTagName("skeletonlink")[0]
         skeletonName = skeletonLink.getAttribute("name")
         skeletonFile = os.path.join(folder, skeletonName)
+        if lookups is not None:
+            lookups.append(skeletonFile)
         # check for existence of skeleton file
         if not os.path.isfile(skeletonFile):
             operator.report({'WARNING'}, "Cannot find linked skeleton file '" +
@@ -772,57 +791,94 @@ def xGetChild(node, tag):
     return None
 
 
-def xAnalyseFPS(xDoc):
-    fps = 0
-    lastTime = 1e8
-    samples = 0
+def xIndexAnimations(xDoc):
+    """Name, length and track count of each animation, only key times are
+       read.
+
+       @return (index, sample rate of all tracks as in xCollectAnimations)
+    """
+    index = []
+    steps = []
     for container in xDoc.getElementsByTagName('animations'):
         for animation in container.childNodes:
             if animation.nodeType == 1 and animation.tagName == 'animation':
-                tracks = xGetChild(animation, 'tracks')
-                for track in tracks.childNodes:
-                    if track.nodeType == 1:
-                        for keyframe in xGetChild(track, 'keyframes').childNodes:
-                            if keyframe.nodeType == 1:
-                                time = float(keyframe.getAttribute('time'))
-                                if time > lastTime:
-                                    fps = max(fps, 1 / (time - lastTime))
-                                lastTime = time
-                                samples = samples + 1
-                                if samples > 100:
-                                    return round(fps, 2)    # stop here
-    return round(fps, 2)
-
-
-def xCollectAnimations(meshData, xDoc, integerFrames=True):
+                tracks = [track for track in
+                          xGetChild(animation, 'tracks').childNodes
+                          if track.nodeType == 1]
+                index.append({'name': animation.getAttribute('name'),
+                              'length': float(animation.getAttribute('length')),
+                              'tracks': len(tracks)})
+                for track in tracks:
+                    times = [float(keyframe.getAttribute('time')) for keyframe
+                             in xGetChild(track, 'keyframes').childNodes
+                             if keyframe.nodeType == 1]
+                    steps.append(numpy.diff(times))
+    return index, sampleRate(steps)
+
+
+def xCollectAnimations(meshData, xDoc, names=None):
+    """Decode animations in one pass over their keyframes, only those in
+       names if given.
+
+       Key times stay in seconds, see keysToFrames. Also sets
+       meshData['animationStats'], (bone, keys, duration) of every track
+       by animation, and meshData['sampleRate'], the most common step
+       between keys over all tracks as a rate, 0 if there is none.
+    """
     if 'animations' not in meshData:
         meshData['animations'] = {}
+    stats = meshData.setdefault('animationStats', {})
+    steps = []
     for container in xDoc.getElementsByTagName('animations'):
         for animation in container.childNodes:
             if animation.nodeType == 1 and animation.tagName == 'animation':
                 name = animation.getAttribute('name')
+                if names is not None and name not in names:
+                    continue
 
                 # read action data
                 action = {}
                 tracks = xGetChild(animation, 'tracks')
-                xReadAnimation(action, tracks.childNodes, integerFrames)
+                trackTimes = xReadAnimation(action, tracks.childNodes)
                 meshData['animations'][name] = action
-
-
-def xReadAnimation(action, tracks, integerFrames=True):
-    fps = bpy.context.scene.render.fps
+                stats[name] = [(bone, len(times),
+                                float(times[-1] - times[0]) if len(times) else 0.0)
+                               for bone, times in trackTimes]
+                steps.extend(numpy.diff(times) for bone, times in trackTimes)
+    meshData['sampleRate'] = sampleRate(steps)
+
+
+def sampleRate(steps):
+    """Rate of the most common positive step between key times."""
+    steps = numpy.concatenate(steps) if steps else numpy.zeros(0)
+    steps = steps[steps > 1e-6]
+    if not len(steps):
+        return 0
+    # time attributes are written with few decimals, group the steps and
+    # average the biggest group
+    groups = numpy.round(steps, 3)
+    values, counts = numpy.unique(groups, return_counts=True)
+    common = steps[groups == values[numpy.argmax(counts)]]
+    return round(float(1.0 / common.mean()), 2)
+
+
+def xReadAnimation(action, tracks):
+    """Read the keys of the tracks, with their times in seconds.
+
+       @return (bone, key times array) of each track.
+    """
+    trackTimes = []
     for track in tracks:
         if track.nodeType != 1:
             continue
         target = track.getAttribute('bone')
         action[target] = trackData = [[] for i in range(3)]  # pos, rot, scl
+        times = []
         for keyframe in xGetChild(track, 'keyframes').childNodes:
             if keyframe.nodeType != 1:
                 continue
             time = float(keyframe.getAttribute('time'))
-            frame = time * fps
-            if integerFrames:
-                frame = round(frame)
+            times.append(time)
             for key in keyframe.childNodes:
                 if key.nodeType != 1:
                     continue
@@ -830,7 +886,7 @@ def xReadAnimation(action, tracks, integerFrames=True):
                     x = float(key.getAttribute('x'))
                     y = float(key.getAttribute('y'))
                     z = float(key.getAttribute('z'))
-                    trackData[0].append([frame, (x, y, z)])
+                    trackData[0].append([time, (x, y, z)])
                 elif key.tagName == 'rotate':
                     axis = xGetChild(key, 'axis')
                     angle = key.getAttribute('angle')
@@ -840,15 +896,58 @@ def xReadAnimation(action, tracks, integerFrames=True):
                     # skip if axis contains #INF or #IND
                     if '#' not in x and '#' not in y and '#' not in z:
                         quat = quaternionFromAngleAxis(float(angle), float(z), float(x), float(y))
-                        trackData[1].append([frame, quat])
+                        trackData[1].append([time, quat])
                 elif key.tagName == 'scale':
                     x = float(key.getAttribute('x'))
                     y = float(key.getAttribute('y'))
                     z = float(key.getAttribute('z'))
-                    trackData[2].append([frame, (-x, z, y)])
-
-
-def bCreateAnimations(meshData):
+                    trackData[2].append([time, (-x, z, y)])
+        trackTimes.append((target, numpy.array(times)))
+    return trackTimes
+
+
+def keysToFrames(animations, fps, integerFrames=True):
+    """Turn key times in seconds into frames at fps."""
+    for action in animations.values():
+        for trackData in action.values():
+            for keys in trackData:
+                for key in keys:
+                    frame = key[0] * fps
+                    key[0] = round(frame) if integerFrames else frame
+
+
+def xDecodeAnimations(meshData, xDoc, integerFrames=True, resampleFps=0,
+                      tolerances=None, names=None, adjustFps=False):
+    """Decode animations and thin their keys out before F-curves exist.
+
+       @param resampleFps Set the scene to this frame rate and resample
+              every track to whole frames. 0 keeps the keys.
+       @param tolerances (position, angle) tolerances for dropping keys, or
+              None to keep them all.
+       @param adjustFps Set the scene frame rate to the detected sample
+              rate of the animations.
+    """
+    xCollectAnimations(meshData, xDoc, names)
+    scene = bpy.context.scene
+    fps = meshData['sampleRate']
+    if fps and adjustFps:
+        print("Setting FPS to", fps)
+        scene.render.fps = int(round(fps))
+    if resampleFps:
+        print("Resampling animations to", resampleFps, "FPS")
+        scene.render.fps = resampleFps
+        integerFrames = False
+    keysToFrames(meshData['animations'], scene.render.fps, integerFrames)
+    if resampleFps or tolerances:
+        for action in meshData['animations'].values():
+            for trackData in action.values():
+                if resampleFps:
+                    keyreduce.resampleTrackData(trackData)
+                if tolerances:
+                    keyreduce.reduceTrackData(trackData, *tolerances)
+
+
+def bCreateAnimations(meshData, linearKeys=False):
     path_id = ['location', 'rotation_quaternion', 'scale']
 
     if 'animations' in meshData:
@@ -856,15 +955,16 @@ def bCreateAnimations(meshData):
         rig.animation_data_create()
         animdata = rig.animation_data
 
-        # calculate transformation matrices for translation
+        # calculate transformation matrices for translation, from the rest
+        # pose as an existing rig may be posed
         mat = {}
         fix1 = Matrix([(1, 0, 0), (0, 0, 1), (0, -1, 0)])
         fix2 = Matrix([(0, 1, 0), (0, 0, 1), (1, 0, 0)])
-        for bone in rig.pose.bones:
+        for bone in rig.data.bones:
             if bone.parent:
-                mat[bone.name] = fix2 * bone.parent.matrix.to_3x3().transposed() * bone.matrix.to_3x3()
+                mat[bone.name] = fix2 * bone.parent.matrix_local.to_3x3().transposed() * bone.matrix_local.to_3x3()
             else:
-                mat[bone.name] = fix1 * bone.matrix.to_3x3()
+                mat[bone.name] = fix1 * bone.matrix_local.to_3x3()
 
         for name in sorted(meshData['animations'].keys(), reverse=True):
             action = bpy.data.actions.new(name)
@@ -906,6 +1006,10 @@ def bCreateAnimations(meshData):
                             for key in data[i]:
                                 curve.keyframe_points.insert(key[0],
                                                              key[1][channel])
+                            # reduced keys assume linear interpolation
+                            if linearKeys:
+                                for point in curve.keyframe_points:
+                                    point.interpolation = 'LINEAR'
 
             # Add action to NLA track
             track = animdata.nla_tracks.new()
@@ -913,16 +1017,71 @@ def bCreateAnimations(meshData):
             track.mute = True
             track.strips.new(name, 0, action)
 
+
+def xCollectBoneIDs(xDoc):
+    """Bone name to Ogre bone id (as string) of a skeleton document."""
+    boneIDs = {}
+    for bones in xDoc.getElementsByTagName('bones'):
+        for bone in bones.childNodes:
+            if bone.localName == 'bone':
+                boneIDs[bone.getAttribute('name')] = bone.getAttribute('id')
+    return boneIDs
+
+
+def mapAnimationTracks(animations, boneIDs, boneMap, boneNames):
+    """Retarget animation tracks from skeleton bone names to armature bones.
+
+       Tracks follow the Ogre bone id (see getBoneNameMapFromArmature), a
+       bone of the same name is the fallback.
+       @return Names of the tracks without a bone, they are dropped.
+    """
+    missing = set()
+    for name, action in animations.items():
+        mapped = {}
+        for target, trackData in action.items():
+            bone = boneMap.get(boneIDs.get(target))
+            if bone is None and target in boneNames:
+                bone = target
+            if bone is None:
+                missing.add(target)
+                continue
+            mapped[bone] = trackData
+        animations[name] = mapped
+    return sorted(missing)
+
+
+def bStoreAnimationIndex(rig, skeletonFile, index, integerFrames,
+                         resampleFps=0, tolerances=None):
+    rig[ANIMATION_INDEX] = json.dumps({'file': skeletonFile,
+                                       'integerFrames': integerFrames,
+                                       'resampleFps': resampleFps,
+                                       'tolerances': tolerances,
+                                       'animations': index})
+
+
+def bAnimationIndex(rig):
+    """The animation index stored on the rig, or None."""
+    if ANIMATION_INDEX not in rig:
+        return None
+    return json.loads(rig[ANIMATION_INDEX])
+
+
+def bLoadedAnimations(rig):
+    """Names of the NLA tracks, one per imported animation."""
+    if not rig.animation_data:
+        return set()
+    return set(track.name for track in rig.animation_data.nla_tracks)
+
 ###############################################################################
 
 
-def bCreateMesh(meshData, folder, name, filepath):
+def bCreateMesh(meshData, folder, name, filepath, deferTextures=False):
     if 'skeleton' in meshData:
         skeletonName = meshData['skeletonName']
         bCreateSkeleton(meshData, skeletonName)
 
     # from collected data create all sub meshes
-    subObjs = bCreateSubMeshes(meshData, name)
+    subObjs = bCreateSubMeshes(meshData, name, deferTextures)
     # skin submeshes
     # bSkinMesh(subObjs)
 
@@ -1115,7 +1274,7 @@ def bMergeVertices(subMesh):
             face[i] = map[face[i]]
 
 
-def bCreateSubMeshes(meshData, meshName):
+def bCreateSubMeshes(meshData, meshName, deferTextures=False):
     allObjects = []
     submeshes = meshData['submeshes']
 
@@ -1193,38 +1352,33 @@ def bCreateSubMeshes(meshData, meshName):
                 texturePath = matInfo['texture']
                 if texturePath:
                     hasTexture = True
-                    # try to find among already loaded images
-                    tex = None
-                    for lTex in bpy.data.textures:
-                        if lTex.type == 'IMAGE':
-                            if lTex.image.name == matInfo['imageNameOnly']:
-                                tex = lTex
-                                break
-                    if not tex:
-                        tex = bpy.data.textures.new('ColorTex', type='IMAGE')
-                        tex.image = bpy.data.images.load(texturePath)
-                        tex.use_alpha = True
-
-            # Create shadeless material and MTex
-            mat = bpy.data.materials.new(subMeshName)
-            # ambient
-            if 'ambient' in matInfo:
-                mat.ambient = matInfo['ambient'][0]
-            # diffuse
-            if 'diffuse' in matInfo:
-                mat.diffuse_color = matInfo['diffuse']
-            # specular
-            if 'specular' in matInfo:
-                mat.specular_color = matInfo['specular']
-            # emmisive
-            if 'emissive' in matInfo:
-                mat.emit = matInfo['emissive'][0]
-            mat.use_shadeless = True
-            mtex = mat.texture_slots.add()
-            if hasTexture:
-                mtex.texture = tex
-            mtex.texture_coords = 'UV'
-            mtex.use_map_color_diffuse = True
+                    # each texture file is read once
+                    tex = imagecache.texture(texturePath, deferTextures)
+
+            # identical materials are shared
+            mat = materialcache.find(subMeshName, matInfo)
+            if mat is None:
+                # Create shadeless material and MTex
+                mat = bpy.data.materials.new(subMeshName)
+                # ambient
+                if 'ambient' in matInfo:
+                    mat.ambient = matInfo['ambient'][0]
+                # diffuse
+                if 'diffuse' in matInfo:
+                    mat.diffuse_color = matInfo['diffuse']
+                # specular
+                if 'specular' in matInfo:
+                    mat.specular_color = matInfo['specular']
+                # emmisive
+                if 'emissive' in matInfo:
+                    mat.emit = matInfo['emissive'][0]
+                mat.use_shadeless = True
+                mtex = mat.texture_slots.add()
+                if hasTexture:
+                    mtex.texture = tex
+                mtex.texture_coords = 'UV'
+                mtex.use_map_color_diffuse = True
+                materialcache.register(mat, subMeshName, matInfo)
 
             # add material to object
             ob.data.materials.append(mat)
@@ -1406,26 +1560,75 @@ def getBoneNameMapFromArmature(arm):
     return boneMap
 
 
-def load(operator, context, filepath, xml_converter=None, keep_xml=True,
-         import_normals=True, import_shapekeys=True, import_animations=False,
-         round_frames=False, use_selected_skeleton=False):
-    global blender_version
-
-    blender_version = bpy.app.version[0]*100 + bpy.app.version[1]
-
-    print("loading", str(filepath))
-
-    filepath = filepath
-    pathMeshXml = filepath
-    # get the mesh as .xml file
-    if filepath.lower().endswith(".mesh"):
-        if convertXML(xml_converter, filepath):
-            pathMeshXml = filepath + ".xml"
-        else:
-            operator.report({'ERROR'}, "Failed to convert .mesh files to .xml")
-            return {'CANCELLED'}
-    else:
-        return {'CANCELLED'}
+def countVertices(meshData):
+    count = 0
+    if 'sharedgeometry' in meshData:
+        count += len(meshData['sharedgeometry'].get('positions', []))
+    for subMesh in meshData.get('submeshes', []):
+        if 'geometry' in subMesh:
+            count += len(subMesh['geometry'].get('positions', []))
+    return count
+
+
+def reportAnimationStats(operator, meshData):
+    """Print the track statistics of the decoded animations and report
+       their totals."""
+    stats = meshData.get('animationStats', {})
+    if not stats:
+        return
+    keys = 0
+    tracks = 0
+    for name in sorted(stats):
+        animationKeys = sum(count for bone, count, duration in stats[name])
+        duration = max([duration for bone, count, duration in stats[name]] or
+                       [0.0])
+        print("Animation %s: %d tracks, %d keys, %.3f s" %
+              (name, len(stats[name]), animationKeys, duration))
+        keys += animationKeys
+        tracks += len(stats[name])
+    operator.report({'INFO'}, "Decoded %d animations, %d tracks, %d keys"
+                    " sampled at %g FPS" % (len(stats), tracks, keys,
+                                            meshData.get('sampleRate', 0)))
+
+
+def countKeyframes(meshData):
+    count = 0
+    for action in meshData.get('animations', {}).values():
+        for trackData in action.values():
+            count += len(trackData[0]) + len(trackData[1]) + len(trackData[2])
+    return count
+
+
+def xOpenFileMeasured(filename, metrics):
+    with metrics.phase('xml parsing', 'bytes') as phase:
+        xDoc = xOpenFile(filename)
+        phase.count += os.path.getsize(filename)
+    return xDoc
+
+
+def xCollectData(operator, context, metrics, filepath, xml_converter,
+                 import_normals, import_shapekeys, import_animations,
+                 round_frames, use_selected_skeleton, lazy_animations=False,
+                 resampleFps=0, tolerances=None):
+    """Convert and parse the mesh, its skeleton and materials.
+
+       @return (meshData, xml files created, files looked up besides the
+               .mesh, (folder, pattern) of folders searched for materials),
+               meshData is None if the xml could not be parsed.
+               None if the .mesh could not be converted.
+    """
+    with metrics.phase('conversion', 'files') as phase:
+        converted = convertXML(xml_converter, filepath)
+        phase.count += 1
+    if not converted:
+        operator.report({'ERROR'}, "Failed to convert .mesh files to .xml")
+        return None
+
+    pathMeshXml = filepath + ".xml"
+    xmlFiles = [pathMeshXml]
+    # files looked up, found or not, and folders searched for a snapshot
+    sourceFiles = []
+    sourceListings = []
 
     folder = os.path.split(filepath)[0]
     nameDotMeshDotXml = os.path.split(pathMeshXml)[1]
@@ -1436,8 +1639,10 @@ def load(operator, context, filepath, xml_converter=None, keep_xml=True,
     meshMaterials = []
     nameDotMaterial = onlyName + ".material"
     pathMaterial = os.path.join(folder, nameDotMaterial)
+    sourceFiles.append(pathMaterial)
     if not os.path.isfile(pathMaterial):
         # search directory for .material
+        sourceListings.append((folder, ".material"))
         for filename in os.listdir(folder):
             if ".material" in filename:
                 # material file
@@ -1448,68 +1653,87 @@ def load(operator, context, filepath, xml_converter=None, keep_xml=True,
         meshMaterials.append(pathMaterial)
 
     # try to parse xml file
-    xDocMeshData = xOpenFile(pathMeshXml)
+    xDocMeshData = xOpenFileMeasured(pathMeshXml, metrics)
+    if xDocMeshData == "None":
+        return None, xmlFiles, sourceFiles, sourceListings
 
     meshData = {}
-    if xDocMeshData != "None":
-        # skeleton data
-        # get the mesh as .xml file
-        skeletonFile = xGetSkeletonLink(xDocMeshData, folder, operator)
-
-        # use selected skeleton
-        selectedSkeleton = context.active_object if use_selected_skeleton and context.active_object and context.active_object.type == 'ARMATURE' else None
-        if selectedSkeleton:
-            map = getBoneNameMapFromArmature(selectedSkeleton)
-            if map:
-                meshData['boneIDs'] = map
-                meshData['armature'] = selectedSkeleton
-            else:
-                operator.report({'WARNING'},
-                                "Selected armature has no OGRE data.")
+    # skeleton data
+    # get the mesh as .xml file
+    skeletonFile = xGetSkeletonLink(xDocMeshData, folder, operator,
+                                    sourceFiles)
+
+    # use selected skeleton
+    selectedSkeleton = context.active_object if use_selected_skeleton and context.active_object and context.active_object.type == 'ARMATURE' else None
+    if selectedSkeleton:
+        map = getBoneNameMapFromArmature(selectedSkeleton)
+        if map:
+            meshData['boneIDs'] = map
+            meshData['armature'] = selectedSkeleton
+        else:
+            operator.report({'WARNING'},
+                            "Selected armature has no OGRE data.")
 
-        # there is valid skeleton link and existing file
-        elif(skeletonFile != "None"):
+    # there is valid skeleton link and existing file
+    elif(skeletonFile != "None"):
+        xDocSkeletonData = "None"
+        with metrics.phase('conversion', 'files') as phase:
             if convertXML(xml_converter, skeletonFile):
                 skeletonFileXml = skeletonFile + ".xml"
-
-            # parse .xml skeleton file
-            xDocSkeletonData = xOpenFile(skeletonFileXml)
-            if xDocSkeletonData != "None":
+                xmlFiles.append(skeletonFileXml)
+            phase.count += 1
+
+        # parse .xml skeleton file
+        if len(xmlFiles) > 1:
+            xDocSkeletonData = xOpenFileMeasured(skeletonFileXml, metrics)
+        if xDocSkeletonData != "None":
+            with metrics.phase('skeleton preparation', 'bones') as phase:
                 xCollectBoneData(meshData, xDocSkeletonData)
                 meshData['skeletonName'] = os.path.basename(skeletonFile[:-9])
+                phase.count = len(meshData['boneIDs'])
 
-                # parse animations
-                if import_animations:
-                    fps = xAnalyseFPS(xDocSkeletonData)
+            # index animations, they are decoded on demand
+            if import_animations and lazy_animations:
+                with metrics.phase('animation indexing',
+                                   'animations') as phase:
+                    index, fps = xIndexAnimations(xDocSkeletonData)
                     if(fps and round_frames):
                         print("Setting FPS to", fps)
-                        bpy.context.scene.render.fps = fps
-                    xCollectAnimations(meshData,
-                                       xDocSkeletonData,
-                                       round_frames)
+                        bpy.context.scene.render.fps = int(round(fps))
+                    meshData['animationIndex'] = index
+                    meshData['skeletonFile'] = skeletonFile
+                    phase.count = len(meshData['animationIndex'])
+
+            # parse animations
+            elif import_animations:
+                with metrics.phase('animation decoding', 'keys') as phase:
+                    xDecodeAnimations(meshData,
+                                      xDocSkeletonData,
+                                      round_frames,
+                                      resampleFps,
+                                      tolerances,
+                                      adjustFps=round_frames)
+                    phase.count = countKeyframes(meshData)
 
-            else:
-                operator.report({'WARNING'}, "Failed to load linked skeleton")
-                print("Failed to load linked skeleton")
+        else:
+            operator.report({'WARNING'}, "Failed to load linked skeleton")
+            print("Failed to load linked skeleton")
 
-        # collect mesh data
-        print("collecting mesh data...")
+    # collect mesh data
+    print("collecting mesh data...")
+    with metrics.phase('mesh collection', 'vertices') as phase:
         xCollectMeshData(meshData, xDocMeshData,
                          onlyName, folder, import_normals)
-        xCollectMaterialData(meshData, meshMaterials, folder)
-
-        if import_shapekeys:
+        phase.count = countVertices(meshData)
+    with metrics.phase('material lookup', 'materials') as phase:
+        xCollectMaterialData(meshData, meshMaterials, folder, sourceFiles)
+        phase.count = len(meshData['materials'])
+    sourceFiles.extend(meshMaterials)
+
+    if import_shapekeys:
+        with metrics.phase('pose collection', 'poses') as phase:
             xCollectPoseData(meshData, xDocMeshData)
-
-        # after collecting is done, start creating stuff#
-        # create skeleton (if any) and mesh from parsed data
-        bCreateMesh(meshData, folder, onlyName, pathMeshXml)
-        bCreateAnimations(meshData)
-        if not keep_xml:
-            # cleanup by deleting the XML file we created
-            os.unlink("%s" % pathMeshXml)
-            if 'skeleton' in meshData:
-                os.unlink("%s" % skeletonFileXml)
+            phase.count = len(meshData.get('poses', []))
 
     if SHOW_IMPORT_TRACE:
         print("folder: %s" % folder)
@@ -1520,5 +1744,221 @@ def load(operator, context, filepath, xml_converter=None, keep_xml=True,
         print("pathMaterial: %s" % pathMaterial)
         print("ogreXMLconverter: %s" % xml_converter)
 
+    return meshData, xmlFiles, sourceFiles, sourceListings
+
+
+def load(operator, context, filepath, xml_converter=None, keep_xml=True,
+         import_normals=True, import_shapekeys=True, import_animations=False,
+         round_frames=False, use_selected_skeleton=False,
+         use_snapshot_cache=False, lazy_animations=False,
+         resample_fps=0, reduce_keyframes=False, position_tolerance=1e-4,
+         angle_tolerance=0.0008726646, defer_textures=False):
+    global blender_version
+
+    blender_version = bpy.app.version[0]*100 + bpy.app.version[1]
+
+    print("loading", str(filepath))
+    metrics = createMetrics('import', filepath)
+
+    if not filepath.lower().endswith(".mesh"):
+        return {'CANCELLED'}
+
+    folder = os.path.split(filepath)[0]
+    onlyName = os.path.splitext(os.path.split(filepath)[1])[0]
+    pathMeshXml = filepath + ".xml"
+    tolerances = None
+    if reduce_keyframes:
+        tolerances = (position_tolerance, angle_tolerance)
+
+    # a selected skeleton puts blender objects into meshData, no snapshots
+    snapshotFile = None
+    if use_snapshot_cache and not use_selected_skeleton:
+        # rounded and resampled keys don't depend on the scene frame rate
+        fps = None
+        if not round_frames and not resample_fps:
+            fps = bpy.context.scene.render.fps
+        options = [blender_version, import_normals, import_shapekeys,
+                   import_animations, round_frames, fps, lazy_animations,
+                   resample_fps, tolerances]
+        snapshotFile = snapshot.snapshotPath(
+            bpy.path.abspath(config.get('SNAPSHOT_CACHE_DIR')),
+            snapshot.sourceKey(filepath, options))
+
+    meshData = None
+    xmlFiles = []
+    if snapshotFile:
+        with metrics.phase('snapshot reading', 'vertices') as phase:
+            cached = snapshot.read(snapshotFile)
+            if cached:
+                meshData, extra = cached
+                phase.count = countVertices(meshData)
+        if meshData is not None:
+            print("using snapshot", snapshotFile)
+            if extra.get('fps') and round_frames:
+                print("Setting FPS to", extra['fps'])
+                bpy.context.scene.render.fps = extra['fps']
+
+    if meshData is None:
+        collected = xCollectData(operator, context, metrics, filepath,
+                                 xml_converter, import_normals,
+                                 import_shapekeys, import_animations,
+                                 round_frames, use_selected_skeleton,
+                                 lazy_animations, resample_fps, tolerances)
+        if collected is None:
+            return {'CANCELLED'}
+        meshData, xmlFiles, sourceFiles, sourceListings = collected
+        if meshData is not None and snapshotFile:
+            with metrics.phase('snapshot writing', 'vertices') as phase:
+                try:
+                    snapshot.write(snapshotFile, meshData, sourceFiles,
+                                   {'fps': bpy.context.scene.render.fps},
+                                   sourceListings)
+                    phase.count = countVertices(meshData)
+                except (IOError, OSError) as e:
+                    print("Warning: Could not write snapshot", e)
+
+    if meshData is not None:
+        reportAnimationStats(operator, meshData)
+        # after collecting is done, start creating stuff#
+        # create skeleton (if any) and mesh from parsed data
+        with metrics.phase('mesh building', 'vertices') as phase:
+            bCreateMesh(meshData, folder, onlyName, pathMeshXml,
+                        defer_textures)
+            phase.count = countVertices(meshData)
+        with metrics.phase('animation creation', 'keys') as phase:
+            bCreateAnimations(meshData, reduce_keyframes)
+            phase.count = countKeyframes(meshData)
+        if 'animationIndex' in meshData and 'rig' in meshData:
+            bStoreAnimationIndex(meshData['rig'], meshData['skeletonFile'],
+                                 meshData['animationIndex'], round_frames,
+                                 resample_fps, tolerances)
+
+    if not keep_xml:
+        # cleanup by deleting the XML files we created
+        for xmlFile in xmlFiles:
+            os.unlink("%s" % xmlFile)
+
+    metrics.finish(operator)
     print("done.")
     return {'FINISHED'}
+
+
+def bApplyAnimations(operator, rig, xDoc, integerFrames, metrics,
+                     resampleFps=0, tolerances=None, names=None,
+                     adjustFps=False):
+    """Decode the animations of a skeleton document and build them on rig.
+
+       Tracks are matched to the bones of the rig through their OGREID, see
+       mapAnimationTracks.
+    """
+    meshData = {'rig': rig}
+    with metrics.phase('animation decoding', 'keys') as phase:
+        xDecodeAnimations(meshData, xDoc, integerFrames, resampleFps,
+                          tolerances, names, adjustFps)
+        phase.count = countKeyframes(meshData)
+    reportAnimationStats(operator, meshData)
+
+    boneMap = getBoneNameMapFromArmature(rig)
+    if not boneMap:
+        operator.report({'WARNING'},
+                        "Selected armature has no OGRE data, matching bones"
+                        " by name")
+    missing = mapAnimationTracks(meshData['animations'],
+                                 xCollectBoneIDs(xDoc), boneMap,
+                                 rig.data.bones.keys())
+    if missing:
+        print("Tracks without bone:", ", ".join(missing))
+        operator.report({'WARNING'}, "%d animated bones not found in %s" %
+                        (len(missing), rig.name))
+
+    with metrics.phase('animation creation', 'keys') as phase:
+        bCreateAnimations(meshData, tolerances is not None)
+        phase.count = countKeyframes(meshData)
+
+
+def loadAnimations(operator, context, filepath, xml_converter=None,
+                   keep_xml=False, round_frames=True, lazy_animations=False,
+                   resample_fps=0, reduce_keyframes=False,
+                   position_tolerance=1e-4, angle_tolerance=0.0008726646):
+    """Import the animations of a .skeleton onto the active armature.
+
+       The bones of the file are not built. With lazy_animations only an
+       index of the animations is stored on the armature, see
+       loadIndexedAnimations.
+    """
+    rig = context.active_object
+    if not rig or rig.type != 'ARMATURE':
+        operator.report({'ERROR'}, "Select the armature to animate")
+        return {'CANCELLED'}
+
+    print("loading animations", str(filepath))
+    metrics = createMetrics('import', filepath)
+
+    with metrics.phase('conversion', 'files') as phase:
+        converted = convertXML(xml_converter, filepath)
+        phase.count += 1
+    if not converted:
+        operator.report({'ERROR'}, "Failed to convert .skeleton file to .xml")
+        return {'CANCELLED'}
+    xmlFile = filepath if filepath.endswith('.xml') else filepath + '.xml'
+
+    xDoc = xOpenFileMeasured(xmlFile, metrics)
+    if xDoc == "None":
+        return {'CANCELLED'}
+    tolerances = None
+    if reduce_keyframes:
+        tolerances = (position_tolerance, angle_tolerance)
+
+    if lazy_animations:
+        with metrics.phase('animation indexing', 'animations') as phase:
+            index, fps = xIndexAnimations(xDoc)
+            if(fps and round_frames):
+                print("Setting FPS to", fps)
+                bpy.context.scene.render.fps = int(round(fps))
+            bStoreAnimationIndex(rig, os.path.abspath(filepath), index,
+                                 round_frames, resample_fps, tolerances)
+            phase.count = len(index)
+    else:
+        bApplyAnimations(operator, rig, xDoc, round_frames, metrics,
+                         resample_fps, tolerances, adjustFps=round_frames)
+
+    if not keep_xml and xmlFile != filepath:
+        os.unlink(xmlFile)
+
+    metrics.finish(operator)
+    print("done.")
+    return {'FINISHED'}
+
+
+def loadIndexedAnimations(operator, context, rig, names, xml_converter=None):
+    """Decode and build animations listed in the index stored on the rig."""
+    index = bAnimationIndex(rig)
+    if index is None:
+        return {'CANCELLED'}
+    filepath = index['file']
+    if not os.path.isfile(filepath):
+        operator.report({'ERROR'}, "Cannot find skeleton file '%s'" %
+                        filepath)
+        return {'CANCELLED'}
+    metrics = createMetrics('import', filepath)
+
+    xmlFile = filepath if filepath.endswith('.xml') else filepath + '.xml'
+    created = not os.path.isfile(xmlFile)
+    with metrics.phase('conversion', 'files') as phase:
+        converted = convertXML(xml_converter, filepath)
+        phase.count += 1
+    if not converted:
+        operator.report({'ERROR'}, "Failed to convert .skeleton file to .xml")
+        return {'CANCELLED'}
+    xDoc = xOpenFileMeasured(xmlFile, metrics)
+    if created:
+        os.unlink(xmlFile)
+    if xDoc == "None":
+        return {'CANCELLED'}
+
+    bApplyAnimations(operator, rig, xDoc, index['integerFrames'], metrics,
+                     index.get('resampleFps', 0), index.get('tolerances'),
+                     set(names))
+
+    metrics.finish(operator)
+    return {'FINISHED'}
@@ -148,6 +148,7 @@ import bpy
 import logging
 from bpy.props import (BoolProperty,
                        FloatProperty,
+                       IntProperty,
                        StringProperty,
                        EnumProperty,
                        )
@@ -157,6 +158,9 @@ from bpy_extras.io_utils import (ExportHelper,
                                  axis_conversion,
                                  )
 from . import config
+from . import metrics
+from . import precision
+from . import texloader
 
 
 def findConverter(p):
@@ -190,12 +194,102 @@ class OgreTlAddonPreferences(bpy.types.AddonPreferences):
         update=apply_preferences_to_config
     )
 
+    METRICS_ENABLED = bpy.props.BoolProperty(
+        name="Collect timing metrics",
+        description="Time each import/export phase and report a summary",
+        default=config.CONFIG['METRICS_ENABLED'],
+        update=apply_preferences_to_config
+    )
+
+    METRICS_FILE = bpy.props.StringProperty(
+        name="Metrics file",
+        description="Append the timing summary of every import/export to\
+             this file as JSON lines. Leave empty to only report it",
+        subtype='FILE_PATH',
+        default=config.CONFIG['METRICS_FILE'],
+        update=apply_preferences_to_config
+    )
+
+    PROFILE_MEMORY = bpy.props.BoolProperty(
+        name="Profile memory",
+        description="Record the memory high water mark and top allocation\
+             sites of each phase (slow)",
+        default=config.CONFIG['PROFILE_MEMORY'],
+        update=apply_preferences_to_config
+    )
+
+    PROFILE_CPU = bpy.props.BoolProperty(
+        name="Profile with cProfile",
+        description="Write a .pstats profile of the whole import/export\
+             next to the file",
+        default=config.CONFIG['PROFILE_CPU'],
+        update=apply_preferences_to_config
+    )
+
+    SNAPSHOT_CACHE_DIR = bpy.props.StringProperty(
+        name="Snapshot cache",
+        description="Folder for binary snapshots of parsed .mesh files",
+        subtype='DIR_PATH',
+        default=config.CONFIG['SNAPSHOT_CACHE_DIR'],
+        update=apply_preferences_to_config
+    )
+
     def draw(self, context):
         layout = self.layout
         layout.prop(self, "OGRETOOLS_XML_CONVERTER")
+        layout.prop(self, "SNAPSHOT_CACHE_DIR")
+
+        timing = layout.box()
+        timing.prop(self, "METRICS_ENABLED")
+        metricsFile = timing.column()
+        metricsFile.enabled = self.METRICS_ENABLED
+        metricsFile.prop(self, "METRICS_FILE")
+        timing.prop(self, "PROFILE_MEMORY")
+        timing.prop(self, "PROFILE_CPU")
+
+
+class KeyReductionOptions(object):
+    '''Keyframe reduction properties of the importers and the exporter'''
+    reduce_keyframes = BoolProperty(
+            name="Reduce keyframes",
+            description="Drop the keys that linear, or for rotations\
+                 spherical, interpolation between their neighbours\
+                 reproduces within the tolerances",
+            default=False,
+            )
+
+    position_tolerance = FloatProperty(
+            name="Position tolerance",
+            description="Largest translation or scale error a dropped\
+                 key may cause",
+            default=1e-4,
+            min=0.0,
+            precision=5,
+            )
+
+    angle_tolerance = FloatProperty(
+            name="Angle tolerance",
+            description="Largest rotation error a dropped key may cause",
+            default=0.0008726646,
+            min=0.0,
+            subtype='ANGLE',
+            )
 
 
-class ImportOgre(bpy.types.Operator, ImportHelper):
+class KeyframeImportOptions(KeyReductionOptions):
+    '''Keyframe properties of the importers'''
+    resample_fps = IntProperty(
+            name="Resample FPS",
+            description="Set the scene to this frame rate and resample the\
+                 animations to whole frames of it. 0 keeps the keys as\
+                 they are",
+            default=0,
+            min=0,
+            max=240,
+            )
+
+
+class ImportOgre(bpy.types.Operator, ImportHelper, KeyframeImportOptions):
     '''Load an Ogre MESH File'''
     bl_idname = "import_scene.mesh"
     bl_label = "Import MESH"
@@ -227,12 +321,35 @@ class ImportOgre(bpy.types.Operator, ImportHelper):
             default=True,
             )
 
+    lazy_animations = BoolProperty(
+            name="Index animations only",
+            description="Only list the animations at import. Build the ones\
+                 you need later from the Ogre Animations panel of the\
+                 armature",
+            default=False,
+            )
+
     import_shapekeys = BoolProperty(
             name="Import shape keys",
             description="Import shape keys (morphs)",
             default=True,
             )
 
+    use_snapshot_cache = BoolProperty(
+            name="Use snapshot cache",
+            description="Reuse the parsed data of an unchanged .mesh from\
+                 the snapshot cache instead of converting and parsing it\
+                 again",
+            default=False,
+            )
+
+    defer_textures = BoolProperty(
+            name="Load textures in background",
+            description="Show placeholder textures at first and load the\
+                 texture files after the import, without blocking it",
+            default=False,
+            )
+
     use_selected_skeleton = BoolProperty(
             name='Use selected skeleton',
             description='Link with selected armature object rather than\
@@ -258,14 +375,22 @@ class ImportOgre(bpy.types.Operator, ImportHelper):
         print('converter', keywords['xml_converter'])
 
         bpy.context.window.cursor_set("WAIT")
-        result = OgreImport.load(self, context, **keywords)
+        result = metrics.profileCall(self.filepath, OgreImport.load,
+                                     self, context, **keywords)
         bpy.context.window.cursor_set("DEFAULT")
+        if texloader.busy():
+            if bpy.app.background:
+                texloader.bindAll()
+            else:
+                bpy.ops.ogre.bind_textures('INVOKE_DEFAULT')
         return result
 
     def draw(self, context):
         layout = self.layout
 
         layout.prop(self, "keep_xml")
+        layout.prop(self, "use_snapshot_cache")
+        layout.prop(self, "defer_textures")
         layout.prop(self, "import_normals")
         layout.prop(self, "import_shapekeys")
 
@@ -281,11 +406,193 @@ class ImportOgre(bpy.types.Operator, ImportHelper):
         rate = layout.column()
         rate.enabled = self.import_animations
         rate.prop(self, "round_frames")
+        rate.prop(self, "resample_fps")
+        rate.prop(self, "reduce_keyframes")
+        tolerances = rate.column()
+        tolerances.prop(self, "position_tolerance")
+        tolerances.prop(self, "angle_tolerance")
+        tolerances.enabled = self.reduce_keyframes
+        rate.prop(self, "lazy_animations")
+
+
+class ImportOgreAnimations(bpy.types.Operator, ImportHelper,
+                           KeyframeImportOptions):
+    '''Load the animations of an Ogre SKELETON File onto the selected armature'''
+    bl_idname = "import_anim.ogre_skeleton"
+    bl_label = "Import Animations"
+    bl_options = {'PRESET'}
+
+    filename_ext = ".skeleton"
+
+    keep_xml = BoolProperty(
+            name="Keep XML",
+            description="Keeps the XML file when converting from .SKELETON",
+            default=False,
+            )
+
+    round_frames = BoolProperty(
+            name="Adjust frame rate",
+            description="Adjust scene frame rate to match imported animation",
+            default=True,
+            )
+
+    lazy_animations = BoolProperty(
+            name="Index animations only",
+            description="Only list the animations at import. Build the ones\
+                 you need later from the Ogre Animations panel of the\
+                 armature",
+            default=False,
+            )
+
+    filter_glob = StringProperty(
+            default="*.skeleton;*.SKELETON;*.xml;*.XML",
+            options={'HIDDEN'},
+            )
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and \
+            context.active_object.type == 'ARMATURE'
+
+    def execute(self, context):
+        from . import OgreImport
+
+        keywords = self.as_keywords(ignore=("filter_glob",))
+        keywords['xml_converter'] = findConverter(config.get('OGRETOOLS_XML_CONVERTER'))
+
+        bpy.context.window.cursor_set("WAIT")
+        result = metrics.profileCall(self.filepath, OgreImport.loadAnimations,
+                                     self, context, **keywords)
+        bpy.context.window.cursor_set("DEFAULT")
+        return result
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.prop(self, "keep_xml")
+        layout.prop(self, "round_frames")
+        layout.prop(self, "resample_fps")
+        layout.prop(self, "reduce_keyframes")
+        tolerances = layout.column()
+        tolerances.prop(self, "position_tolerance")
+        tolerances.prop(self, "angle_tolerance")
+        tolerances.enabled = self.reduce_keyframes
+        layout.prop(self, "lazy_animations")
+
+
+class BindOgreTextures(bpy.types.Operator):
+    '''Load the texture files of imports into their placeholder images'''
+    bl_idname = "ogre.bind_textures"
+    bl_label = "Bind Ogre Textures"
+
+    running = False
+
+    def invoke(self, context, event):
+        # one timer serves all imports
+        if BindOgreTextures.running:
+            return {'CANCELLED'}
+        BindOgreTextures.running = True
+        self.timer = context.window_manager.event_timer_add(
+            0.02, context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        if texloader.bindReady():
+            for area in context.screen.areas:
+                area.tag_redraw()
+        if texloader.busy():
+            return {'PASS_THROUGH'}
+        context.window_manager.event_timer_remove(self.timer)
+        BindOgreTextures.running = False
+        return {'FINISHED'}
+
+
+def hasAnimationIndex(context):
+    from . import OgreImport
+    ob = context.active_object
+    return ob is not None and ob.type == 'ARMATURE' and \
+        OgreImport.ANIMATION_INDEX in ob
+
+
+class LoadOgreAnimation(bpy.types.Operator):
+    '''Build an animation from the index of the armature'''
+    bl_idname = "ogre.load_animation"
+    bl_label = "Load Animation"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    name = StringProperty(
+            name="Animation",
+            description="Animation to build. Empty builds all that are not\
+                 built yet",
+            default="",
+            )
+
+    @classmethod
+    def poll(cls, context):
+        return hasAnimationIndex(context)
+
+    def execute(self, context):
+        from . import OgreImport
+
+        rig = context.active_object
+        if self.name:
+            names = [self.name]
+        else:
+            loaded = OgreImport.bLoadedAnimations(rig)
+            index = OgreImport.bAnimationIndex(rig)
+            names = [animation['name'] for animation in index['animations']
+                     if animation['name'] not in loaded]
+        if not names:
+            return {'CANCELLED'}
+
+        bpy.context.window.cursor_set("WAIT")
+        result = OgreImport.loadIndexedAnimations(
+            self, context, rig, names,
+            findConverter(config.get('OGRETOOLS_XML_CONVERTER')))
+        bpy.context.window.cursor_set("DEFAULT")
+        return result
+
+
+class OgreAnimationsPanel(bpy.types.Panel):
+    bl_label = "Ogre Animations"
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_context = 'data'
+
+    @classmethod
+    def poll(cls, context):
+        return hasAnimationIndex(context)
+
+    def draw(self, context):
+        from . import OgreImport
+        import os
+
+        layout = self.layout
+        rig = context.active_object
+        index = OgreImport.bAnimationIndex(rig)
+        loaded = OgreImport.bLoadedAnimations(rig)
+
+        layout.label(text=os.path.basename(index['file']))
+        layout.operator(LoadOgreAnimation.bl_idname,
+                        text="Load All").name = ""
+        for animation in index['animations']:
+            row = layout.row()
+            row.label(text=animation['name'])
+            row.label(text="%.2fs, %d tracks" % (animation['length'],
+                                                 animation['tracks']))
+            if animation['name'] in loaded:
+                row.label(text="", icon='FILE_TICK')
+            else:
+                row.operator(LoadOgreAnimation.bl_idname, text="",
+                             icon='IMPORT').name = animation['name']
 
 ###############################################################################
 
 
-class ExportOgre(bpy.types.Operator, ExportHelper):
+class ExportOgre(bpy.types.Operator, ExportHelper, KeyReductionOptions):
     '''Export a Torchlight MESH File'''
 
     bl_idname = "export_scene.mesh"
@@ -294,6 +601,21 @@ class ExportOgre(bpy.types.Operator, ExportHelper):
 
     filename_ext = ".mesh"
 
+    pretty_xml = BoolProperty(
+            name="Pretty xml",
+            description="Indent the written .xml files. Compact files are\
+                 smaller and faster to write",
+            default=True,
+            )
+
+    precision = EnumProperty(
+            name="Precision",
+            description="Decimals written for positions, normals, uvs,\
+                 weights, key times and rotations",
+            items=precision.PROFILE_ITEMS,
+            default=precision.DEFAULT_PROFILE,
+            )
+
     export_edgelists = BoolProperty(
             name="Export edge lists",
             description="Export edge list data for the mesh",
@@ -331,6 +653,14 @@ class ExportOgre(bpy.types.Operator, ExportHelper):
             default=False,
             )
 
+    allow_shared_geometry = BoolProperty(
+            name="Allow shared geometry",
+            description="Let all submeshes share one vertex buffer when that\
+                 makes the mesh smaller. Torchlight does not load meshes\
+                 with shared geometry",
+            default=False,
+            )
+
     keep_xml = BoolProperty(
             name="Keep XML",
             description="Keeps the XML file when converting to .MESH",
@@ -355,6 +685,15 @@ class ExportOgre(bpy.types.Operator, ExportHelper):
             default=False,
             )
 
+    pose_epsilon = FloatProperty(
+            name="Pose epsilon",
+            description="Shape key offsets smaller than this are not\
+                 exported",
+            default=1e-5,
+            min=0.0,
+            precision=6,
+            )
+
     export_materials = BoolProperty(
             name="Export materials",
             description="Export material files.",
@@ -389,6 +728,55 @@ class ExportOgre(bpy.types.Operator, ExportHelper):
             default=False,
             )
 
+    skeleton_only = BoolProperty(
+            name="Skeleton only",
+            description="Write and convert only the .skeleton of the selected\
+                 armature, or of the armature of the selected mesh. Mesh and\
+                 materials are not collected or written",
+            default=False,
+            )
+
+    action_filter = StringProperty(
+            name="Actions",
+            description="Export only the actions whose names match one of\
+                 these comma separated patterns, like 'run*, idle'. Empty\
+                 exports all actions",
+            default="",
+            )
+
+    split_animations = BoolProperty(
+            name="Skeleton file per action",
+            description="Write every action to its own skeleton file and\
+                 skip actions that did not change since the last export",
+            default=False,
+            )
+
+    isolate_sampling = BoolProperty(
+            name="Isolate rig while sampling",
+            description="When animations have to be sampled frame by frame,\
+                 turn off modifiers of objects the rig does not depend on\
+                 until sampling is done",
+            default=True,
+            )
+
+    animation_workers = IntProperty(
+            name="Animation workers",
+            description="Sample actions in this many background Blender\
+                 processes at once. 1 samples them in this session",
+            default=1,
+            min=1,
+            max=32,
+            )
+
+    max_influences = IntProperty(
+            name="Max bone influences",
+            description="Keep only the heaviest bone weights of each vertex\
+                 and renormalize them. 4 suits hardware skinning",
+            default=4,
+            min=1,
+            max=8,
+            )
+
     filter_glob = StringProperty(
             default="*.mesh;*.MESH;.xml;.XML",
             options={'HIDDEN'},
@@ -408,7 +796,8 @@ class ExportOgre(bpy.types.Operator, ExportHelper):
         keywords['xml_converter'] = findConverter(config.get('OGRETOOLS_XML_CONVERTER'))
 
         bpy.context.window.cursor_set("WAIT")
-        result = OgreExport.save(self, context, **keywords)
+        result = metrics.profileCall(self.filepath, OgreExport.save,
+                                     self, context, **keywords)
         bpy.context.window.cursor_set("DEFAULT")
         return result
 
@@ -417,15 +806,22 @@ class ExportOgre(bpy.types.Operator, ExportHelper):
 
         xml = layout.box()
         xml.prop(self, "keep_xml")
+        xml.prop(self, "pretty_xml")
+        xml.prop(self, "precision")
 
         mesh = layout.box()
         mesh.prop(self, "export_edgelists")
         mesh.prop(self, "enable_by_material")
+        mesh.prop(self, "allow_shared_geometry")
         mesh.prop(self, "export_tangents")
         mesh.prop(self, "export_binormals")
         mesh.prop(self, "export_colour")
         mesh.prop(self, "apply_transform")
         mesh.prop(self, "apply_modifiers")
+        mesh.prop(self, "export_poses")
+        poses = mesh.column()
+        poses.prop(self, "pose_epsilon")
+        poses.enabled = self.export_poses
 
         material = layout.box()
         material.prop(self, "export_materials")
@@ -435,14 +831,29 @@ class ExportOgre(bpy.types.Operator, ExportHelper):
         materialOps.enabled = True
 
         skeleton = layout.box()
+        skeleton.prop(self, "skeleton_only")
         skeleton.prop(self, "export_skeleton")
         skeleton.prop(self, "export_animation")
+        sampling = skeleton.column()
+        sampling.prop(self, "action_filter")
+        sampling.prop(self, "split_animations")
+        sampling.prop(self, "isolate_sampling")
+        sampling.prop(self, "reduce_keyframes")
+        tolerances = sampling.column()
+        tolerances.prop(self, "position_tolerance")
+        tolerances.prop(self, "angle_tolerance")
+        tolerances.enabled = self.reduce_keyframes
+        sampling.prop(self, "animation_workers")
+        sampling.enabled = self.export_animation
+        skeleton.prop(self, "max_influences")
 
 ###############################################################################
 
 
 def menu_func_import(self, context):
     self.layout.operator(ImportOgre.bl_idname, text="Torchlight OGRE (.mesh)")
+    self.layout.operator(ImportOgreAnimations.bl_idname,
+                         text="Torchlight OGRE animations (.skeleton)")
 
 
 def menu_func_export(self, context):
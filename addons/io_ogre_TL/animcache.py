@@ -0,0 +1,113 @@
+"""
+Per action skeleton files for incremental animation export.
+
+With split animations every action goes to its own skeleton file next to the
+mesh, '<mesh name>_<action>.skeleton', holding the full bone set and that one
+animation. An index file '<mesh name>.animations.json' keeps a hash of each
+action's F-curves, the rest pose and the export options, so actions whose
+hash did not change since the last export are neither sampled nor written
+again.
+
+    index = AnimationIndex.load(filepath)
+    changed = [a for a in actions
+               if not index.upToDate(a.name, hashes[a.name], converted)]
+    ...
+    index.update(name, hash, xmlfile)
+    index.save()
+
+Only the action and the rest pose are hashed. Changes that reach the pose
+from outside the action (constraints, drivers) are not noticed, delete the
+index file to export everything again.
+"""
+
+import hashlib
+import json
+import os
+import re
+
+import numpy
+
+VERSION = 1
+INDEX_SUFFIX = '.animations.json'
+
+
+def basePath(filepath):
+    # removing .mesh
+    return os.path.splitext(filepath)[0]
+
+
+def animationXmlPath(filepath, actionName):
+    name = re.sub(r'[^\w\-.]', '_', actionName)
+    return '%s_%s.skeleton.xml' % (basePath(filepath), name)
+
+
+def skeletonHash(skeleton):
+    digest = hashlib.sha1()
+    for bone, rest in zip(skeleton.bones, skeleton.rest):
+        digest.update(repr((bone.name, bone.parent)).encode())
+        digest.update(numpy.array(rest, numpy.float64).tobytes())
+    return digest.hexdigest()
+
+
+def actionHash(action, skeletonKey, options):
+    """Hash of everything the samples of an action depend on.
+
+       @param skeletonKey skeletonHash() of the exported skeleton.
+       @param options Json serializable export options.
+    """
+    digest = hashlib.sha1()
+    digest.update(json.dumps([VERSION, skeletonKey, options,
+                              list(action.frame_range)]).encode())
+    curves = sorted(action.fcurves,
+                    key=lambda curve: (curve.data_path, curve.array_index))
+    for curve in curves:
+        points = curve.keyframe_points
+        digest.update(repr((curve.data_path, curve.array_index, curve.mute,
+                            curve.extrapolation, len(curve.modifiers),
+                            [point.interpolation for point in points])
+                           ).encode())
+        for attribute in ('co', 'handle_left', 'handle_right'):
+            values = numpy.empty(len(points) * 2, numpy.float32)
+            points.foreach_get(attribute, values)
+            digest.update(values.tobytes())
+    return digest.hexdigest()
+
+
+class AnimationIndex(object):
+    def __init__(self, path, actions=None):
+        self.path = path
+        self.actions = actions or {}
+
+    @classmethod
+    def load(cls, filepath):
+        path = basePath(filepath) + INDEX_SUFFIX
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') == VERSION:
+                return cls(path, data['actions'])
+        except (OSError, ValueError, KeyError):
+            pass
+        return cls(path)
+
+    def upToDate(self, name, key, converted):
+        """Whether the skeleton file of the action was written from key.
+
+           @param converted Check the binary .skeleton instead of the xml.
+        """
+        entry = self.actions.get(name)
+        if entry is None or entry['hash'] != key:
+            return False
+        path = entry['file']
+        if converted:
+            path = os.path.splitext(path)[0]  # removing .xml
+        return os.path.isfile(path)
+
+    def update(self, name, key, xmlfile):
+        self.actions[name] = {'hash': key, 'file': xmlfile}
+
+    def save(self):
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'version': VERSION, 'actions': self.actions}, f,
+                      indent=1, sort_keys=True)
+        os.replace(self.path + '.tmp', self.path)
@@ -0,0 +1,137 @@
+"""
+Parallel animation sampling in background Blender processes.
+
+sampleActions() saves a copy of the open file, starts one headless Blender
+per group of actions running this script, and merges the keyframe tables the
+workers write. Each worker samples its actions with the same code as the
+exporter (OgreExport.bSampleAction), so the results are identical to
+sampling in the open session.
+
+Worker command line:
+    blender --background copy.blend --python animworker.py -- job.json
+"""
+
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import bpy
+
+
+def splitActions(names, workers):
+    # round robin, actions tend to be sorted by size
+    groups = [names[i::workers] for i in range(workers)]
+    return [group for group in groups if group]
+
+
+def encodeAnimation(animation):
+    return {'name': animation['name'],
+            'length': animation['length'],
+            'keyframes': animation['keyframes']}
+
+
+def decodeAnimation(data):
+    keyframes = {}
+    for bone, tracks in data['keyframes'].items():
+        if tracks is None:
+            keyframes[bone] = None
+        else:
+            keyframes[bone] = [[(time, tuple(value)) for time, value in track]
+                               for track in tracks]
+    return {'name': data['name'],
+            'length': data['length'],
+            'keyframes': keyframes}
+
+
+def workerCommand(blend, jobFile):
+    command = [bpy.app.binary_path, '--background', '--factory-startup']
+    # drivers with python expressions need script auto execution, which
+    # factory settings turn off
+    if bpy.context.user_preferences.system.use_scripts_auto_execute:
+        command.append('--enable-autoexec')
+    command += [blend, '--python-exit-code', '1',
+                '--python', os.path.abspath(__file__), '--', jobFile]
+    return command
+
+
+def sampleActions(armature, actions, workers, isolate=True, tolerances=None):
+    """Sample actions of the armature in parallel worker processes.
+
+       @param workers Number of processes to start at most.
+       @return List of animations in the order of actions, or None if a
+               worker failed.
+    """
+    names = [action.name for action in actions]
+    groups = splitActions(names, min(workers, len(names)))
+    folder = tempfile.mkdtemp(prefix='ogre_animation_')
+    try:
+        blend = os.path.join(folder, 'rig.blend')
+        bpy.ops.wm.save_as_mainfile(filepath=blend, copy=True,
+                                    check_existing=False)
+
+        processes = []
+        for index, group in enumerate(groups):
+            job = {'armature': armature.name,
+                   'actions': group,
+                   'isolate': isolate,
+                   'tolerances': tolerances,
+                   'output': os.path.join(folder, 'keys%d.json' % index)}
+            jobFile = os.path.join(folder, 'job%d.json' % index)
+            with open(jobFile, 'w') as f:
+                json.dump(job, f)
+            print('Sampling %d actions in worker %d' % (len(group), index))
+            processes.append((job, subprocess.Popen(
+                workerCommand(blend, jobFile),
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)))
+
+        animations = {}
+        failed = False
+        for job, process in processes:
+            output = process.communicate()[0]
+            if process.returncode != 0 or not os.path.isfile(job['output']):
+                print('[ERROR]: Animation worker failed:\n%s' %
+                      output.decode('utf-8', 'replace')[-4000:])
+                failed = True
+                continue
+            with open(job['output']) as f:
+                for data in json.load(f):
+                    animations[data['name']] = decodeAnimation(data)
+        if failed:
+            return None
+        return [animations[name] for name in names]
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main(argv):
+    # the addon is not enabled with factory settings, import it by path
+    packageDir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(packageDir))
+    OgreExport = importlib.import_module(os.path.basename(packageDir) +
+                                         '.OgreExport')
+
+    with open(argv[0]) as f:
+        job = json.load(f)
+    armature = bpy.data.objects[job['armature']]
+    tolerances = job['tolerances']
+
+    animations = []
+    for name in job['actions']:
+        action = bpy.data.actions[name]
+        print('Action', name)
+        armature.animation_data.action = action
+        animations.append(encodeAnimation(OgreExport.bSampleAction(
+            armature, action, job['isolate'], tolerances)))
+
+    output = job['output']
+    with open(output + '.tmp', 'w') as f:
+        json.dump(animations, f)
+    os.replace(output + '.tmp', output)
+
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:])
@@ -9,9 +9,15 @@ CONFIG_FILENAME = 'io_ogre_TL.pickle'
 CONFIG_FILEPATH = os.path.join(CONFIG_PATH, CONFIG_FILENAME)
 
 _CONFIG_DEFAULTS_ALL = {
+    'METRICS_ENABLED': False,
+    'METRICS_FILE': '',
+    'PROFILE_MEMORY': False,
+    'PROFILE_CPU': False,
+    'SNAPSHOT_CACHE_DIR': os.path.join(CONFIG_PATH, 'io_ogre_TL_snapshots'),
 }
 
-_CONFIG_TAGS_ = 'OGRETOOLS_XML_CONVERTER'.split()
+_CONFIG_TAGS_ = ('OGRETOOLS_XML_CONVERTER METRICS_ENABLED METRICS_FILE '
+                 'PROFILE_MEMORY PROFILE_CPU SNAPSHOT_CACHE_DIR').split()
 
 _CONFIG_DEFAULTS_WINDOWS = {
     'OGRETOOLS_XML_CONVERTER': 'C:\\OgreCommandLineTools\\OgreXmlConverter.exe'
@@ -0,0 +1,123 @@
+"""
+Vertex deduplication for export.
+
+Every triangle corner (loop) of the exported mesh is one row of the
+attributes that make an Ogre vertex unique: position, normal, uv, colour,
+tangent sign and, for skinned meshes, the bone influences (see skinnedRows).
+Corners with identical rows in the same submesh share a vertex.
+The rows are compared as raw bytes in one sort, instead of hashing a python
+object per corner.
+"""
+
+import numpy
+
+# columns of a corner row
+POSITION = slice(0, 3)
+NORMAL = slice(3, 6)
+UV = slice(6, 8)
+COLOUR = slice(8, 12)
+TANGENT_SIGN = 12
+
+
+def uniqueRows(rows):
+    """Find identical rows.
+
+       @param rows 2d array.
+       @return (first, inverse) - index of the first occurrence of each
+               distinct row, and for every row the index of its distinct row.
+    """
+    rows = numpy.ascontiguousarray(rows)
+    if len(rows) == 0:
+        return numpy.zeros(0, numpy.intp), numpy.zeros(0, numpy.intp)
+    # view each row as one opaque value so numpy.unique compares whole rows
+    keys = rows.view(numpy.dtype((numpy.void,
+                                  rows.dtype.itemsize * rows.shape[1])))
+    keys = keys.ravel()
+    unique, first, inverse = numpy.unique(keys, return_index=True,
+                                          return_inverse=True)
+    return first, inverse.ravel()
+
+
+def skinnedRows(rows, cornerBones, cornerWeights):
+    """Add the bone influences of every corner to its row.
+
+       Blender vertices at the same position can have different weights,
+       their corners must not become one vertex.
+
+       @param cornerBones, cornerWeights (corners, influences) bone ids and
+              weights, as bCollectSkinWeights gives them per vertex.
+    """
+    return numpy.column_stack((rows, cornerBones, cornerWeights)).astype(
+        numpy.float32, copy=False)
+
+
+def buildSubmeshes(rows, cornerSubmesh, submeshCount):
+    """Deduplicate triangle corners into per submesh vertex buffers.
+
+       Vertices are numbered in the order their first corner appears, the
+       same order the per corner lookup used to produce.
+
+       @param rows (corners, n) float32 array of vertex attributes. The three
+                   corners of a triangle are consecutive.
+       @param cornerSubmesh (corners,) submesh index of every corner.
+       @param submeshCount Number of submeshes.
+       @return list with (vertexCorners, triangles) for each submesh.
+               vertexCorners - the corner each vertex is taken from.
+               triangles - (tris, 3) array of vertex indices.
+    """
+    cornerSubmesh = numpy.asarray(cornerSubmesh, numpy.int32)
+    # adding 0.0 turns -0.0 into 0.0, which compare equal as floats but not
+    # as bytes
+    keyed = numpy.empty((len(rows), rows.shape[1] + 1), numpy.float32)
+    keyed[:, :-1] = rows
+    keyed[:, :-1] += 0.0
+    keyed[:, -1] = cornerSubmesh
+
+    first, inverse = uniqueRows(keyed)
+
+    # number the vertices of each submesh in order of first use
+    order = numpy.argsort(first, kind='mergesort')
+    groupSubmesh = cornerSubmesh[first[order]]
+    local = numpy.empty(len(first), numpy.int64)
+    result = []
+    for index in range(submeshCount):
+        groups = order[groupSubmesh == index]
+        local[groups] = numpy.arange(len(groups))
+        corners = numpy.flatnonzero(cornerSubmesh == index)
+        triangles = local[inverse[corners]].reshape(-1, 3)
+        result.append((first[groups], triangles))
+    return result
+
+
+def buildShared(rows, cornerSubmesh, submeshCount):
+    """Deduplicate triangle corners into one vertex buffer for all submeshes.
+
+       @return (vertexCorners, triangles) - the corner each vertex is taken
+               from, and a (tris, 3) array of vertex indices per submesh.
+    """
+    vertexCorners, triangles = buildSubmeshes(
+        rows, numpy.zeros(len(rows), numpy.int32), 1)[0]
+    faceSubmesh = numpy.asarray(cornerSubmesh, numpy.int32)[::3]
+    return vertexCorners, [triangles[faceSubmesh == index]
+                           for index in range(submeshCount)]
+
+
+def splitShared(triangles):
+    """Pick the vertices of a shared buffer one submesh uses.
+
+       Gives the same vertices in the same order as deduplicating the
+       submesh on its own with buildSubmeshes.
+
+       @param triangles (tris, 3) array of shared vertex indices.
+       @return (vertices, triangles) - the shared indices of the submesh
+               vertices, and the triangles renumbered to them.
+    """
+    flat = numpy.asarray(triangles).ravel()
+    if len(flat) == 0:
+        return numpy.zeros(0, numpy.intp), numpy.zeros((0, 3), numpy.intp)
+    vertices, first, inverse = numpy.unique(flat, return_index=True,
+                                            return_inverse=True)
+    order = numpy.argsort(first, kind='mergesort')
+    local = numpy.empty(len(vertices), numpy.intp)
+    local[order] = numpy.arange(len(vertices))
+    return vertices[order], local[inverse.ravel()].reshape(-1, 3)
@@ -0,0 +1,96 @@
+"""
+Registry of the images and textures created by imports.
+
+Texture files are keyed by resolved path and modification time, so a file
+referenced by many submeshes or imports is read once per session and shares
+one image and one texture datablock:
+
+    tex = imagecache.texture(matInfo['texture'])
+
+Entries hold datablock names and are checked against bpy.data on every
+lookup, so deleting or renaming datablocks, undo and loading another .blend
+only cost a new load. A file changed on disk gets a new key and its image is
+reloaded.
+
+Deferred textures start out as placeholders that texloader fills in later.
+"""
+
+import os
+
+import bpy
+
+from . import texloader
+
+# (path, mtime) -> (image name, texture name)
+_entries = {}
+
+
+def fileKey(path):
+    path = os.path.normcase(os.path.realpath(path))
+    return path, os.path.getmtime(path)
+
+
+def sameFile(image, path):
+    imagePath = bpy.path.abspath(image.filepath)
+    return os.path.normcase(os.path.realpath(imagePath)) == path
+
+
+def loadImage(path):
+    try:
+        return bpy.data.images.load(path, check_existing=True)
+    except TypeError:
+        # before Blender 2.77
+        for image in bpy.data.images:
+            if sameFile(image, path):
+                return image
+        return bpy.data.images.load(path)
+
+
+def findTexture(image):
+    for tex in bpy.data.textures:
+        if tex.type == 'IMAGE' and tex.image == image:
+            return tex
+    return None
+
+
+def lookup(key):
+    """The (image, texture) registered for key if both are still valid."""
+    if key not in _entries:
+        return None, None
+    imageName, textureName = _entries[key]
+    image = bpy.data.images.get(imageName)
+    if image is None or not sameFile(image, key[0]):
+        del _entries[key]
+        return None, None
+    tex = bpy.data.textures.get(textureName)
+    if tex is None or tex.type != 'IMAGE' or tex.image != image:
+        tex = None
+    return image, tex
+
+
+def texture(path, deferred=False):
+    """An image texture showing the texture file.
+
+       @param deferred Use a placeholder image the file is loaded into
+              later, see texloader.
+    """
+    key = fileKey(path)
+    img, tex = lookup(key)
+    if img is None and deferred:
+        img = texloader.placeholder(key[0])
+        texloader.schedule(img, key[0])
+    elif img is None:
+        img = loadImage(key[0])
+        # an older version of the file may have been read already
+        if any(other[0] == key[0] for other in _entries):
+            img.reload()
+            for other in [other for other in _entries if other[0] == key[0]]:
+                del _entries[other]
+    if tex is None:
+        tex = findTexture(img)
+    if tex is None:
+        tex = bpy.data.textures.new('ColorTex', type='IMAGE')
+        tex.image = img
+        tex.use_alpha = True
+    _entries[key] = (img.name, tex.name)
+    return tex
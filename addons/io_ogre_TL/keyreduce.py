@@ -0,0 +1,186 @@
+"""
+Keyframe reduction for sampled animation tracks.
+
+A key is dropped when interpolating between the keys that remain reproduces
+it within a tolerance: linear interpolation for translations and scales
+(distance), spherical interpolation for rotations (angle in radians). The
+first and last key always stay.
+
+    keep = reduceLinear(times, locations, 1e-4)
+    keep = reduceRotation(times, quaternions, math.radians(0.05))
+    times, locations = times[keep], locations[keep]
+
+Keys are picked by recursive subdivision: a segment between two kept keys is
+split at its worst key until every key is within the tolerance.
+
+Tracks can also be resampled at new times with the same interpolation:
+
+    locations = resampleLinear(times, locations, numpy.arange(0, 31))
+
+reduceTrackData and resampleTrackData do both for the tracks the importer
+decodes.
+"""
+
+import numpy
+
+
+def linearError(start, end, t, values):
+    """Distance of values from the linear interpolation start-end at t."""
+    expected = start + (end - start) * t[:, numpy.newaxis]
+    difference = expected - values
+    return numpy.sqrt((difference * difference).sum(axis=1))
+
+
+def slerp(start, end, t):
+    """Spherical interpolation of (w, x, y, z) quaternions at t.
+
+       @param start, end (4,) or (len(t), 4) arrays.
+    """
+    shape = (len(t), 4)
+    start = numpy.broadcast_to(start, shape)
+    end = numpy.array(numpy.broadcast_to(end, shape))
+    cosine = (start * end).sum(axis=1)
+    # shortest path, as Ogre interpolates
+    flip = cosine < 0.0
+    end[flip] = -end[flip]
+    cosine = numpy.minimum(numpy.abs(cosine), 1.0)
+    # nearly parallel, linear interpolation is accurate enough
+    linear = cosine > 0.9995
+    omega = numpy.arccos(cosine)
+    sine = numpy.sin(omega)
+    sine[linear] = 1.0
+    a = numpy.where(linear, 1.0 - t, numpy.sin((1.0 - t) * omega) / sine)
+    b = numpy.where(linear, t, numpy.sin(t * omega) / sine)
+    result = a[:, numpy.newaxis] * start + b[:, numpy.newaxis] * end
+    lengths = numpy.sqrt((result * result).sum(axis=1))
+    lengths[lengths == 0.0] = 1.0
+    return result / lengths[:, numpy.newaxis]
+
+
+def slerpError(start, end, t, values):
+    """Angle between quaternions (w, x, y, z) and the slerp start-end at t."""
+    expected = slerp(start, end, t)
+    # q and -q are the same rotation
+    dots = numpy.abs((expected * values).sum(axis=1))
+    return 2.0 * numpy.arccos(numpy.clip(dots, 0.0, 1.0))
+
+
+def reduceKeys(times, values, tolerance, error):
+    """Indices of the keys to keep.
+
+       @param times Increasing key times.
+       @param values (keys, n) array.
+       @param error Function like linearError.
+    """
+    times = numpy.asarray(times, numpy.float64)
+    values = numpy.asarray(values, numpy.float64)
+    count = len(times)
+    if count <= 2:
+        return numpy.arange(count)
+
+    keep = numpy.zeros(count, bool)
+    keep[0] = keep[-1] = True
+    segments = [(0, count - 1)]
+    while segments:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+        inner = numpy.arange(first + 1, last)
+        t = (times[inner] - times[first]) / (times[last] - times[first])
+        errors = error(values[first], values[last], t, values[inner])
+        worst = numpy.argmax(errors)
+        if errors[worst] > tolerance:
+            split = inner[worst]
+            keep[split] = True
+            segments.append((first, split))
+            segments.append((split, last))
+    return numpy.flatnonzero(keep)
+
+
+def reduceLinear(times, values, tolerance):
+    return reduceKeys(times, values, tolerance, linearError)
+
+
+def reduceRotation(times, quaternions, tolerance):
+    return reduceKeys(times, quaternions, tolerance, slerpError)
+
+
+def reduceTrack(times, translations, rotations, scales,
+                positionTolerance, angleTolerance):
+    """Keys to keep in an Ogre track.
+
+       An Ogre keyframe holds all channels of the track, so the result is
+       the union of the keys each channel needs. Unused channels are None.
+       Scales use the position tolerance.
+    """
+    keep = []
+    if translations is not None:
+        keep.append(reduceLinear(times, translations, positionTolerance))
+    if rotations is not None:
+        keep.append(reduceRotation(times, rotations, angleTolerance))
+    if scales is not None:
+        keep.append(reduceLinear(times, scales, positionTolerance))
+    if not keep:
+        return numpy.arange(len(times))
+    return numpy.unique(numpy.concatenate(keep))
+
+
+def reduceTrackData(trackData, positionTolerance, angleTolerance):
+    """Drop the keys linear and slerp interpolation reproduce.
+
+       @param trackData Imported track, translation, rotation and scale
+              lists of [frame, value tuple] keys. Changed in place, each
+              channel is reduced on its own.
+    """
+    for channel, reduce, tolerance in (
+            (0, reduceLinear, positionTolerance),
+            (1, reduceRotation, angleTolerance),
+            (2, reduceLinear, positionTolerance)):
+        keys = trackData[channel]
+        if len(keys) < 3:
+            continue
+        keep = reduce([key[0] for key in keys], [key[1] for key in keys],
+                      tolerance)
+        trackData[channel] = [keys[i] for i in keep.tolist()]
+
+
+def resampleLinear(times, values, newTimes):
+    """Linearly interpolated values at newTimes, clamped at the ends."""
+    times = numpy.asarray(times, numpy.float64)
+    values = numpy.asarray(values, numpy.float64)
+    return numpy.stack([numpy.interp(newTimes, times, values[:, i])
+                        for i in range(values.shape[1])], axis=1)
+
+
+def resampleRotation(times, quaternions, newTimes):
+    """Slerp interpolated quaternions at newTimes, clamped at the ends."""
+    times = numpy.asarray(times, numpy.float64)
+    quaternions = numpy.asarray(quaternions, numpy.float64)
+    newTimes = numpy.asarray(newTimes, numpy.float64)
+    if len(times) < 2:
+        return numpy.repeat(quaternions[:1], len(newTimes), axis=0)
+    first = numpy.searchsorted(times, newTimes, side='right') - 1
+    first = numpy.clip(first, 0, len(times) - 2)
+    span = times[first + 1] - times[first]
+    span[span == 0.0] = 1.0
+    t = numpy.clip((newTimes - times[first]) / span, 0.0, 1.0)
+    return slerp(quaternions[first], quaternions[first + 1], t)
+
+
+def resampleTrackData(trackData):
+    """Resample the channels of an imported track to whole frames.
+
+       @param trackData As in reduceTrackData, changed in place.
+    """
+    for channel, resample in ((0, resampleLinear),
+                              (1, resampleRotation),
+                              (2, resampleLinear)):
+        keys = trackData[channel]
+        if not keys:
+            continue
+        frames = numpy.array([key[0] for key in keys])
+        values = numpy.array([key[1] for key in keys])
+        newFrames = numpy.arange(round(frames[0]), round(frames[-1]) + 1)
+        newValues = resample(frames, values, newFrames).tolist()
+        trackData[channel] = [[frame, tuple(value)] for frame, value in
+                              zip(newFrames.tolist(), newValues)]
@@ -0,0 +1,81 @@
+"""
+Reuse of imported materials.
+
+Imported materials are tagged with their Ogre material name and a hash of
+the parsed definition (colours and texture, see xCollectMaterialData). A
+submesh whose material was already imported, by an earlier submesh, import
+or session, gets the existing datablock instead of a '.001' copy:
+
+    mat = materialcache.find(name, matInfo)
+    if mat is None:
+        mat = bpy.data.materials.new(name)
+        ...
+        materialcache.register(mat, name, matInfo)
+
+Lookups go through a dictionary of datablock names that is checked against
+bpy.data. It is refilled from the tags of all materials when it misses and
+materials were added or removed since it was last filled.
+"""
+
+import hashlib
+import json
+
+import bpy
+
+VERSION = 1
+NAME_PROPERTY = 'OGRE_MATERIAL'
+KEY_PROPERTY = 'OGRE_DEFINITION'
+
+# (Ogre name, definition key) -> material name
+_materials = {}
+# len(bpy.data.materials) when _materials was last filled
+_scanned = -1
+
+
+def definitionKey(definition):
+    # bump VERSION when imported materials are built differently
+    text = json.dumps([VERSION, definition], sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def materialKey(mat):
+    if NAME_PROPERTY not in mat or KEY_PROPERTY not in mat:
+        return None
+    return mat[NAME_PROPERTY], mat[KEY_PROPERTY]
+
+
+def rescan():
+    global _scanned
+    _materials.clear()
+    for mat in bpy.data.materials:
+        key = materialKey(mat)
+        if key is not None:
+            _materials.setdefault(key, mat.name)
+    _scanned = len(bpy.data.materials)
+
+
+def lookup(key):
+    mat = bpy.data.materials.get(_materials.get(key, ''))
+    if mat is not None and materialKey(mat) == key:
+        return mat
+    return None
+
+
+def find(name, definition):
+    """An imported material with this Ogre name and definition, or None."""
+    key = (name, definitionKey(definition))
+    mat = lookup(key)
+    if mat is None and _scanned != len(bpy.data.materials):
+        rescan()
+        mat = lookup(key)
+    return mat
+
+
+def register(mat, name, definition):
+    """Tag a newly imported material so later imports reuse it."""
+    global _scanned
+    key = (name, definitionKey(definition))
+    mat[NAME_PROPERTY], mat[KEY_PROPERTY] = key
+    if _scanned == len(bpy.data.materials) - 1:
+        _scanned += 1
+    _materials[key] = mat.name
@@ -0,0 +1,264 @@
+"""
+Per phase timing of import and export.
+
+    metrics = create('import', filepath)
+    with metrics.phase('xml parsing', 'bytes') as phase:
+        ...
+        phase.count = size
+    metrics.finish(operator)
+
+When metrics are disabled in the addon preferences create() returns a shared
+null object whose phases do nothing, so the instrumentation can stay in the
+hot paths.
+
+With memory profiling enabled every phase also records its tracemalloc high
+water mark and the biggest allocation sites still alive at its end.
+profileCall() optionally runs a whole import/export under cProfile.
+"""
+
+import json
+import os
+import time
+import tracemalloc
+
+import bpy
+
+from . import config
+
+
+TRACE_FRAMES = 8
+TOP_SITES = 10
+
+
+class Phase(object):
+    __slots__ = ('name', 'unit', 'seconds', 'count', 'calls', 'peak',
+                 'sites')
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.seconds = 0.0
+        self.count = 0
+        self.calls = 0
+        self.peak = None
+        self.sites = None
+
+    def throughput(self):
+        if self.seconds <= 0.0:
+            return 0.0
+        return self.count / self.seconds
+
+    def asDict(self):
+        result = {'name': self.name,
+                  'seconds': round(self.seconds, 6),
+                  'count': self.count,
+                  'unit': self.unit,
+                  'per_second': round(self.throughput(), 2)}
+        if self.peak is not None:
+            result['peak_bytes'] = self.peak
+            result['top_sites'] = self.sites
+        return result
+
+    def describe(self):
+        text = '%s %.3fs' % (self.name, self.seconds)
+        if self.count:
+            text += ' (%d %s, %.0f/s)' % (self.count, self.unit,
+                                          self.throughput())
+        if self.peak is not None:
+            text += ' peak %.1f MiB' % (self.peak / 1048576.0)
+        return text
+
+
+class PhaseTimer(object):
+    def __init__(self, metrics, phase):
+        self.metrics = metrics
+        self.record = phase
+        self.start = 0.0
+
+    def __enter__(self):
+        self.metrics.enter(self.record)
+        self.start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, excType, excValue, traceback):
+        self.record.seconds += time.perf_counter() - self.start
+        self.record.calls += 1
+        self.metrics.exit(self.record)
+        return False
+
+
+class Metrics(object):
+    enabled = True
+
+    def __init__(self, operation, filepath, metricsFile=None):
+        self.operation = operation
+        self.filepath = filepath
+        self.metricsFile = metricsFile
+        self.phases = []
+        self.byName = {}
+        self.started = time.time()
+        self.start = time.perf_counter()
+
+    def phase(self, name, unit='items'):
+        # phases with the same name add up, e.g. parsing mesh and skeleton
+        record = self.byName.get(name)
+        if record is None:
+            record = self.byName[name] = Phase(name, unit)
+            self.phases.append(record)
+        return PhaseTimer(self, record)
+
+    def enter(self, record):
+        pass
+
+    def exit(self, record):
+        pass
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def summary(self):
+        lines = ['%s %s: %.3fs' % (self.operation.capitalize(),
+                                   os.path.basename(self.filepath),
+                                   self.total())]
+        for record in self.phases:
+            lines.append('  ' + record.describe())
+        return lines
+
+    def asDict(self):
+        return {'operation': self.operation,
+                'file': self.filepath,
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S',
+                                           time.localtime(self.started)),
+                'total_seconds': round(self.total(), 6),
+                'phases': [record.asDict() for record in self.phases]}
+
+    def finish(self, operator=None):
+        lines = self.summary()
+        for line in lines:
+            print(line)
+        if operator:
+            operator.report({'INFO'}, '\n'.join(lines))
+        if self.metricsFile:
+            self.append(self.asDict())
+
+    def append(self, record):
+        path = os.path.expanduser(bpy.path.abspath(self.metricsFile))
+        try:
+            with open(path, 'a') as f:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+        except (IOError, OSError) as e:
+            print('[ERROR]: Can not write metrics to %s: %s' % (path, e))
+
+
+class MemoryMetrics(Metrics):
+    """Metrics that also trace python allocations of each phase.
+
+       Tracing is restarted for every phase, so the peak is the high water
+       mark of memory allocated during that phase only. Phases must not be
+       nested.
+    """
+    def enter(self, record):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        tracemalloc.start(TRACE_FRAMES)
+
+    def exit(self, record):
+        peak = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        snapshot = snapshot.filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),
+             tracemalloc.Filter(False, __file__)))
+        sites = []
+        for stat in snapshot.statistics('lineno')[:TOP_SITES]:
+            frame = stat.traceback[0]
+            sites.append({'site': '%s:%d' % (frame.filename, frame.lineno),
+                          'bytes': stat.size,
+                          'blocks': stat.count})
+
+        # keep the worst call if a phase runs several times
+        if record.peak is None or peak > record.peak:
+            record.peak = peak
+            record.sites = sites
+
+    def summary(self):
+        lines = Metrics.summary(self)
+        worst = None
+        for record in self.phases:
+            if record.peak is not None and \
+                    (worst is None or record.peak > worst.peak):
+                worst = record
+        if worst and worst.sites:
+            lines.append('  top allocations in %s:' % worst.name)
+            for site in worst.sites[:3]:
+                lines.append('    %s %.1f MiB' % (site['site'],
+                                                  site['bytes'] / 1048576.0))
+        return lines
+
+
+class NullPhase(object):
+    # shared by every disabled phase, so it must not keep counts
+    name = unit = ''
+    seconds = 0.0
+    calls = 0
+
+    @property
+    def count(self):
+        return 0
+
+    @count.setter
+    def count(self, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+
+class NullMetrics(object):
+    enabled = False
+
+    def __init__(self):
+        self.nullPhase = NullPhase()
+
+    def phase(self, name, unit='items'):
+        return self.nullPhase
+
+    def finish(self, operator=None):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+def create(operation, filepath):
+    profileMemory = config.get('PROFILE_MEMORY', False)
+    if not (config.get('METRICS_ENABLED', False) or profileMemory):
+        return NULL_METRICS
+    metricsClass = MemoryMetrics if profileMemory else Metrics
+    return metricsClass(operation, filepath,
+                        config.get('METRICS_FILE') or None)
+
+
+def profileCall(filepath, func, *args, **kwargs):
+    """Call func, under cProfile if enabled in the addon preferences.
+
+       The statistics are written to filepath + '.pstats'.
+    """
+    if not config.get('PROFILE_CPU', False):
+        return func(*args, **kwargs)
+
+    import cProfile
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func, *args, **kwargs)
+    finally:
+        statsFile = filepath + '.pstats'
+        try:
+            profile.dump_stats(statsFile)
+            print('Profile written to', statsFile)
+        except (IOError, OSError) as e:
+            print('[ERROR]: Can not write profile to %s: %s' % (statsFile, e))
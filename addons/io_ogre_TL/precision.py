@@ -0,0 +1,66 @@
+"""
+Number formatting for the exported xml.
+
+A profile sets the decimals kept for each class of values. Whole arrays are
+rounded at once and written in fixed point without trailing zeros: whole
+numbers lose the '.0', values below the precision become plain '0' instead
+of '-0.0' and there are never exponents like 1e-05.
+
+    precision = Precision('MEDIUM')
+    rows = precision.format('positions', positions)  # [['1', '0.5', '0']]
+
+The default profile keeps the decimals earlier versions wrote: 7 for vertex
+data, 6 for skeletons, animations, weights and pose offsets.
+"""
+
+import numpy
+
+# decimals per value class, 'vertices' are vertex positions, 'positions'
+# bone, key and pose offset positions and scales
+PROFILES = {
+    'HIGH': {'vertices': 7, 'positions': 7, 'normals': 7, 'uvs': 7,
+             'weights': 7, 'times': 7, 'rotations': 7},
+    'STANDARD': {'vertices': 7, 'positions': 6, 'normals': 7, 'uvs': 7,
+                 'weights': 6, 'times': 6, 'rotations': 6},
+    'MEDIUM': {'vertices': 6, 'positions': 6, 'normals': 5, 'uvs': 6,
+               'weights': 5, 'times': 5, 'rotations': 6},
+    'LOW': {'vertices': 4, 'positions': 4, 'normals': 3, 'uvs': 5,
+            'weights': 3, 'times': 4, 'rotations': 4},
+}
+
+PROFILE_ITEMS = (
+    ('HIGH', "High", "7 decimals for everything"),
+    ('STANDARD', "Standard", "As earlier versions, 7 decimals for vertex "
+                 "data, 6 for skeletons, animations and weights"),
+    ('MEDIUM', "Medium", "6 decimals for positions, uvs and rotations, "
+               "5 for normals, weights and key times"),
+    ('LOW', "Low", "Smallest files, 3-5 decimals. Fine for small props"),
+)
+
+DEFAULT_PROFILE = 'STANDARD'
+
+
+def formatArray(values, digits):
+    """Format numbers rounded to digits decimals.
+
+       @param values Sequence of numbers or of equally long rows.
+       @return List of strings, or list of rows of strings.
+    """
+    values = numpy.asarray(values, numpy.float64)
+    # adding 0.0 turns the -0.0 that rounding leaves into 0.0
+    rounded = numpy.round(values, digits) + 0.0
+    text = ['%.*f' % (digits, value) for value in rounded.ravel().tolist()]
+    if digits > 0:
+        text = [t.rstrip('0').rstrip('.') for t in text]
+    if rounded.ndim < 2:
+        return text
+    width = rounded.shape[-1]
+    return [text[i:i + width] for i in range(0, len(text), width)]
+
+
+class Precision(object):
+    def __init__(self, profile=DEFAULT_PROFILE):
+        self.digits = PROFILES[profile]
+
+    def format(self, kind, values):
+        return formatArray(values, self.digits[kind])
@@ -0,0 +1,377 @@
+"""
+Binary snapshots of parsed import data (MESHDATA, see OgreImport).
+
+A snapshot holds everything the xml collection produced, so an unchanged
+.mesh can be rebuilt without running the converter or parsing xml. Files are
+named after a hash of the .mesh contents and the import options, and list the
+other files they were made from (skeleton, materials, textures), the ones
+looked for but missing and the folders searched for materials, so a change
+to any of them invalidates the snapshot.
+
+File layout:
+    magic 'OGRESNAP', uint32 version, uint32 header size,
+    header (utf-8 json), then the typed arrays, each 8 byte aligned.
+
+The header stores the MESHDATA structure with every large list replaced by a
+reference to one of the arrays. Arrays are read straight from a memory map.
+"""
+
+import array
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'OGRESNAP'
+VERSION = 2
+EXTENSION = '.ogresnap'
+PREFIX = struct.Struct('<8sII')
+ALIGN = 8
+MAX_SNAPSHOTS = 64
+
+
+def sourceKey(filepath, options):
+    """Hash of the source file contents and the options used to parse it."""
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    digest.update(json.dumps([VERSION, options], sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def fileStamp(path):
+    # missing files are stamped too, the data changes when they show up
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return [path, None, None]
+    return [path, stat.st_size, stat.st_mtime]
+
+
+def listingStamp(folder, pattern):
+    try:
+        names = sorted(name for name in os.listdir(folder) if pattern in name)
+    except OSError:
+        names = None
+    return [folder, pattern, names]
+
+
+def dependenciesValid(dependencies, listings=()):
+    for path, size, mtime in dependencies:
+        if fileStamp(path) != [path, size, mtime]:
+            return False
+    for folder, pattern, names in listings:
+        if listingStamp(folder, pattern) != [folder, pattern, names]:
+            return False
+    return True
+
+
+###############################################################################
+
+
+class ArrayWriter(object):
+    def __init__(self):
+        self.arrays = []
+
+    def add(self, typecode, values):
+        self.arrays.append(array.array(typecode, values))
+        return len(self.arrays) - 1
+
+    def vectors(self, typecode, rows, width):
+        # rows of equal width, stored flat
+        return {'array': self.add(typecode, itertools.chain.from_iterable(rows)),
+                'width': width}
+
+    def geometry(self, geometry):
+        result = {}
+        for key in ('texcoordsets',):
+            if key in geometry:
+                result[key] = geometry[key]
+        if 'positions' in geometry:
+            result['positions'] = self.vectors('f', geometry['positions'], 3)
+        if 'normals' in geometry:
+            result['normals'] = self.vectors('f', geometry['normals'], 3)
+        if 'vertexcolors' in geometry:
+            result['vertexcolors'] = self.vectors('f',
+                                                  geometry['vertexcolors'], 4)
+        if 'uvsets' in geometry:
+            uvsets = geometry['uvsets']
+            sets = len(uvsets[0]) if uvsets else 0
+            result['uvsets'] = self.vectors(
+                'f', (itertools.chain.from_iterable(uv) for uv in uvsets),
+                sets * 2)
+            result['uvsets']['sets'] = sets
+        if 'boneassignments' in geometry:
+            groups = []
+            for name, vgroup in geometry['boneassignments'].items():
+                groups.append([name,
+                               self.add('I', (v for v, w in vgroup)),
+                               self.add('f', (w for v, w in vgroup))])
+            result['boneassignments'] = groups
+        return result
+
+    def skeleton(self, bones):
+        result = {}
+        for name, bone in bones.items():
+            data = {}
+            for key, value in bone.items():
+                if key == 'rotmatAS':
+                    value = [v for row in value for v in row]
+                elif key == 'posHAS':
+                    value = list(value)
+                data[key] = value
+            result[name] = data
+        return result
+
+    def animations(self, animations):
+        result = {}
+        for name, action in animations.items():
+            tracks = {}
+            for bone, trackData in action.items():
+                channels = []
+                for channel, width in zip(trackData, (3, 4, 3)):
+                    channels.append([self.add('f', (k[0] for k in channel)),
+                                     self.vectors('f', (k[1] for k in channel),
+                                                  width)])
+                tracks[bone] = channels
+            result[name] = tracks
+        return result
+
+    def poses(self, poses):
+        result = []
+        for pose in poses:
+            result.append({'name': pose['name'],
+                           'submesh': pose['submesh'],
+                           'index': self.add('I', (d[0] for d in pose['data'])),
+                           'offsets': self.vectors('f', (d[1:] for d in
+                                                         pose['data']), 3)})
+        return result
+
+
+class ArrayReader(object):
+    def __init__(self, view, arrays):
+        self.view = view
+        self.arrays = arrays
+
+    def values(self, index):
+        typecode, offset, length = self.arrays[index]
+        size = array.array(typecode).itemsize
+        with self.view[offset:offset + length * size] as raw:
+            with raw.cast(typecode) as typed:
+                return typed.tolist()
+
+    def vectors(self, ref):
+        flat = self.values(ref['array'])
+        width = ref['width']
+        return [flat[i:i + width] for i in range(0, len(flat), width)]
+
+    def geometry(self, data):
+        geometry = {}
+        if 'texcoordsets' in data:
+            geometry['texcoordsets'] = data['texcoordsets']
+        for key in ('positions', 'normals', 'vertexcolors'):
+            if key in data:
+                geometry[key] = self.vectors(data[key])
+        if 'uvsets' in data:
+            geometry['uvsets'] = [[row[i:i + 2] for i in range(0, len(row), 2)]
+                                  for row in self.vectors(data['uvsets'])]
+        if 'boneassignments' in data:
+            groups = {}
+            for name, vertices, weights in data['boneassignments']:
+                groups[name] = [list(p) for p in zip(self.values(vertices),
+                                                     self.values(weights))]
+            geometry['boneassignments'] = groups
+        return geometry
+
+    def skeleton(self, data):
+        from mathutils import Matrix
+
+        for bone in data.values():
+            if 'rotmatAS' in bone:
+                m = bone['rotmatAS']
+                bone['rotmatAS'] = Matrix((m[0:3], m[3:6], m[6:9]))
+        return data
+
+    def animations(self, data):
+        animations = {}
+        for name, tracks in data.items():
+            action = {}
+            for bone, channels in tracks.items():
+                trackData = []
+                for frames, values in channels:
+                    trackData.append([[f, tuple(v)] for f, v in
+                                      zip(self.values(frames),
+                                          self.vectors(values))])
+                action[bone] = trackData
+            animations[name] = action
+        return animations
+
+    def poses(self, data):
+        poses = []
+        for pose in data:
+            poses.append({'name': pose['name'],
+                          'submesh': pose['submesh'],
+                          'data': [(i, x, y, z) for i, (x, y, z) in
+                                   zip(self.values(pose['index']),
+                                       self.vectors(pose['offsets']))]})
+        return poses
+
+
+###############################################################################
+
+
+def encode(meshData, writer):
+    header = {}
+    for key in ('skeletonName', 'materials', 'boneIDs', 'animationIndex',
+                'skeletonFile', 'animationStats', 'sampleRate'):
+        if key in meshData:
+            header[key] = meshData[key]
+    if 'sharedgeometry' in meshData:
+        header['sharedgeometry'] = writer.geometry(meshData['sharedgeometry'])
+    submeshes = []
+    for subMesh in meshData.get('submeshes', []):
+        data = {'material': subMesh['material'],
+                'materialOrg': subMesh['materialOrg']}
+        if 'faces' in subMesh:
+            data['faces'] = writer.vectors('I', subMesh['faces'], 3)
+        if 'geometry' in subMesh:
+            data['geometry'] = writer.geometry(subMesh['geometry'])
+        submeshes.append(data)
+    header['submeshes'] = submeshes
+    if 'skeleton' in meshData:
+        header['skeleton'] = writer.skeleton(meshData['skeleton'])
+    if 'animations' in meshData:
+        header['animations'] = writer.animations(meshData['animations'])
+    if 'poses' in meshData:
+        header['poses'] = writer.poses(meshData['poses'])
+    return header
+
+
+def decode(header, reader):
+    meshData = {}
+    for key in ('skeletonName', 'materials', 'boneIDs', 'animationIndex',
+                'skeletonFile', 'animationStats', 'sampleRate'):
+        if key in header:
+            meshData[key] = header[key]
+    if 'sharedgeometry' in header:
+        meshData['sharedgeometry'] = reader.geometry(header['sharedgeometry'])
+    submeshes = []
+    for data in header['submeshes']:
+        subMesh = {'material': data['material'],
+                   'materialOrg': data['materialOrg']}
+        if 'faces' in data:
+            subMesh['faces'] = reader.vectors(data['faces'])
+        if 'geometry' in data:
+            subMesh['geometry'] = reader.geometry(data['geometry'])
+        submeshes.append(subMesh)
+    meshData['submeshes'] = submeshes
+    if 'skeleton' in header:
+        meshData['skeleton'] = reader.skeleton(header['skeleton'])
+    if 'animations' in header:
+        meshData['animations'] = reader.animations(header['animations'])
+    if 'poses' in header:
+        meshData['poses'] = reader.poses(header['poses'])
+    return meshData
+
+
+def padding(offset):
+    return (ALIGN - offset % ALIGN) % ALIGN
+
+
+def write(path, meshData, dependencies=(), extra=None, listings=()):
+    """Write meshData to a snapshot file.
+
+       @param dependencies Files the data was read from besides the .mesh,
+              and files looked for but missing.
+       @param extra Small json serializable values stored with the data.
+       @param listings (folder, pattern) of folders searched for files
+              with pattern in their name.
+    """
+    writer = ArrayWriter()
+    header = {'byteorder': sys.byteorder,
+              'dependencies': [fileStamp(p) for p in dependencies],
+              'listings': [listingStamp(folder, pattern)
+                           for folder, pattern in listings],
+              'extra': extra or {},
+              'meshData': encode(meshData, writer)}
+
+    # array offsets depend on the header size, which depends on the offsets
+    # written into it, so reserve enough digits for them up front
+    header['arrays'] = [[a.typecode, 0, len(a)] for a in writer.arrays]
+    size = len(json.dumps(header).encode('utf-8')) + 16 * len(writer.arrays)
+    offset = PREFIX.size + size
+    offset += padding(offset)
+    for entry, a in zip(header['arrays'], writer.arrays):
+        entry[1] = offset
+        offset += len(a) * a.itemsize
+        offset += padding(offset)
+    data = json.dumps(header).encode('utf-8')
+    data += b' ' * (size - len(data))
+
+    folder = os.path.dirname(path)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, size))
+        f.write(data)
+        for entry, a in zip(header['arrays'], writer.arrays):
+            f.write(b'\0' * (entry[1] - f.tell()))
+            a.tofile(f)
+    os.replace(tmp, path)
+    prune(folder)
+
+
+def read(path):
+    """Read a snapshot written by write().
+
+       @return (meshData, extra) or None if there is no valid snapshot.
+    """
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None  # empty file
+    try:
+        magic, version, size = PREFIX.unpack_from(mm)
+        if magic != MAGIC or version != VERSION:
+            return None
+        header = json.loads(mm[PREFIX.size:PREFIX.size + size].decode('utf-8'))
+        if header['byteorder'] != sys.byteorder or \
+                not dependenciesValid(header['dependencies'],
+                                      header['listings']):
+            return None
+        with memoryview(mm) as view:
+            meshData = decode(header['meshData'],
+                              ArrayReader(view, header['arrays']))
+    except (ValueError, KeyError, struct.error) as e:
+        print('Ignoring broken snapshot %s: %s' % (path, e))
+        return None
+    finally:
+        mm.close()
+
+    os.utime(path, None)  # most recently used
+    return meshData, header['extra']
+
+
+def prune(folder, keep=MAX_SNAPSHOTS):
+    # drop least recently used snapshots
+    files = [os.path.join(folder, f) for f in os.listdir(folder)
+             if f.endswith(EXTENSION)]
+    if len(files) > keep:
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - keep]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def snapshotPath(folder, key):
+    return os.path.join(folder, key + EXTENSION)
@@ -0,0 +1,115 @@
+"""
+Deferred texture loading for imports.
+
+With deferred textures an import gives every texture file a 1x1 placeholder
+image and goes on building geometry. A background thread reads the files
+into memory meanwhile, and bindReady(), called from a timer of the
+ogre.bind_textures operator, packs the bytes into the placeholder and turns
+it into the real image, one image per call:
+
+    image = placeholder(path)
+    schedule(image, path)
+    ...
+    while busy():
+        bindReady()
+
+Placeholders are the datablocks materials and faces use, so binding needs no
+relinking. The thread only touches files, all bpy work happens in
+bindReady() on the main thread, which only decodes the packed bytes. The
+images stay packed, File > External Data > Unpack All Into Files links them
+to their files again. Blender before 2.77 can't pack from memory and reads
+the file on binding.
+"""
+
+import os
+import queue
+import threading
+
+import bpy
+
+
+# (image name, path) waiting to be read, and (image name, path, bytes or
+# None) read waiting to be bound
+_reading = queue.Queue()
+_read = queue.Queue()
+_lock = threading.Lock()
+_thread = None
+_scheduled = 0
+
+
+def placeholder(path):
+    """A 1x1 generated image standing in for the texture file."""
+    image = bpy.data.images.new(os.path.basename(path), 1, 1, alpha=True)
+    image.generated_color = (0.5, 0.5, 0.5, 1.0)
+    image.filepath_raw = path
+    return image
+
+
+def readFiles():
+    while True:
+        name, path = _reading.get()
+        data = None
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError) as e:
+            print("Warning: Could not read texture", path, e)
+        _read.put((name, path, data))
+
+
+def schedule(image, path):
+    """Read path in the background and bind it to image afterwards."""
+    global _thread, _scheduled
+    with _lock:
+        _scheduled += 1
+        if _thread is None:
+            _thread = threading.Thread(target=readFiles,
+                                       name='ogre texture reader')
+            _thread.daemon = True
+            _thread.start()
+    _reading.put((image.name, path))
+
+
+def busy():
+    """Whether scheduled images are not bound yet."""
+    return _scheduled > 0
+
+
+def bindReady(limit=1, wait=False):
+    """Load the files read so far into their placeholder images.
+
+       @param limit Bind at most this many images per call, decoding is
+              done here and blocks the interface.
+       @param wait Wait for the reader instead of stopping when no file is
+              ready.
+       @return Number of images bound.
+    """
+    global _scheduled
+    bound = 0
+    while bound < limit and _scheduled > 0:
+        try:
+            name, path, data = _read.get(wait)
+        except queue.Empty:
+            break
+        with _lock:
+            _scheduled -= 1
+        image = bpy.data.images.get(name)
+        # gone, or already replaced by something else
+        if image is None or image.source != 'GENERATED':
+            continue
+        image.filepath = path
+        if data:
+            try:
+                image.pack(data=data, data_len=len(data))
+            except TypeError:
+                pass  # before Blender 2.77, the file is read again
+        image.source = 'FILE'
+        image.reload()
+        bound += 1
+    return bound
+
+
+def bindAll():
+    """Bind every scheduled image, for when no timer can run."""
+    while busy():
+        bindReady(limit=_scheduled, wait=True)
@@ -0,0 +1,86 @@
+"""
+Streaming xml output for the .mesh.xml and .skeleton.xml files.
+
+    with XmlWriter.create(path, pretty=True) as xWriter:
+        xWriter.start('mesh')
+        xWriter.empty('face', (('v1', '0'), ('v2', '1'), ('v3', '2')))
+        xWriter.end('mesh')
+
+Elements are written as soon as they are complete and text is handed to the
+file in chunks, so nothing holds the whole document. Pretty output indents
+like minidom's toprettyxml, compact output has no whitespace at all.
+"""
+
+from xml.sax.saxutils import escape
+
+ATTRIBUTE_ENTITIES = {'"': '&quot;', '\n': '&#10;', '\t': '&#9;'}
+CHUNK_SIZE = 1 << 16
+
+
+class XmlWriter(object):
+    def __init__(self, f, pretty=True, indent='    ', chunkSize=CHUNK_SIZE):
+        self.f = f
+        self.pretty = pretty
+        self.indent = indent
+        self.chunkSize = chunkSize
+        self.pieces = []
+        self.size = 0
+        self.depth = 0
+        self.newline = '\n' if pretty else ''
+        self.write('<?xml version="1.0" ?>\n')
+
+    @classmethod
+    def create(cls, path, pretty=True):
+        return cls(open(path, 'w', encoding='utf-8'), pretty)
+
+    def write(self, text):
+        self.pieces.append(text)
+        self.size += len(text)
+        if self.size >= self.chunkSize:
+            self.flush()
+
+    def flush(self):
+        self.f.write(''.join(self.pieces))
+        self.pieces = []
+        self.size = 0
+
+    def tag(self, tag, attrs, closing):
+        parts = [self.indent * self.depth if self.pretty else '', '<', tag]
+        for name, value in attrs:
+            parts.append(' %s="%s"' % (name, escape(value,
+                                                     ATTRIBUTE_ENTITIES)))
+        parts.append(closing)
+        parts.append(self.newline)
+        self.write(''.join(parts))
+
+    def start(self, tag, attrs=()):
+        """Open an element.
+
+           @param attrs Sequence of (name, value) pairs, values are strings.
+        """
+        self.tag(tag, attrs, '>')
+        self.depth += 1
+
+    def end(self, tag):
+        self.depth -= 1
+        if self.pretty:
+            self.write('%s</%s>\n' % (self.indent * self.depth, tag))
+        else:
+            self.write('</%s>' % tag)
+
+    def empty(self, tag, attrs=()):
+        """Write an element without children."""
+        self.tag(tag, attrs, '/>')
+
+    def close(self):
+        if not self.pretty:
+            self.write('\n')
+        self.flush()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
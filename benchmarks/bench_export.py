@@ -0,0 +1,367 @@
+"""
+Export benchmark on procedurally generated scenes.
+
+Builds a subdivided grid mesh with several materials, vertex groups, shape
+keys and an armature carrying N actions, runs OgreExport.save on it with a
+stand-in xml converter and records per phase times, the vertex dedupe ratio
+and the output file sizes as json. Needs Blender, run it with:
+
+    blender --background --factory-startup \\
+        --python benchmarks/bench_export.py -- --subdivisions 300 \\
+        --actions 8 --output export.json
+
+Pass --baseline with an earlier json to print the change per phase.
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutil  # noqa: E402
+benchutil.setupPaths()
+
+import bpy  # noqa: E402
+from io_ogre_TL import OgreExport  # noqa: E402
+
+# functions of OgreExport that get timed, nested ones included
+PHASES = ['bCollectSkeletonData',
+          'bCollectMeshData',
+          'bCollectMaterialData',
+          'bCollectAnimationData',
+          'collectAnimationData',
+          'xSaveSkeletonData',
+          'xSaveAnimation',
+          'xSaveMeshData',
+          'xSaveSubMeshes',
+          'xSaveGeometry',
+          'xSaveMaterialData',
+          'XMLtoOGREConvert']
+
+DEFAULTS = {
+    'subdivisions': 100,
+    'materials': 3,
+    'bones': 16,
+    'shapekeys': 4,
+    'actions': 4,
+    'frames': 60,
+    'by_material': 1,
+    'shared_geometry': 0,
+}
+
+
+class Reporter(object):
+    # stands in for the operator, save() only reports through it
+    def report(self, level, message):
+        print('report', level, message)
+
+
+class PhaseWrapper(object):
+    def __init__(self, module, names):
+        self.module = module
+        self.original = {}
+        self.seconds = {}
+        self.calls = {}
+        self.meshData = None
+        for name in names:
+            if hasattr(module, name):
+                self.original[name] = getattr(module, name)
+
+    def wrap(self, name, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds[name] = self.seconds.get(name, 0.0) + \
+                    time.perf_counter() - start
+                self.calls[name] = self.calls.get(name, 0) + 1
+                if name == 'bCollectMeshData':
+                    self.meshData = args[0]
+        return timed
+
+    def __enter__(self):
+        self.seconds = {}
+        self.calls = {}
+        for name, func in self.original.items():
+            setattr(self.module, name, self.wrap(name, func))
+        return self
+
+    def __exit__(self, *exc):
+        for name, func in self.original.items():
+            setattr(self.module, name, func)
+        return False
+
+
+def clearScene(scene):
+    for ob in list(scene.objects):
+        scene.objects.unlink(ob)
+        bpy.data.objects.remove(ob)
+
+
+def buildArmature(scene, bones):
+    amt = bpy.data.armatures.new('BenchRig')
+    rig = bpy.data.objects.new('BenchRig', amt)
+    scene.objects.link(rig)
+    scene.objects.active = rig
+    bpy.ops.object.mode_set(mode='EDIT')
+    step = 2.0 / bones
+    parent = None
+    for i in range(bones):
+        eb = amt.edit_bones.new('Bone%d' % i)
+        eb.head = (-1.0 + i * step, 0.0, 0.0)
+        eb.tail = (-1.0 + (i + 1) * step, 0.0, 0.0)
+        if parent:
+            eb.parent = parent
+        parent = eb
+    bpy.ops.object.mode_set(mode='OBJECT')
+    return rig
+
+
+def buildMesh(scene, opts, rig):
+    n = opts['subdivisions']
+    verts = []
+    for j in range(n + 1):
+        for i in range(n + 1):
+            x = -1.0 + 2.0 * i / n
+            y = -1.0 + 2.0 * j / n
+            verts.append((x, y, 0.05 * math.sin(x * 6.0) * math.cos(y * 4.0)))
+    faces = []
+    for j in range(n):
+        for i in range(n):
+            a = j * (n + 1) + i
+            faces.append((a, a + 1, a + n + 2, a + n + 1))
+
+    me = bpy.data.meshes.new('BenchMesh')
+    me.from_pydata(verts, [], faces)
+    me.update()
+    ob = bpy.data.objects.new('BenchMesh', me)
+    scene.objects.link(ob)
+
+    # materials in bands of rows
+    materials = max(1, opts['materials'])
+    for m in range(materials):
+        me.materials.append(bpy.data.materials.new('BenchMat%d' % m))
+    me.polygons.foreach_set('material_index',
+                            [(p // n) * materials // n
+                             for p in range(len(me.polygons))])
+
+    # planar uvs
+    me.uv_textures.new('UVMap')
+    loopVerts = [0] * len(me.loops)
+    me.loops.foreach_get('vertex_index', loopVerts)
+    uvs = []
+    for v in loopVerts:
+        uvs.append((verts[v][0] + 1.0) * 0.5)
+        uvs.append((verts[v][1] + 1.0) * 0.5)
+    me.uv_layers[0].data.foreach_set('uv', uvs)
+
+    # two weights per vertex, bones run along x
+    if rig:
+        bones = opts['bones']
+        groups = [ob.vertex_groups.new('Bone%d' % b) for b in range(bones)]
+        primary = [[] for b in range(bones)]
+        for index, co in enumerate(verts):
+            primary[min(bones - 1, int((co[0] + 1.0) * 0.5 * bones))]\
+                .append(index)
+        for b in range(bones):
+            groups[b].add(primary[b], 0.75, 'REPLACE')
+            groups[(b + 1) % bones].add(primary[b], 0.25, 'REPLACE')
+        mod = ob.modifiers.new('Armature', 'ARMATURE')
+        mod.object = rig
+        ob.parent = rig
+
+    # shape keys move a different quarter of the grid each
+    if opts['shapekeys'] > 0:
+        ob.shape_key_add('Basis')
+        for k in range(opts['shapekeys']):
+            key = ob.shape_key_add('Key%d' % k)
+            coords = []
+            for index, co in enumerate(verts):
+                lift = 0.2 if index % 4 == k % 4 else 0.0
+                coords.extend((co[0], co[1], co[2] + lift))
+            key.data.foreach_set('co', coords)
+    return ob
+
+
+def addCurve(action, path, index, group, frames, func):
+    fc = action.fcurves.new(path, index, group)
+    fc.keyframe_points.add(len(frames))
+    co = []
+    for frame in frames:
+        co.extend((frame, func(frame)))
+    fc.keyframe_points.foreach_set('co', co)
+    fc.update()
+
+
+def buildActions(rig, opts):
+    rig.animation_data_create()
+    animdata = rig.animation_data
+    frames = list(range(1, opts['frames'] + 1, 5))
+    if frames[-1] != opts['frames']:
+        frames.append(opts['frames'])
+    for a in range(opts['actions']):
+        action = bpy.data.actions.new('Action%d' % a)
+        for b in range(opts['bones']):
+            name = 'Bone%d' % b
+            base = 'pose.bones["%s"].' % name
+            phase = a * 0.7 + b * 0.3
+
+            def angle(f):
+                return 0.3 * math.sin(f * 0.1 + phase)
+            addCurve(action, base + 'rotation_quaternion', 0, name, frames,
+                     lambda f: math.cos(angle(f) * 0.5))
+            addCurve(action, base + 'rotation_quaternion', 3, name, frames,
+                     lambda f: math.sin(angle(f) * 0.5))
+            addCurve(action, base + 'location', 2, name, frames,
+                     lambda f: 0.02 * math.sin(f * 0.2 + phase))
+        if a == 0:
+            animdata.action = action
+        else:
+            track = animdata.nla_tracks.new()
+            track.name = action.name
+            track.mute = True
+            track.strips.new(action.name, 1, action)
+
+
+def buildScene(opts):
+    scene = bpy.context.scene
+    clearScene(scene)
+    scene.frame_start = 1
+    scene.frame_end = opts['frames']
+    rig = buildArmature(scene, opts['bones']) if opts['bones'] > 0 else None
+    ob = buildMesh(scene, opts, rig)
+    if rig and opts['actions'] > 0:
+        buildActions(rig, opts)
+    for other in scene.objects:
+        other.select = False
+    ob.select = True
+    scene.objects.active = ob
+    return ob
+
+
+def standInConverter(folder):
+    path = os.path.join(folder, 'fake_converter.py')
+    shutil.copyfile(os.path.join(benchutil.HERE, 'fake_converter.py'), path)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+
+def dedupeStats(meshData):
+    vertices = corners = 0
+    if meshData:
+        vertices = OgreExport.countVertices(meshData)
+        for submesh in meshData.get('submeshes', []):
+            corners += len(submesh['faces']) * 3
+    return {'corners': corners,
+            'vertices': vertices,
+            'ratio': vertices / float(corners) if corners else 0.0}
+
+
+def outputSizes(folder):
+    sizes = {}
+    for name in sorted(os.listdir(folder)):
+        if name.startswith('bench.'):
+            sizes[name] = os.path.getsize(os.path.join(folder, name))
+    return sizes
+
+
+def runExport(opts, folder, converter):
+    filepath = os.path.join(folder, 'bench.mesh')
+    wrapper = PhaseWrapper(OgreExport, PHASES)
+    start = time.perf_counter()
+    with wrapper:
+        OgreExport.save(Reporter(), bpy.context, filepath,
+                        xml_converter=converter,
+                        keep_xml=True,
+                        apply_transform=False,
+                        apply_modifiers=False,
+                        export_materials=True,
+                        overwrite_material=True,
+                        export_skeleton=opts['bones'] > 0,
+                        export_animation=opts['actions'] > 0,
+                        export_poses=opts['shapekeys'] > 0,
+                        enable_by_material=bool(opts['by_material']),
+                        allow_shared_geometry=bool(opts['shared_geometry']))
+    total = time.perf_counter() - start
+    phases = {}
+    for name in wrapper.seconds:
+        phases[name] = {'seconds': wrapper.seconds[name],
+                        'calls': wrapper.calls[name]}
+    return total, phases, dedupeStats(wrapper.meshData)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Export benchmark')
+    for key, value in DEFAULTS.items():
+        parser.add_argument('--' + key.replace('_', '-'), dest=key, type=int,
+                            default=value, help='default: %d' % value)
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='export runs, the best time per phase is kept')
+    parser.add_argument('--converter', help='real OgreXMLConverter to use '
+                        'instead of the stand-in')
+    parser.add_argument('--baseline', help='earlier results json')
+    parser.add_argument('--output', help='write results json here')
+    args = parser.parse_args(argv)
+    opts = dict((k, getattr(args, k)) for k in DEFAULTS)
+
+    folder = tempfile.mkdtemp(prefix='ogre_export_bench_')
+    try:
+        converter = args.converter or standInConverter(folder)
+        start = time.perf_counter()
+        buildScene(opts)
+        buildTime = time.perf_counter() - start
+
+        best = None
+        phases = {}
+        for i in range(max(1, args.repeat)):
+            total, runPhases, dedupe = runExport(opts, folder, converter)
+            best = total if best is None else min(best, total)
+            for name, phase in runPhases.items():
+                if name not in phases or \
+                        phase['seconds'] < phases[name]['seconds']:
+                    phases[name] = phase
+        sizes = outputSizes(folder)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    results = {'options': opts,
+               'scene_build_seconds': buildTime,
+               'total_seconds': best,
+               'phases': phases,
+               'dedupe': dedupe,
+               'sizes': sizes}
+
+    baseline = benchutil.loadBaseline(args.baseline)
+    benchutil.checkBaselineOptions(baseline, opts)
+    print('%-26s %10s %6s %10s' % ('phase', 'seconds', 'calls', 'vs base'))
+    for name in PHASES:
+        if name not in phases:
+            continue
+        change = ''
+        if baseline and name in baseline.get('phases', {}):
+            base = baseline['phases'][name]['seconds']
+            if base:
+                change = '%+.1f%%' % ((phases[name]['seconds'] / base - 1.0)
+                                      * 100)
+        print('%-26s %10.4f %6d %10s' % (name, phases[name]['seconds'],
+                                         phases[name]['calls'], change))
+    print('total %.4f s, %d corners -> %d vertices (ratio %.3f)' %
+          (best, dedupe['corners'], dedupe['vertices'], dedupe['ratio']))
+    for name, size in sizes.items():
+        print('%-30s %12d bytes' % (name, size))
+
+    if args.output:
+        benchutil.saveResults(args.output, results)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main(benchutil.scriptArguments())
@@ -0,0 +1,134 @@
+"""
+Import parsing benchmark.
+
+Times the xml collection stages of the importer on a synthetic asset set
+and compares them with a stored baseline. Needs Blender, run it with:
+
+    blender --background --factory-startup \\
+        --python benchmarks/bench_import.py -- --vertices 100000
+
+No baseline is committed since timings depend on the machine. Run once with
+--save-baseline to record the current numbers, later runs compare with them.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutil  # noqa: E402
+benchutil.setupPaths()
+
+import generate_assets  # noqa: E402
+from io_ogre_TL import OgreImport  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(benchutil.HERE, 'baseline_import.json')
+
+
+def countKeyframes(meshData):
+    keys = 0
+    for action in meshData.get('animations', {}).values():
+        for trackData in action.values():
+            keys += max(len(trackData[0]), len(trackData[1]),
+                        len(trackData[2]))
+    return keys
+
+
+def runOnce(timer, assets):
+    folder = os.path.dirname(assets['mesh'])
+    meshData = {}
+
+    xDocMesh = timer.measure('parse mesh xml', 'bytes',
+                             OgreImport.xOpenFile, assets['mesh'])
+    timer.stage('parse mesh xml', 'bytes').count = \
+        os.path.getsize(assets['mesh'])
+
+    if 'skeleton' in assets:
+        xDocSkel = timer.measure('parse skeleton xml', 'bytes',
+                                 OgreImport.xOpenFile, assets['skeleton'])
+        timer.stage('parse skeleton xml', 'bytes').count = \
+            os.path.getsize(assets['skeleton'])
+
+        timer.measure('xCollectBoneData', 'bones',
+                      OgreImport.xCollectBoneData, meshData, xDocSkel)
+        timer.stage('xCollectBoneData', 'bones').count = assets['bones']
+
+        timer.measure('xCollectAnimations', 'keys',
+                      OgreImport.xCollectAnimations, meshData, xDocSkel)
+        timer.stage('xCollectAnimations', 'keys').count = \
+            countKeyframes(meshData)
+
+    timer.measure('xCollectMeshData', 'vertices',
+                  OgreImport.xCollectMeshData, meshData, xDocMesh,
+                  assets['options']['name'], folder, True)
+    timer.stage('xCollectMeshData', 'vertices').count = assets['vertices']
+
+    timer.measure('xCollectMaterialData', 'materials',
+                  OgreImport.xCollectMaterialData, meshData,
+                  [assets['material']], folder)
+    timer.stage('xCollectMaterialData', 'materials').count = \
+        len(meshData.get('materials', {}))
+
+    timer.measure('xCollectPoseData', 'offsets',
+                  OgreImport.xCollectPoseData, meshData, xDocMesh)
+    timer.stage('xCollectPoseData', 'offsets').count = assets['poseoffsets']
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Import parsing benchmark')
+    generate_assets.addArguments(parser)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timing runs, the best one is reported')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='baseline json to compare against')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='slowdown that counts as a regression')
+    parser.add_argument('--output', help='write results json here')
+    parser.add_argument('--keep', action='store_true',
+                        help='keep the generated assets')
+    args = parser.parse_args(argv)
+
+    options = dict((k, getattr(args, k)) for k in generate_assets.DEFAULTS)
+    folder = tempfile.mkdtemp(prefix='ogre_bench_')
+    try:
+        assets = generate_assets.generate(folder, **options)
+        options = assets['options']
+
+        timer = benchutil.StageTimer()
+        for i in range(max(1, args.repeat)):
+            runOnce(timer, assets)
+        timer.traceMemory = True
+        runOnce(timer, assets)
+    finally:
+        if args.keep:
+            print('Assets kept in', folder)
+        else:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    results = {'options': options, 'stages': timer.results()}
+    baseline = None if args.save_baseline else \
+        benchutil.loadBaseline(args.baseline)
+    if baseline is None and not args.save_baseline:
+        print('No baseline at %s, run with --save-baseline to record one' %
+              args.baseline)
+    benchutil.checkBaselineOptions(baseline, options)
+    regressions = timer.printTable(baseline, args.tolerance)
+
+    if args.output:
+        benchutil.saveResults(args.output, results)
+    if args.save_baseline:
+        benchutil.saveResults(args.baseline, results)
+    if regressions:
+        print('Slower than baseline:', ', '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    code = main(benchutil.scriptArguments())
+    if code:
+        sys.exit(code)
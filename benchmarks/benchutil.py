@@ -0,0 +1,130 @@
+"""
+Helpers shared by the benchmark scripts: script argument handling inside
+Blender, per stage timing / peak memory and baseline comparison.
+"""
+
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ADDONS = os.path.join(os.path.dirname(HERE), 'addons')
+
+
+def setupPaths():
+    # make the addon package importable without installing it
+    for path in (HERE, ADDONS):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def scriptArguments():
+    # blender passes script arguments after '--'
+    if '--' in sys.argv:
+        return sys.argv[sys.argv.index('--') + 1:]
+    if 'bpy' in sys.modules:
+        return []
+    return sys.argv[1:]
+
+
+class Stage(object):
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.count = 0
+        self.seconds = None
+        self.peak = None
+
+    def addTime(self, seconds):
+        # keep the best run, it is the least disturbed by the system
+        if self.seconds is None or seconds < self.seconds:
+            self.seconds = seconds
+
+    def throughput(self):
+        if not self.seconds:
+            return 0.0
+        return self.count / self.seconds
+
+    def asDict(self):
+        return {'seconds': self.seconds,
+                'count': self.count,
+                'unit': self.unit,
+                'throughput': self.throughput(),
+                'peak_bytes': self.peak}
+
+
+class StageTimer(object):
+    """Times named stages over several runs.
+
+       Timing runs are done with tracemalloc off. Call run() with
+       traceMemory=True once more to fill in the peak memory of each stage.
+    """
+    def __init__(self):
+        self.stages = []
+        self.byName = {}
+        self.traceMemory = False
+
+    def stage(self, name, unit):
+        if name not in self.byName:
+            self.byName[name] = Stage(name, unit)
+            self.stages.append(self.byName[name])
+        return self.byName[name]
+
+    def measure(self, name, unit, func, *args, **kwargs):
+        stage = self.stage(name, unit)
+        gc.collect()
+        if self.traceMemory:
+            tracemalloc.start()
+            result = func(*args, **kwargs)
+            stage.peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            stage.addTime(time.perf_counter() - start)
+        return result
+
+    def results(self):
+        return dict((s.name, s.asDict()) for s in self.stages)
+
+    def printTable(self, baseline=None, tolerance=0.1):
+        regressions = []
+        print('%-24s %10s %16s %12s %10s' %
+              ('stage', 'seconds', 'throughput', 'peak MiB', 'vs base'))
+        for s in self.stages:
+            peak = '%.1f' % (s.peak / 1048576.0) if s.peak else '-'
+            change = ''
+            if baseline and s.name in baseline.get('stages', {}):
+                base = baseline['stages'][s.name]['seconds']
+                if base and s.seconds:
+                    ratio = s.seconds / base - 1.0
+                    change = '%+.1f%%' % (ratio * 100)
+                    if ratio > tolerance:
+                        change += ' !'
+                        regressions.append(s.name)
+            print('%-24s %10.4f %11.0f %s/s %12s %10s' %
+                  (s.name, s.seconds or 0.0, s.throughput(), s.unit[:3],
+                   peak, change))
+        return regressions
+
+
+def loadBaseline(path):
+    if path and os.path.isfile(path):
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+
+def saveResults(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('Results written to', path)
+
+
+def checkBaselineOptions(baseline, options):
+    if baseline and baseline.get('options') != options:
+        print('WARNING: baseline was recorded with different options:',
+              baseline.get('options'))
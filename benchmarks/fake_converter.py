@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Stand-in for OgreXMLConverter used by the export benchmark.
+
+Accepts the same command line as the real converter and copies every
+'name.xml' argument to 'name', so the exporter's conversion step succeeds
+without Ogre tools installed and without adding converter time to the
+measurements.
+"""
+
+import shutil
+import sys
+
+
+def main(argv):
+    for arg in argv:
+        if arg.lower().endswith('.xml'):
+            shutil.copyfile(arg, arg[:-4])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Synthetic Ogre asset generator.
+
+Writes a .mesh.xml, .skeleton.xml and .material set of configurable size so
+import and export can be measured reproducibly. Only the python standard
+library is used, so this runs outside of Blender as well:
+
+    python3 generate_assets.py --out /tmp/bench --vertices 200000 --bones 60
+
+The files are written in the same indented layout the OgreXMLConverter
+produces. The importer relies on that (e.g. the rotation axis is read as the
+second child node of a bone rotation), so keep it that way.
+"""
+
+import argparse
+import math
+import os
+import random
+
+INDENT = "    "
+
+DEFAULTS = {
+    'name': 'bench',
+    'vertices': 20000,
+    'submeshes': 4,
+    'uvsets': 1,
+    'bones': 32,
+    'poses': 4,
+    'animations': 4,
+    'keyframes': 60,
+    'fps': 30,
+    'seed': 1234,
+}
+
+
+def fmt(number):
+    return '%.6f' % number
+
+
+def gridSize(vertexCount):
+    # nearest w x h grid holding at least vertexCount vertices
+    w = max(2, int(math.ceil(math.sqrt(vertexCount))))
+    h = max(2, int(math.ceil(vertexCount / float(w))))
+    return w, h
+
+
+def writeGeometry(f, depth, w, h, offset, uvsets, rnd):
+    pad = INDENT * depth
+    f.write('%s<geometry vertexcount="%d">\n' % (pad, w * h))
+    attrs = 'positions="true" normals="true"'
+    if uvsets > 0:
+        attrs += ' texture_coord_dimensions_0="2" texture_coords="%d"' % uvsets
+    f.write('%s%s<vertexbuffer %s>\n' % (pad, INDENT, attrs))
+    vpad = pad + INDENT * 2
+    for j in range(h):
+        for i in range(w):
+            x = offset + i / float(w - 1)
+            z = j / float(h - 1)
+            y = 0.05 * math.sin(x * 7.0) * math.cos(z * 5.0)
+            f.write('%s<vertex>\n' % vpad)
+            f.write('%s%s<position x="%s" y="%s" z="%s" />\n' %
+                    (vpad, INDENT, fmt(x), fmt(y), fmt(z)))
+            nx, ny, nz = rnd.uniform(-0.1, 0.1), 1.0, rnd.uniform(-0.1, 0.1)
+            length = math.sqrt(nx * nx + ny * ny + nz * nz)
+            f.write('%s%s<normal x="%s" y="%s" z="%s" />\n' %
+                    (vpad, INDENT, fmt(nx / length), fmt(ny / length),
+                     fmt(nz / length)))
+            for s in range(uvsets):
+                u = i / float(w - 1)
+                v = j / float(h - 1)
+                f.write('%s%s<texcoord u="%s" v="%s" />\n' %
+                        (vpad, INDENT, fmt(u + s * 0.01), fmt(v)))
+            f.write('%s</vertex>\n' % vpad)
+    f.write('%s%s</vertexbuffer>\n' % (pad, INDENT))
+    f.write('%s</geometry>\n' % pad)
+
+
+def writeFaces(f, depth, w, h):
+    pad = INDENT * depth
+    count = (w - 1) * (h - 1) * 2
+    f.write('%s<faces count="%d">\n' % (pad, count))
+    fpad = pad + INDENT
+    for j in range(h - 1):
+        for i in range(w - 1):
+            a = j * w + i
+            b = a + 1
+            c = a + w
+            d = c + 1
+            f.write('%s<face v1="%d" v2="%d" v3="%d" />\n' % (fpad, a, c, b))
+            f.write('%s<face v1="%d" v2="%d" v3="%d" />\n' % (fpad, b, c, d))
+    f.write('%s</faces>\n' % pad)
+
+
+def writeBoneAssignments(f, depth, vertexCount, bones, rnd):
+    pad = INDENT * depth
+    f.write('%s<boneassignments>\n' % pad)
+    bpad = pad + INDENT
+    for v in range(vertexCount):
+        first = rnd.randrange(bones)
+        second = (first + 1) % bones
+        weight = rnd.uniform(0.5, 1.0)
+        f.write('%s<vertexboneassignment vertexindex="%d" boneindex="%d" '
+                'weight="%s" />\n' % (bpad, v, first, fmt(weight)))
+        if bones > 1:
+            f.write('%s<vertexboneassignment vertexindex="%d" boneindex="%d" '
+                    'weight="%s" />\n' % (bpad, v, second, fmt(1.0 - weight)))
+    f.write('%s</boneassignments>\n' % pad)
+
+
+def writeMesh(path, opts, rnd):
+    submeshes = max(1, opts['submeshes'])
+    w, h = gridSize(max(4, opts['vertices'] // submeshes))
+    stats = {'vertices': 0, 'faces': 0, 'poseoffsets': 0}
+
+    with open(path, 'w') as f:
+        f.write('<mesh>\n')
+        f.write('%s<submeshes>\n' % INDENT)
+        for s in range(submeshes):
+            f.write('%s<submesh material="%s" usesharedvertices="false" '
+                    'use32bitindexes="%s" operationtype="triangle_list">\n' %
+                    (INDENT * 2, materialName(opts, s),
+                     'true' if w * h > 65535 else 'false'))
+            writeFaces(f, 3, w, h)
+            writeGeometry(f, 3, w, h, s * 1.1, opts['uvsets'], rnd)
+            if opts['bones'] > 0:
+                writeBoneAssignments(f, 3, w * h, opts['bones'], rnd)
+            f.write('%s</submesh>\n' % (INDENT * 2))
+            stats['vertices'] += w * h
+            stats['faces'] += (w - 1) * (h - 1) * 2
+        f.write('%s</submeshes>\n' % INDENT)
+
+        if opts['bones'] > 0:
+            f.write('%s<skeletonlink name="%s.skeleton" />\n' %
+                    (INDENT, opts['name']))
+
+        if opts['poses'] > 0:
+            f.write('%s<poses>\n' % INDENT)
+            for p in range(opts['poses']):
+                f.write('%s<pose target="submesh" index="%d" name="Pose%d">\n'
+                        % (INDENT * 2, p % submeshes, p))
+                # move a quarter of the vertices of the target submesh
+                for v in range(0, w * h, 4):
+                    f.write('%s<poseoffset index="%d" x="%s" y="%s" z="%s" />\n'
+                            % (INDENT * 3, v, fmt(rnd.uniform(-0.1, 0.1)),
+                               fmt(rnd.uniform(-0.1, 0.1)),
+                               fmt(rnd.uniform(-0.1, 0.1))))
+                    stats['poseoffsets'] += 1
+                f.write('%s</pose>\n' % (INDENT * 2))
+            f.write('%s</poses>\n' % INDENT)
+        f.write('</mesh>\n')
+    return stats
+
+
+def writeRotation(f, pad, angle, axis):
+    f.write('%s<rotate angle="%s">\n' % (pad, fmt(angle)))
+    f.write('%s%s<axis x="%s" y="%s" z="%s" />\n' %
+            (pad, INDENT, fmt(axis[0]), fmt(axis[1]), fmt(axis[2])))
+    f.write('%s</rotate>\n' % pad)
+
+
+def writeSkeleton(path, opts, rnd):
+    bones = opts['bones']
+    fps = float(opts['fps'])
+    stats = {'bones': bones, 'animations': opts['animations'], 'keyframes': 0}
+
+    with open(path, 'w') as f:
+        f.write('<skeleton>\n')
+        f.write('%s<bones>\n' % INDENT)
+        for b in range(bones):
+            pad = INDENT * 2
+            f.write('%s<bone id="%d" name="Bone%d">\n' % (pad, b, b))
+            f.write('%s%s<position x="%s" y="%s" z="%s" />\n' %
+                    (pad, INDENT, fmt(0.1 + rnd.uniform(0.0, 0.1)),
+                     fmt(0.0), fmt(0.0)))
+            f.write('%s%s<rotation angle="%s">\n' %
+                    (pad, INDENT, fmt(rnd.uniform(0.0, 0.5))))
+            f.write('%s%s%s<axis x="0" y="0" z="1" />\n' %
+                    (pad, INDENT, INDENT))
+            f.write('%s%s</rotation>\n' % (pad, INDENT))
+            f.write('%s</bone>\n' % pad)
+        f.write('%s</bones>\n' % INDENT)
+
+        # binary tree so there are bones with zero, one and two children
+        f.write('%s<bonehierarchy>\n' % INDENT)
+        for b in range(1, bones):
+            f.write('%s<boneparent bone="Bone%d" parent="Bone%d" />\n' %
+                    (INDENT * 2, b, (b - 1) // 2))
+        f.write('%s</bonehierarchy>\n' % INDENT)
+
+        if opts['animations'] > 0 and bones > 0:
+            keys = max(2, opts['keyframes'])
+            f.write('%s<animations>\n' % INDENT)
+            for a in range(opts['animations']):
+                f.write('%s<animation name="Anim%d" length="%s">\n' %
+                        (INDENT * 2, a, fmt((keys - 1) / fps)))
+                f.write('%s<tracks>\n' % (INDENT * 3))
+                for b in range(bones):
+                    f.write('%s<track bone="Bone%d">\n' % (INDENT * 4, b))
+                    f.write('%s<keyframes>\n' % (INDENT * 5))
+                    phase = rnd.uniform(0.0, math.pi)
+                    for k in range(keys):
+                        pad = INDENT * 6
+                        t = k / fps
+                        f.write('%s<keyframe time="%s">\n' % (pad, fmt(t)))
+                        kpad = pad + INDENT
+                        f.write('%s<translate x="%s" y="%s" z="%s" />\n' %
+                                (kpad, fmt(0.01 * math.sin(t + phase)),
+                                 fmt(0.0), fmt(0.0)))
+                        writeRotation(f, kpad, 0.3 * math.sin(t * 2 + phase),
+                                      (0.0, 0.0, 1.0))
+                        f.write('%s<scale x="1" y="1" z="1" />\n' % kpad)
+                        f.write('%s</keyframe>\n' % pad)
+                        stats['keyframes'] += 1
+                    f.write('%s</keyframes>\n' % (INDENT * 5))
+                    f.write('%s</track>\n' % (INDENT * 4))
+                f.write('%s</tracks>\n' % (INDENT * 3))
+                f.write('%s</animation>\n' % (INDENT * 2))
+            f.write('%s</animations>\n' % INDENT)
+        f.write('</skeleton>\n')
+    return stats
+
+
+def materialName(opts, index):
+    return '%s/Material%d' % (opts['name'], index)
+
+
+def writeMaterial(path, opts, folder):
+    stats = {'materials': opts['submeshes']}
+    with open(path, 'w') as f:
+        for s in range(opts['submeshes']):
+            texture = '%s_%d.dds' % (opts['name'], s)
+            f.write('material %s\n{\n' % materialName(opts, s))
+            f.write('%stechnique\n%s{\n' % (INDENT, INDENT))
+            f.write('%spass\n%s{\n' % (INDENT * 2, INDENT * 2))
+            f.write('%sambient 0.5 0.5 0.5\n' % (INDENT * 3))
+            f.write('%sdiffuse 1.0 1.0 1.0\n' % (INDENT * 3))
+            f.write('%sspecular 0.1 0.1 0.1 0\n' % (INDENT * 3))
+            f.write('%semissive 0.0 0.0 0.0\n' % (INDENT * 3))
+            f.write('%stexture_unit\n%s{\n' % (INDENT * 3, INDENT * 3))
+            f.write('%stexture %s\n' % (INDENT * 4, texture))
+            f.write('%s}\n' % (INDENT * 3))
+            f.write('%s}\n%s}\n}\n' % (INDENT * 2, INDENT))
+            # empty placeholder so texture lookups take the 'found' path
+            texturePath = os.path.join(folder, texture)
+            if not os.path.isfile(texturePath):
+                open(texturePath, 'wb').close()
+    return stats
+
+
+def generate(folder, **options):
+    """Write a synthetic asset set into folder.
+
+       @return dict with the written paths and element counts.
+    """
+    opts = dict(DEFAULTS)
+    opts.update((k, v) for k, v in options.items() if v is not None)
+    rnd = random.Random(opts['seed'])
+
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    result = {'options': opts}
+    result['mesh'] = os.path.join(folder, opts['name'] + '.mesh.xml')
+    result['material'] = os.path.join(folder, opts['name'] + '.material')
+    result.update(writeMesh(result['mesh'], opts, rnd))
+    result.update(writeMaterial(result['material'], opts, folder))
+    if opts['bones'] > 0:
+        result['skeleton'] = os.path.join(folder,
+                                          opts['name'] + '.skeleton.xml')
+        result.update(writeSkeleton(result['skeleton'], opts, rnd))
+    return result
+
+
+def addArguments(parser):
+    parser.add_argument('--name', help='base name of the generated files')
+    for key in ('vertices', 'submeshes', 'uvsets', 'bones', 'poses',
+                'animations', 'keyframes', 'fps', 'seed'):
+        parser.add_argument('--' + key, type=int,
+                            help='default: %d' % DEFAULTS[key])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--out', required=True, help='output folder')
+    addArguments(parser)
+    args = vars(parser.parse_args(argv))
+    folder = args.pop('out')
+    result = generate(folder, **args)
+    for key in ('mesh', 'skeleton', 'material'):
+        if key in result:
+            print(key, result[key], os.path.getsize(result[key]), 'bytes')
+
+
+if __name__ == '__main__':
+    main()
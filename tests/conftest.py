@@ -0,0 +1,21 @@
+"""
+Test setup for the add on modules that run without Blender.
+
+The package __init__ registers Blender operators and needs bpy, so the
+package is put into sys.modules without running it. Modules that only need
+numpy (snapshot, keyreduce, dedupe, precision, ...) then import as usual:
+
+    from io_ogre_TL import keyreduce
+"""
+
+import os
+import sys
+import types
+
+ADDON = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), 'addons', 'io_ogre_TL')
+
+if 'io_ogre_TL' not in sys.modules:
+    package = types.ModuleType('io_ogre_TL')
+    package.__path__ = [ADDON]
+    sys.modules['io_ogre_TL'] = package
@@ -0,0 +1,103 @@
+import numpy
+
+from io_ogre_TL import dedupe
+
+
+def cornerRows(positions, uvs):
+    rows = numpy.zeros((len(positions), dedupe.TANGENT_SIGN), numpy.float32)
+    rows[:, dedupe.POSITION] = positions
+    rows[:, dedupe.NORMAL] = (0.0, 0.0, 1.0)
+    rows[:, dedupe.UV] = uvs
+    rows[:, dedupe.COLOUR] = 1.0
+    return rows
+
+
+# a quad of two triangles, 0-1-2 and 2-1-3, the corners of the shared edge
+# are the same vertices
+QUAD = cornerRows([(0, 0, 0), (1, 0, 0), (0, 1, 0),
+                   (0, 1, 0), (1, 0, 0), (1, 1, 0)],
+                  [(0, 0), (1, 0), (0, 1),
+                   (0, 1), (1, 0), (1, 1)])
+
+
+def test_unique_rows():
+    rows = numpy.array([[1, 2], [3, 4], [1, 2]], numpy.float32)
+    first, inverse = dedupe.uniqueRows(rows)
+    assert sorted(first.tolist()) == [0, 1]
+    assert rows[first[inverse]].tolist() == rows.tolist()
+    first, inverse = dedupe.uniqueRows(numpy.zeros((0, 2), numpy.float32))
+    assert len(first) == len(inverse) == 0
+
+
+def test_quad_shares_the_edge_vertices():
+    [(vertexCorners, triangles)] = dedupe.buildSubmeshes(
+        QUAD, numpy.zeros(6, numpy.int32), 1)
+    assert vertexCorners.tolist() == [0, 1, 2, 5]
+    assert triangles.tolist() == [[0, 1, 2], [2, 1, 3]]
+
+
+def test_different_uvs_split_a_vertex():
+    rows = QUAD.copy()
+    rows[3, dedupe.UV] = (0.5, 0.5)
+    [(vertexCorners, triangles)] = dedupe.buildSubmeshes(
+        rows, numpy.zeros(6, numpy.int32), 1)
+    assert vertexCorners.tolist() == [0, 1, 2, 3, 5]
+    assert triangles.tolist() == [[0, 1, 2], [3, 1, 4]]
+
+
+def test_negative_zero_is_zero():
+    rows = QUAD.copy()
+    rows[3, dedupe.NORMAL] = (-0.0, -0.0, 1.0)
+    [(vertexCorners, triangles)] = dedupe.buildSubmeshes(
+        rows, numpy.zeros(6, numpy.int32), 1)
+    assert len(vertexCorners) == 4
+
+
+def test_submeshes_do_not_share_vertices():
+    cornerSubmesh = numpy.array([0, 0, 0, 1, 1, 1], numpy.int32)
+    result = dedupe.buildSubmeshes(QUAD, cornerSubmesh, 2)
+    assert result[0][0].tolist() == [0, 1, 2]
+    assert result[0][1].tolist() == [[0, 1, 2]]
+    assert result[1][0].tolist() == [3, 4, 5]
+    assert result[1][1].tolist() == [[0, 1, 2]]
+
+
+def test_shared_buffer_splits_like_submeshes():
+    cornerSubmesh = numpy.array([0, 0, 0, 1, 1, 1], numpy.int32)
+    vertexCorners, triangles = dedupe.buildShared(QUAD, cornerSubmesh, 2)
+    assert vertexCorners.tolist() == [0, 1, 2, 5]
+    assert [t.tolist() for t in triangles] == [[[0, 1, 2]], [[2, 1, 3]]]
+
+    separate = dedupe.buildSubmeshes(QUAD, cornerSubmesh, 2)
+    for shared, (corners, expected) in zip(triangles, separate):
+        vertices, local = dedupe.splitShared(shared)
+        assert QUAD[vertexCorners[vertices]].tolist() == \
+            QUAD[corners].tolist()
+        assert local.tolist() == expected.tolist()
+
+
+def test_split_empty_submesh():
+    vertices, triangles = dedupe.splitShared(numpy.zeros((0, 3), numpy.intp))
+    assert len(vertices) == 0 and triangles.shape == (0, 3)
+
+
+def test_different_weights_split_a_vertex():
+    # corners 2 and 3 come from two blender vertices at the same spot,
+    # skinned to different bones
+    bones = numpy.array([[0, 0], [0, 0], [1, 0],
+                         [2, 0], [0, 0], [0, 0]], numpy.int32)
+    weights = numpy.array([[1, 0], [1, 0], [1, 0],
+                           [1, 0], [1, 0], [1, 0]], numpy.float32)
+    rows = dedupe.skinnedRows(QUAD, bones, weights)
+    assert rows.dtype == numpy.float32
+    assert rows.shape == (6, dedupe.TANGENT_SIGN + 4)
+    [(vertexCorners, triangles)] = dedupe.buildSubmeshes(
+        rows, numpy.zeros(6, numpy.int32), 1)
+    assert vertexCorners.tolist() == [0, 1, 2, 3, 5]
+
+    # the same influences still share the vertex
+    bones[3] = bones[2]
+    rows = dedupe.skinnedRows(QUAD, bones, weights)
+    [(vertexCorners, triangles)] = dedupe.buildSubmeshes(
+        rows, numpy.zeros(6, numpy.int32), 1)
+    assert vertexCorners.tolist() == [0, 1, 2, 5]
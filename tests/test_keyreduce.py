@@ -0,0 +1,135 @@
+import math
+
+import numpy
+
+from io_ogre_TL import keyreduce
+
+
+def rotationZ(angle):
+    """(w, x, y, z) quaternion of a rotation around z."""
+    return [math.cos(angle / 2), 0.0, 0.0, math.sin(angle / 2)]
+
+
+def test_short_tracks_keep_everything():
+    assert keyreduce.reduceLinear([], numpy.zeros((0, 3)), 1e-4).tolist() == []
+    assert keyreduce.reduceLinear([0.0], [[1.0, 2.0, 3.0]],
+                                  1e-4).tolist() == [0]
+    assert keyreduce.reduceLinear([0.0, 1.0], [[0.0] * 3, [0.0] * 3],
+                                  1e-4).tolist() == [0, 1]
+
+
+def test_straight_line_keeps_the_endpoints():
+    times = numpy.arange(11.0)
+    values = numpy.outer(times, [1.0, -2.0, 0.5])
+    assert keyreduce.reduceLinear(times, values, 1e-6).tolist() == [0, 10]
+
+
+def test_constant_track_keeps_the_endpoints():
+    times = numpy.arange(8.0)
+    values = numpy.tile([1.0, 1.0, 1.0], (8, 1))
+    assert keyreduce.reduceLinear(times, values, 0.0).tolist() == [0, 7]
+
+
+def test_uneven_times_are_interpolated_by_time():
+    times = numpy.array([0.0, 0.1, 0.5, 2.0])
+    values = numpy.outer(times, [3.0, 0.0, 0.0])
+    assert keyreduce.reduceLinear(times, values, 1e-6).tolist() == [0, 3]
+
+
+def test_step_keeps_the_keys_around_the_step():
+    times = numpy.arange(10.0)
+    values = numpy.zeros((10, 3))
+    values[5:, 0] = 1.0
+    keep = keyreduce.reduceLinear(times, values, 1e-4)
+    assert keep.tolist() == [0, 4, 5, 9]
+    # the kept keys reproduce every key
+    rebuilt = keyreduce.resampleLinear(times[keep], values[keep], times)
+    assert numpy.allclose(rebuilt, values)
+
+
+def test_interior_keys_within_tolerance_are_dropped():
+    times = numpy.arange(5.0)
+    values = numpy.zeros((5, 3))
+    values[2, 1] = 0.001
+    assert keyreduce.reduceLinear(times, values, 0.002).tolist() == [0, 4]
+    assert keyreduce.reduceLinear(times, values, 0.0005).tolist() == [0, 2, 4]
+
+
+def test_slerp_track_keeps_the_endpoints():
+    times = numpy.arange(9.0)
+    rotations = [rotationZ(angle) for angle in numpy.linspace(0.0, 2.0, 9)]
+    assert keyreduce.reduceRotation(times, rotations,
+                                    1e-6).tolist() == [0, 8]
+
+
+def test_sign_flipped_quaternions_are_no_error():
+    times = numpy.arange(9.0)
+    rotations = numpy.array([rotationZ(angle) for angle in
+                             numpy.linspace(0.0, 2.0, 9)])
+    rotations[1::2] *= -1.0
+    assert keyreduce.reduceRotation(times, rotations,
+                                    1e-6).tolist() == [0, 8]
+    # the last key flipped as well
+    rotations[-1] *= -1.0
+    assert keyreduce.reduceRotation(times, rotations,
+                                    1e-6).tolist() == [0, 8]
+
+
+def test_angle_tolerance_is_the_rotation_angle():
+    times = numpy.arange(3.0)
+    # the middle key is 0.01 radians off the slerp
+    rotations = [rotationZ(0.0), rotationZ(0.51), rotationZ(1.0)]
+    error = keyreduce.slerpError(numpy.array(rotations[0]),
+                                 numpy.array(rotations[2]),
+                                 numpy.array([0.5]),
+                                 numpy.array([rotations[1]]))
+    assert numpy.allclose(error, [0.01])
+    assert keyreduce.reduceRotation(times, rotations,
+                                    0.011).tolist() == [0, 2]
+    assert keyreduce.reduceRotation(times, rotations,
+                                    0.009).tolist() == [0, 1, 2]
+
+
+def test_track_keeps_the_keys_of_every_channel():
+    times = numpy.arange(9.0)
+    translations = numpy.zeros((9, 3))
+    translations[3:, 0] = 1.0
+    rotations = numpy.array([rotationZ(0.0)] * 9)
+    rotations[6:] = rotationZ(0.5)
+    scales = numpy.ones((9, 3))
+    keep = keyreduce.reduceTrack(times, translations, rotations, scales,
+                                 1e-4, 1e-3)
+    assert keep.tolist() == [0, 2, 3, 5, 6, 8]
+    keep = keyreduce.reduceTrack(times, None, rotations, None, 1e-4, 1e-3)
+    assert keep.tolist() == [0, 5, 6, 8]
+    keep = keyreduce.reduceTrack(times, None, None, None, 1e-4, 1e-3)
+    assert keep.tolist() == list(range(9))
+
+
+def test_imported_tracks_are_resampled_to_whole_frames():
+    trackData = [[[0.0, (0.0, 0.0, 0.0)], [1.5, (3.0, 0.0, 0.0)],
+                  [3.0, (6.0, 0.0, 0.0)]],
+                 [[0.0, tuple(rotationZ(0.0))], [2.0, tuple(rotationZ(1.0))]],
+                 []]
+    keyreduce.resampleTrackData(trackData)
+    assert [key[0] for key in trackData[0]] == [0, 1, 2, 3]
+    assert numpy.allclose([key[1] for key in trackData[0]],
+                          [[0, 0, 0], [2, 0, 0], [4, 0, 0], [6, 0, 0]])
+    assert [key[0] for key in trackData[1]] == [0, 1, 2]
+    assert numpy.allclose(trackData[1][1][1], rotationZ(0.5))
+    assert isinstance(trackData[1][1][1], tuple)
+    assert trackData[2] == []
+
+
+def test_imported_channels_are_reduced_on_their_own():
+    line = [[float(frame), (frame * 2.0, 0.0, 0.0)] for frame in range(5)]
+    rotations = [[float(frame), tuple(rotationZ(0.0 if frame < 3 else 0.5))]
+                 for frame in range(5)]
+    # a flipped sign is the same rotation
+    rotations[1][1] = tuple(-v for v in rotations[1][1])
+    scales = [[0.0, (1.0, 1.0, 1.0)], [4.0, (2.0, 2.0, 2.0)]]
+    trackData = [line, rotations, scales]
+    keyreduce.reduceTrackData(trackData, 1e-4, 1e-3)
+    assert [key[0] for key in trackData[0]] == [0.0, 4.0]
+    assert [key[0] for key in trackData[1]] == [0.0, 2.0, 3.0, 4.0]
+    assert trackData[2] == scales
@@ -0,0 +1,39 @@
+from io_ogre_TL import precision
+from io_ogre_TL.precision import Precision, formatArray
+
+
+def test_shortest_fixed_point_text():
+    assert formatArray([1.0, 0.5, 0.25, 100.0], 6) == \
+        ['1', '0.5', '0.25', '100']
+    assert formatArray([0.1234567891], 7) == ['0.1234568']
+    assert formatArray([2.5], 0) == ['2']
+
+
+def test_no_exponents():
+    assert formatArray([1e-5, -2e-6, 1e-9, 123456789.0], 7) == \
+        ['0.00001', '-0.000002', '0', '123456789']
+
+
+def test_no_negative_zero():
+    assert formatArray([-0.0, -1e-9, -0.00000049], 6) == ['0', '0', '0']
+
+
+def test_rows():
+    assert formatArray([[1.0, -0.5], [0.0, 2.0]], 3) == \
+        [['1', '-0.5'], ['0', '2']]
+    assert formatArray([], 3) == []
+
+
+def test_default_keeps_the_earlier_decimals():
+    assert precision.DEFAULT_PROFILE == 'STANDARD'
+    numbers = Precision()
+    assert numbers.format('vertices', [0.12345678]) == ['0.1234568']
+    assert numbers.format('normals', [0.12345678]) == ['0.1234568']
+    assert numbers.format('positions', [0.12345678]) == ['0.123457']
+    assert numbers.format('times', [0.12345678]) == ['0.123457']
+
+
+def test_every_profile_is_complete():
+    kinds = set(precision.PROFILES['HIGH'])
+    for name, title, description in precision.PROFILE_ITEMS:
+        assert set(precision.PROFILES[name]) == kinds
@@ -0,0 +1,135 @@
+import array
+import json
+import os
+import struct
+import sys
+
+import pytest
+
+from io_ogre_TL import snapshot
+
+
+def meshData():
+    return {
+        'skeletonName': 'rig',
+        'materials': {'Body': {'diffuse': [1.0, 0.5, 0.25]}},
+        'animationStats': {'walk': [['hip', 3, 1.0]]},
+        'sampleRate': 30.0,
+        'submeshes': [{
+            'material': 'Body',
+            'materialOrg': 'Body',
+            'faces': [[0, 1, 2]],
+            'geometry': {
+                'positions': [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0],
+                              [0.0, 1.0, 0.1]],
+                'normals': [[0.0, 0.0, 1.0]] * 3,
+                'texcoordsets': 1,
+                'uvsets': [[[0.0, 0.0]], [[1.0, 0.0]], [[0.0, 1.0]]],
+                'boneassignments': {'hip': [[0, 1.0], [2, 0.5]]},
+            },
+        }],
+        'animations': {'walk': {'hip': [
+            [[0.0, (0.0, 0.0, 0.0)], [1.0, (0.0, 1.0, 0.0)]],
+            [[0.0, (1.0, 0.0, 0.0, 0.0)]],
+            [],
+        ]}},
+        'poses': [{'name': 'smile', 'submesh': 0,
+                   'data': [(1, 0.0, 0.5, 0.0)]}],
+    }
+
+
+def float32(value):
+    return array.array('f', [value])[0]
+
+
+def readHeader(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, size = snapshot.PREFIX.unpack_from(data)
+    header = json.loads(data[snapshot.PREFIX.size:
+                             snapshot.PREFIX.size + size].decode('utf-8'))
+    return data, version, header
+
+
+@pytest.fixture
+def paths(tmpdir):
+    source = tmpdir.join('body.skeleton')
+    source.write('skeleton')
+    return str(tmpdir.join('cache', 'a' + snapshot.EXTENSION)), str(source)
+
+
+def test_round_trip(paths):
+    path, source = paths
+    snapshot.write(path, meshData(), [source], {'fps': 30})
+
+    result, extra = snapshot.read(path)
+    assert extra == {'fps': 30}
+    for key in ('skeletonName', 'materials', 'animationStats', 'sampleRate'):
+        assert result[key] == meshData()[key]
+    subMesh = result['submeshes'][0]
+    assert subMesh['faces'] == [[0, 1, 2]]
+    geometry = subMesh['geometry']
+    assert geometry['positions'][2] == [0.0, 1.0, float32(0.1)]
+    assert geometry['uvsets'] == [[[0.0, 0.0]], [[1.0, 0.0]], [[0.0, 1.0]]]
+    assert geometry['boneassignments'] == {'hip': [[0, 1.0], [2, 0.5]]}
+    assert result['animations']['walk']['hip'][0] == \
+        [[0.0, (0.0, 0.0, 0.0)], [1.0, (0.0, 1.0, 0.0)]]
+    assert result['animations']['walk']['hip'][2] == []
+    assert result['poses'] == [{'name': 'smile', 'submesh': 0,
+                                'data': [(1, 0.0, 0.5, 0.0)]}]
+
+
+def test_header_and_arrays(paths):
+    path, source = paths
+    snapshot.write(path, meshData(), [source])
+
+    data, version, header = readHeader(path)
+    assert data[:8] == snapshot.MAGIC
+    assert version == snapshot.VERSION
+    assert header['byteorder'] == sys.byteorder
+    assert header['dependencies'][0][0] == source
+    previousEnd = 0
+    for typecode, offset, length in header['arrays']:
+        assert typecode in ('f', 'I')
+        assert offset % snapshot.ALIGN == 0
+        assert offset >= previousEnd
+        previousEnd = offset + length * array.array(typecode).itemsize
+    assert previousEnd <= len(data)
+
+    # positions are float32, in file order
+    ref = header['meshData']['submeshes'][0]['geometry']['positions']
+    typecode, offset, length = header['arrays'][ref['array']]
+    assert (typecode, length) == ('f', 9)
+    values = struct.unpack_from('=9f', data, offset)
+    assert values[6:] == (0.0, 1.0, float32(0.1))
+
+
+def test_other_version_is_ignored(paths, monkeypatch):
+    path, source = paths
+    snapshot.write(path, meshData(), [source])
+    monkeypatch.setattr(snapshot, 'VERSION', snapshot.VERSION + 1)
+    assert snapshot.read(path) is None
+
+
+def test_changed_dependencies(paths, tmpdir):
+    path, source = paths
+    missing = str(tmpdir.join('body.material'))
+    snapshot.write(path, meshData(), [source, missing],
+                   listings=[(str(tmpdir), '.material')])
+    assert snapshot.read(path) is not None
+
+    tmpdir.join('other.material').write('material')
+    assert snapshot.read(path) is None
+    os.remove(str(tmpdir.join('other.material')))
+    assert snapshot.read(path) is not None
+
+    tmpdir.join('body.material').write('material')
+    assert snapshot.read(path) is None
+
+
+def test_broken_file(paths):
+    path, source = paths
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(b'OGRESNAP')
+    assert snapshot.read(path) is None